@@ -1,7 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
+from sqlalchemy.exc import SQLAlchemyError
+import logging
+import os
 import psycopg
-from routers import portfolio, accounts
+from models import SessionLocal, engine, async_engine, history_sequence, pool_status
+from routers import portfolio, accounts, validation, transactions
+from services.locking import write_conflicts
+from .metrics import CONTENT_TYPE, MetricsMiddleware, instrument_engine, registry
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Portfolio Management API",
@@ -18,9 +27,58 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+app.add_middleware(MetricsMiddleware, server_timing=os.getenv("SERVER_TIMING", "false").lower() == "true")
+instrument_engine(engine)
+instrument_engine(async_engine)
+
+registry.callback("portfolio_write_attempts_total", "Portfolio write attempts, retries included.", "counter",
+                  lambda: write_conflicts.stats()["attempts"])
+registry.callback("portfolio_write_conflicts_total", "Portfolio write attempts lost to a concurrent writer.", "counter",
+                  lambda: write_conflicts.stats()["conflicts"])
+registry.callback("portfolio_write_retries_exhausted_total", "Portfolio writes that ran out of conflict retries.",
+                  "counter", lambda: write_conflicts.stats()["retries_exhausted"])
+
+POOLS = (("sync", engine), ("async", async_engine))
+
+def pool_reader(value):
+    """Callback reading one figure from each application engine's pool_status, labelled by engine"""
+    def read():
+        statuses = ((name, pool_status(pool_engine)) for name, pool_engine in POOLS)
+        # Only queue pools report occupancy; an in-memory SQLite engine has none
+        return {(name,): value(status) for name, status in statuses if "checked_out" in status}
+    return read
+
+registry.callback("db_pool_checked_out_connections", "Connections checked out of the pool.", "gauge",
+                  pool_reader(lambda status: status["checked_out"]), ("engine",))
+registry.callback("db_pool_overflow_connections", "Connections open beyond the pool size.", "gauge",
+                  pool_reader(lambda status: max(status["overflow"], 0)), ("engine",))
+registry.callback("db_pool_checkout_timeouts_total", "Checkouts that timed out waiting for a pooled connection.",
+                  "counter", pool_reader(lambda status: status.get("checkout_timeouts", 0)), ("engine",))
+
 app.include_router(portfolio.router)
 app.include_router(accounts.router)
+app.include_router(validation.router)
+app.include_router(transactions.router)
+
+@app.on_event("startup")
+def reconcile_history_sequence():
+    db = SessionLocal()
+    try:
+        history_sequence.reconcile(db)
+    except SQLAlchemyError as e:
+        # Leave it to the first audit write to reconcile once the schema exists
+        logger.warning("History sequence reconciliation skipped: %s", e)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_engine.dispose()
 
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
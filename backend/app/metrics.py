@@ -0,0 +1,278 @@
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED_ROUTE = "<unmatched>"
+INF_BUCKET = 'le="+Inf"'
+
+
+class RequestStats:
+    """Database work done while serving one request"""
+    
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """Stats of the request being served, or None outside a request"""
+    return _request_stats.get()
+
+
+class _Metric:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        
+    def _label_text(self, values: Tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple, float] = {}
+        
+    def inc(self, amount: float = 1.0, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+            
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0.0)
+            
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+    
+    def dec(self, amount: float = 1.0, *label_values):
+        self.inc(-amount, *label_values)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List] = {}
+        
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+            
+    def count(self, *label_values) -> int:
+        with self._lock:
+            series = self._series.get(label_values)
+            return series[1] if series else 0
+            
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, value_sum) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    bucket = 'le="' + _number(bound) + '"'
+                    lines.append(f"{self.name}_bucket{self._label_text(key, bucket)} {cumulative}")
+                lines.append(f"{self.name}_bucket{self._label_text(key, INF_BUCKET)} {total}")
+                lines.append(f"{self.name}_sum{self._label_text(key)} {_number(value_sum)}")
+                lines.append(f"{self.name}_count{self._label_text(key)} {total}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """A counter or gauge read from ``read`` at scrape time, for values another component already tracks.
+    
+    With ``labels``, ``read`` returns a dict of values keyed by label value tuples.
+    """
+    
+    def __init__(self, name: str, help_text: str, kind: str, read: Callable, labels: Tuple[str, ...] = ()):
+        if kind not in ("counter", "gauge"):
+            raise ValueError("kind must be counter or gauge")
+        super().__init__(name, help_text, labels)
+        self.kind = kind
+        self.read = read
+        
+    def samples(self) -> List[str]:
+        if not self.labels:
+            return [f"{self.name} {_number(self.read())}"]
+        return [f"{self.name}{self._label_text(key)} {_number(value)}" for key, value in sorted(self.read().items())]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """Holds the application's metrics and renders them in Prometheus text format"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+        
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+        
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+        
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+        
+    def callback(self, name: str, help_text: str, kind: str, read: Callable,
+                 labels: Tuple[str, ...] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, kind, read, labels))
+        
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+ROUTE_LABELS = ("method", "route")
+
+http_requests = registry.counter("http_requests_total", "HTTP requests served.", ROUTE_LABELS + ("status",))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency.", ROUTE_LABELS)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being served.")
+http_response_size = registry.histogram("http_response_size_bytes", "HTTP response body size.", ROUTE_LABELS,
+                                        SIZE_BUCKETS)
+http_request_db_queries = registry.histogram("http_request_db_queries", "SQL statements executed per HTTP request.",
+                                             ROUTE_LABELS, QUERY_COUNT_BUCKETS)
+http_request_db_duration = registry.histogram("http_request_db_duration_seconds",
+                                              "Time spent in SQL statements per HTTP request.", ROUTE_LABELS)
+db_queries = registry.counter("db_queries_total", "SQL statements executed, inside or outside requests.")
+db_query_duration = registry.counter("db_query_duration_seconds_total", "Time spent executing SQL statements.")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    db_queries.inc()
+    db_query_duration.inc(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+def instrument_engine(engine):
+    """Count statements and time spent in them on ``engine`` (sync or async); safe to call twice"""
+    target = getattr(engine, "sync_engine", engine)
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, response size and database work.
+    
+    Routes are labelled by their path template, so ``/api/portfolio/{account_number}``
+    is one series however many accounts are requested. Latency runs until the
+    last body chunk is sent, which includes streamed responses. With
+    ``server_timing`` on, a ``Server-Timing`` header reports the database and
+    total time spent before the response started.
+    """
+    
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+        
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+            
+        stats = RequestStats()
+        scope.setdefault("state", {})["request_stats"] = stats
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = [500]
+        size = [0]
+        
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if self.server_timing:
+                    message = dict(message, headers=list(message.get("headers", [])) + [
+                        (b"server-timing", _server_timing(stats, time.perf_counter() - started).encode("latin-1"))
+                    ])
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            await send(message)
+            
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            _request_stats.reset(token)
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", UNMATCHED_ROUTE))
+            http_requests.inc(1, *labels, str(status[0]))
+            http_request_duration.observe(elapsed, *labels)
+            http_response_size.observe(size[0], *labels)
+            http_request_db_queries.observe(stats.queries, *labels)
+            http_request_db_duration.observe(stats.db_seconds, *labels)
+
+
+def _server_timing(stats: RequestStats, elapsed: float) -> str:
+    return (f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries", '
+            f'app;dur={elapsed * 1000:.2f}')
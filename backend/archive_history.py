@@ -0,0 +1,41 @@
+"""
+Move audit history past the retention window into compressed archive segments.
+
+Rows whose process date is older than --retention-days are written to
+immutable segment files in --directory (default $HISTORY_ARCHIVE_DIR) and
+then deleted from the history table. The audit history API keeps returning
+them by reading the segments.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+from models import SessionLocal
+from services.history_archive import HistoryArchive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--retention-days", type=int, default=int(os.getenv("HISTORY_RETENTION_DAYS", "365")),
+                        help="keep this many days of history in the database (default $HISTORY_RETENTION_DAYS or 365)")
+    parser.add_argument("--directory", default=os.getenv("HISTORY_ARCHIVE_DIR"),
+                        help="segment directory (default $HISTORY_ARCHIVE_DIR)")
+    parser.add_argument("--segment-rows", type=int, default=200000, help="maximum rows per segment file")
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error("--directory or HISTORY_ARCHIVE_DIR is required")
+        
+    cutoff = datetime.now() - timedelta(days=args.retention_days)
+    session = SessionLocal()
+    try:
+        stats = HistoryArchive(args.directory, segment_rows=args.segment_rows).archive(session, cutoff)
+    finally:
+        session.close()
+        
+    print(f"{stats['rows']} history row(s) before {cutoff:%Y-%m-%d %H:%M} archived "
+          f"to {stats['segments']} segment(s) in {args.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Open tax lots for positions held before lot tracking was turned on.
+
+Shares bought without TAX_LOT_METHOD set have no lots, so sells against them
+fail once tracking is enabled. Run this once after enabling it: every active
+position whose shares no open lot covers gets an opening lot at its cost
+basis. Reruns open nothing new.
+"""
+import argparse
+import sys
+from models import SessionLocal
+from services.tax_lots import backfill_lots
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--portfolio", action="append", dest="portfolios", metavar="PORT_ID",
+                        help="only backfill this portfolio (repeatable); default is every portfolio")
+    parser.add_argument("--dry-run", action="store_true", help="list the lots without writing them")
+    args = parser.parse_args()
+    
+    session = SessionLocal()
+    try:
+        lots = backfill_lots(session, args.portfolios)
+        for lot in lots:
+            print(f"{lot.portfolio_id} {lot.investment_id}@{lot.date}: quantity={lot.quantity} "
+                  f"cost_basis={lot.cost_basis}")
+        if args.dry_run:
+            session.rollback()
+        else:
+            session.commit()
+    finally:
+        session.close()
+        
+    print(f"{len(lots)} lot(s) " + ("to open" if args.dry_run else "opened"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
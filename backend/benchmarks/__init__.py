@@ -0,0 +1,5 @@
+from .harness import Benchmark, compare, load_baseline, run_benchmarks, save_baseline, summarize
+from .cases import BenchmarkEnvironment, default_benchmarks
+
+__all__ = ["Benchmark", "BenchmarkEnvironment", "compare", "default_benchmarks", "load_baseline",
+           "run_benchmarks", "save_baseline", "summarize"]
@@ -0,0 +1,284 @@
+import asyncio
+import fnmatch
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import List
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from models import (Base, Portfolio, Position, Transaction, History, create_db_engine, create_async_db_engine,
+                    get_async_db, get_async_session_factory)
+from services import PortfolioService
+from services.cache import portfolio_cache
+from services.data_generator import SyntheticDataGenerator
+from .harness import Benchmark
+
+PROCESS_TRANSACTION_TYPES = ("BU", "SL", "FE")
+TOTAL_VALUE_POSITION_COUNTS = (10, 100, 1000, 10000)
+TRANSFER_WORKER_COUNTS = (1, 8)
+
+
+class BenchmarkEnvironment:
+    """A scratch SQLite database, seeded with synthetic data, for one benchmark run.
+    
+    The API is called in process through an ASGI transport. All requests run
+    on one event loop so the pooled async engine behaves as it does under
+    uvicorn.
+    """
+    
+    def __init__(self, portfolios: int = 50, transactions: int = 5000, seed: int = 42):
+        self.directory = tempfile.mkdtemp(prefix="portfolio-bench-")
+        url = f"sqlite:///{os.path.join(self.directory, 'bench.db')}"
+        self.engine = create_db_engine(url)
+        Base.metadata.create_all(self.engine)
+        SyntheticDataGenerator(portfolios=portfolios, positions_per_date=20, days=5, transactions=transactions,
+                               instruments=500, seed=seed).write(self.engine)
+        self.db = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)()
+        self.accounts = list(self.db.execute(select(Portfolio.account_no).order_by(Portfolio.port_id)).scalars())
+        self._port_ids = (f"BENCH{index:03d}" for index in itertools.count(1))
+        
+        self.async_engine = create_async_db_engine(url)
+        session_factory = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        
+        async def get_bench_db():
+            async with session_factory() as db:
+                yield db
+                
+        app.dependency_overrides[get_async_db] = get_bench_db
+        app.dependency_overrides[get_async_session_factory] = lambda: session_factory
+        self.loop = asyncio.new_event_loop()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark")
+        
+    def get(self, path: str) -> httpx.Response:
+        response = self.loop.run_until_complete(self.client.get(path))
+        response.raise_for_status()
+        return response
+        
+    def new_portfolio(self, cash: Decimal = Decimal("1000000000.00")) -> Portfolio:
+        """Commit an empty portfolio that no other benchmark touches"""
+        port_id = next(self._port_ids)
+        portfolio = Portfolio(port_id=port_id, account_no=f"99{port_id[5:]:0>8}", client_name="Benchmark",
+                              client_type="I", create_date=date(2024, 1, 2), status="A",
+                              cash_balance=cash, total_value=cash)
+        self.db.add(portfolio)
+        self.db.commit()
+        return portfolio
+        
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.run_until_complete(self.async_engine.dispose())
+        self.loop.close()
+        app.dependency_overrides.clear()
+        portfolio_cache.clear()
+        self.db.close()
+        self.engine.dispose()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        
+    def __enter__(self) -> "BenchmarkEnvironment":
+        return self
+        
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _transaction(portfolio_id: str, sequence: int, type_: str, investment_id="EQ00000001",
+                 quantity=Decimal("1.0000"), price=Decimal("100.0000"), amount=None) -> Transaction:
+    transaction = Transaction(
+        date=date(2024, 2, 1),
+        time=time(9, 30, 0),
+        portfolio_id=portfolio_id,
+        sequence_no=f"{sequence:06d}",
+        investment_id=investment_id,
+        type=type_,
+        quantity=quantity,
+        price=price,
+        currency="USD",
+        status="P",
+        process_user="BENCH"
+    )
+    if amount is None:
+        transaction.update_amount()
+    else:
+        transaction.amount = amount
+    return transaction
+
+
+def process_transaction_benchmark(env: BenchmarkEnvironment, type_: str, iterations: int = 500) -> Benchmark:
+    """``PortfolioService.process_transaction`` for one transaction type, one commit per call"""
+    service = PortfolioService(env.db, cache=None)
+    
+    def prepare(count: int) -> List[Transaction]:
+        portfolio = env.new_portfolio()
+        if type_ == "SL":
+            opening = _transaction(portfolio.port_id, 0, "BU", quantity=Decimal("1000000.0000"))
+            env.db.add(opening)
+            service.process_transaction(opening)
+        if type_ == "FE":
+            transactions = [_transaction(portfolio.port_id, sequence, "FE", investment_id=None, quantity=None,
+                                         price=None, amount=Decimal("1.00")) for sequence in range(1, count + 1)]
+        else:
+            transactions = [_transaction(portfolio.port_id, sequence, type_) for sequence in range(1, count + 1)]
+        env.db.add_all(transactions)
+        env.db.commit()
+        return transactions
+        
+    def run(transaction: Transaction):
+        result = service.process_transaction(transaction)
+        if not result["success"]:
+            raise RuntimeError(f"process_transaction failed: {result['errors']}")
+            
+    return Benchmark(f"service.process_transaction.{type_}", run, prepare, iterations=iterations)
+
+
+def concurrent_transfer_benchmarks(env: BenchmarkEnvironment, worker_counts=TRANSFER_WORKER_COUNTS,
+                                   transfers_per_call: int = 64, iterations: int = 20) -> List[Benchmark]:
+    """Random transfers among ten portfolios spread over worker threads, each with its own session.
+    
+    Every call runs ``transfers_per_call`` transfers, so ``ops_per_second``
+    across worker counts shows whether ordered locking keeps pace under
+    contention or collapses.
+    """
+    port_ids = [env.new_portfolio().port_id for _ in range(10)]
+    sequences = itertools.count(1)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=env.engine)
+    
+    def benchmark(workers: int) -> Benchmark:
+        rng = random.Random(workers)
+        
+        def prepare(count: int) -> List[List[List[Transaction]]]:
+            calls = []
+            for _ in range(count):
+                transfers = []
+                for _ in range(transfers_per_call):
+                    source, target = rng.sample(port_ids, 2)
+                    transaction = _transaction(source, next(sequences), "TR", investment_id=None, quantity=None,
+                                               price=None, amount=Decimal("1.00"))
+                    transaction.target_portfolio_id = target
+                    transfers.append(transaction)
+                calls.append([transfers[worker::workers] for worker in range(workers)])
+            return calls
+            
+        def work(transactions: List[Transaction], failures: list):
+            with Session() as db:
+                service = PortfolioService(db, cache=None)
+                for transaction in transactions:
+                    db.add(transaction)
+                    result = service.process_transaction(transaction)
+                    if not result["success"]:
+                        failures.append(result["errors"])
+                        
+        def run(shares: List[List[Transaction]]):
+            failures = []
+            threads = [threading.Thread(target=work, args=(share, failures)) for share in shares]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if failures:
+                raise RuntimeError(f"transfer failed: {failures[0]}")
+                
+        return Benchmark(f"service.transfer.concurrent.{workers}", run, prepare, iterations=iterations, warmup=2)
+        
+    return [benchmark(workers) for workers in worker_counts]
+
+
+def _sample_transaction() -> Transaction:
+    transaction = _transaction("BENCH000", 1, "BU")
+    transaction.process_date = datetime(2024, 2, 1, 9, 30)
+    return transaction
+
+
+def _sample_position() -> Position:
+    return Position(portfolio_id="BENCH000", date=date(2024, 2, 1), investment_id="EQ00000001",
+                    quantity=Decimal("125.0000"), cost_basis=Decimal("12500.00"), market_value=Decimal("13750.00"),
+                    currency="USD", status="A", last_maint_date=datetime(2024, 2, 1, 16, 0), last_maint_user="BENCH")
+
+
+def audit_record_benchmark(iterations: int = 5000) -> Benchmark:
+    """``History.create_audit_record`` with a before and after image, as position updates write it"""
+    before = _sample_position().to_dict()
+    after = dict(before, quantity=126.0, cost_basis=12600.0)
+    return Benchmark(
+        "model.History.create_audit_record",
+        lambda _: History.create_audit_record("BENCH000", "PS", "C", before_data=before, after_data=after,
+                                              reason_code="PROC", user="BENCH"),
+        iterations=iterations
+    )
+
+
+def to_dict_benchmarks(iterations: int = 20000) -> List[Benchmark]:
+    position = _sample_position()
+    portfolio = Portfolio(port_id="BENCH000", account_no="9900000000", client_name="Benchmark", client_type="I",
+                          create_date=date(2024, 1, 2), last_maint=date(2024, 2, 1), status="A",
+                          cash_balance=Decimal("5000.00"), total_value=Decimal("18750.00"), last_user="BENCH")
+    transaction = _sample_transaction()
+    before = position.to_dict()
+    history = History.create_audit_record("BENCH000", "PS", "C", before_data=before,
+                                          after_data=dict(before, quantity=126.0))
+    history.process_date = datetime(2024, 2, 1, 16, 0)
+    return [
+        Benchmark(f"model.{type(instance).__name__}.to_dict", lambda _, instance=instance: instance.to_dict(),
+                  iterations=iterations)
+        for instance in (portfolio, position, transaction, history)
+    ]
+
+
+def total_value_benchmarks(counts=TOTAL_VALUE_POSITION_COUNTS) -> List[Benchmark]:
+    """``Portfolio.calculate_total_value`` over in-memory portfolios of increasing size"""
+    benchmarks = []
+    for count in counts:
+        portfolio = Portfolio(port_id="BENCH000", cash_balance=Decimal("5000.00"))
+        portfolio.positions = [
+            Position(portfolio_id="BENCH000", date=date(2024, 2, 1), investment_id=f"EQ{index:08d}",
+                     market_value=Decimal("100.00") + index, status="A" if index % 10 else "C")
+            for index in range(count)
+        ]
+        benchmarks.append(Benchmark(
+            f"model.Portfolio.calculate_total_value.{count}",
+            lambda _, portfolio=portfolio: portfolio.calculate_total_value(),
+            iterations=min(5000, max(20, 200000 // count))
+        ))
+    return benchmarks
+
+
+def api_benchmarks(env: BenchmarkEnvironment, iterations: int = 300) -> List[Benchmark]:
+    """End-to-end request latency through routing, the async session and serialization"""
+    
+    def accounts(count: int) -> List[str]:
+        return list(itertools.islice(itertools.cycle(env.accounts), count))
+        
+    return [
+        Benchmark("api.portfolio", lambda account: env.get(f"/api/portfolio/{account}"), accounts,
+                  reset=portfolio_cache.clear, iterations=iterations),
+        Benchmark("api.portfolio.cached", lambda account: env.get(f"/api/portfolio/{account}"),
+                  lambda count: [env.accounts[0]] * count, iterations=iterations),
+        Benchmark("api.transactions", lambda account: env.get(f"/api/transactions/{account}"), accounts,
+                  iterations=iterations)
+    ]
+
+
+def default_benchmarks(env: BenchmarkEnvironment, pattern: str = "*") -> List[Benchmark]:
+    """Every benchmark whose name matches the glob ``pattern``.
+    
+    Service cases are matched by name before they are built, so a filtered
+    run commits no portfolios for the cases it skips.
+    """
+    def selected(name: str) -> bool:
+        return fnmatch.fnmatch(name, pattern)
+        
+    workers = [count for count in TRANSFER_WORKER_COUNTS if selected(f"service.transfer.concurrent.{count}")]
+    benchmarks = [process_transaction_benchmark(env, type_) for type_ in PROCESS_TRANSACTION_TYPES
+                  if selected(f"service.process_transaction.{type_}")]
+    if workers:
+        benchmarks.extend(concurrent_transfer_benchmarks(env, worker_counts=workers))
+    benchmarks.extend([audit_record_benchmark(), *to_dict_benchmarks(), *total_value_benchmarks(),
+                       *api_benchmarks(env)])
+    return [benchmark for benchmark in benchmarks if selected(benchmark.name)]
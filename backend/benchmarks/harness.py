@@ -0,0 +1,113 @@
+import json
+import platform
+import statistics
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+BASELINE_VERSION = 1
+
+
+class Benchmark:
+    """One named operation timed call by call.
+    
+    ``prepare(iterations)`` runs untimed and returns the argument for each
+    call, so fixtures such as fresh transactions are built outside the clock.
+    ``run(argument)`` is the timed operation.
+    ``reset``, when given, runs untimed before every call.
+    """
+    
+    def __init__(self, name: str, run: Callable, prepare: Optional[Callable[[int], List]] = None,
+                 reset: Optional[Callable] = None, iterations: int = 1000, warmup: int = 10):
+        self.name = name
+        self.run = run
+        self.prepare = prepare or (lambda count: [None] * count)
+        self.reset = reset
+        self.iterations = iterations
+        self.warmup = warmup
+        
+    def measure(self, scale: float = 1.0) -> Dict:
+        iterations = max(int(self.iterations * scale), 1)
+        arguments = list(self.prepare(self.warmup + iterations))
+        timings = []
+        for argument in arguments:
+            if self.reset:
+                self.reset()
+            started = time.perf_counter()
+            self.run(argument)
+            timings.append(time.perf_counter() - started)
+        return summarize(timings[self.warmup:])
+
+
+def summarize(timings: List[float]) -> Dict:
+    """Latency percentiles in microseconds and throughput for a list of call durations"""
+    ordered = sorted(timings)
+    total = sum(ordered)
+    
+    def percentile(fraction: float) -> float:
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1e6
+        
+    return {
+        "iterations": len(ordered),
+        "mean_us": total / len(ordered) * 1e6,
+        "median_us": statistics.median(ordered) * 1e6,
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "min_us": ordered[0] * 1e6,
+        "ops_per_second": len(ordered) / total if total else 0.0
+    }
+
+
+def run_benchmarks(benchmarks: Iterable[Benchmark], scale: float = 1.0,
+                   progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    """Measure every benchmark and return a baseline document"""
+    results = {}
+    for benchmark in benchmarks:
+        results[benchmark.name] = benchmark.measure(scale)
+        if progress:
+            progress(benchmark.name, results[benchmark.name])
+    return {
+        "version": BASELINE_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results
+    }
+
+
+def save_baseline(document: Dict, path: str):
+    with open(path, "w") as handle:
+        json.dump(document, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def load_baseline(path: str) -> Dict:
+    with open(path) as handle:
+        document = json.load(handle)
+    if document.get("version") != BASELINE_VERSION:
+        raise ValueError(f"Unsupported baseline version in {path}: {document.get('version')}")
+    return document
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10, metric: str = "median_us") -> List[Dict]:
+    """Compare two baseline documents benchmark by benchmark.
+    
+    ``change`` is the relative change of ``metric`` (a latency, so positive is
+    slower). A benchmark regresses when it is slower by more than
+    ``threshold``. Benchmarks missing from either side are reported with a
+    ``change`` of None and never count as regressions.
+    """
+    rows = []
+    names = sorted(set(baseline["results"]) | set(current["results"]))
+    for name in names:
+        before = baseline["results"].get(name, {}).get(metric)
+        after = current["results"].get(name, {}).get(metric)
+        change = (after - before) / before if before and after is not None else None
+        rows.append({
+            "name": name,
+            "baseline": before,
+            "current": after,
+            "change": change,
+            "regression": change is not None and change > threshold
+        })
+    return rows
@@ -0,0 +1,53 @@
+"""
+Synthetic dataset generator for benchmarking and capacity planning.
+
+Builds N portfolios, M positions per date over D days, T transactions and
+their History audit rows with a fixed random seed, and bulk loads them into
+DATABASE_URL (COPY on PostgreSQL, executemany inserts elsewhere).
+"""
+import argparse
+import sys
+from datetime import date
+from models import Base, engine
+from services.data_generator import SyntheticDataGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--portfolios", type=int, default=1000, help="number of portfolios (N)")
+    parser.add_argument("--positions", type=int, default=20, help="positions per portfolio per date (M)")
+    parser.add_argument("--days", type=int, default=30, help="number of position dates (D)")
+    parser.add_argument("--transactions", type=int, default=100000, help="number of transactions (T)")
+    parser.add_argument("--instruments", type=int, default=5000, help="size of the instrument universe")
+    parser.add_argument("--seed", type=int, default=42, help="random seed; the same seed gives the same data")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2024, 1, 2),
+                        help="first position date (YYYY-MM-DD)")
+    parser.add_argument("--pending-share", type=float, default=0.02,
+                        help="share of transactions left pending (status P) for the end-of-day run")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows per insert batch and commit")
+    parser.add_argument("--create-tables", action="store_true", help="create missing tables before loading")
+    args = parser.parse_args()
+    
+    if args.create_tables:
+        Base.metadata.create_all(bind=engine)
+        
+    generator = SyntheticDataGenerator(
+        portfolios=args.portfolios,
+        positions_per_date=args.positions,
+        days=args.days,
+        transactions=args.transactions,
+        instruments=args.instruments,
+        seed=args.seed,
+        start_date=args.start_date,
+        pending_share=args.pending_share
+    )
+    stats = generator.write(engine, batch_size=args.batch_size)
+    
+    print(f"{stats['portfolios']} portfolios, {stats['positions']} positions, "
+          f"{stats['transactions']} transactions, {stats['history']} history rows")
+    print(f"{stats['rows']} rows in {stats['elapsed_seconds']:.2f}s ({stats['rows_per_second']:,.0f} rows/sec)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
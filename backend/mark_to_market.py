@@ -0,0 +1,31 @@
+"""
+Nightly mark-to-market of active positions from a price file.
+
+Reads investment_id,price rows from a CSV or Parquet file, sets
+Position.market_value = quantity * price for every active position with a
+price, and refreshes Portfolio.total_value for the affected portfolios.
+"""
+import argparse
+import logging
+import sys
+from services.mark_to_market import MarkToMarketJob
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("price_file", help="CSV (investment_id,price header) or .parquet file")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="prices staged and committed per batch")
+    parser.add_argument("--user", default="MTM", help="last_maint_user recorded on revalued positions")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    stats = MarkToMarketJob(chunk_size=args.chunk_size, user=args.user).run(args.price_file)
+    
+    print(f"{stats['prices']} prices applied to {stats['positions_updated']} positions "
+          f"in {stats['portfolios_updated']} portfolios")
+    print(f"{stats['elapsed_seconds']:.2f}s, {stats['rows_per_second']:,.0f} positions/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
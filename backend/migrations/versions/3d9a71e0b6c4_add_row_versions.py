@@ -0,0 +1,30 @@
+"""Add optimistic concurrency versions to portfolios and positions
+
+Revision ID: 3d9a71e0b6c4
+Revises: f18b6c3a7e52
+Create Date: 2026-10-18 16:40:27.118306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9a71e0b6c4'
+down_revision: Union[str, Sequence[str], None] = 'f18b6c3a7e52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('portfolios', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('positions', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('positions', 'version')
+    op.drop_column('portfolios', 'version')
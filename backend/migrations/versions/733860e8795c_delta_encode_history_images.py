@@ -0,0 +1,150 @@
+"""Delta encode History before/after images
+
+Revision ID: 733860e8795c
+Revises: 40a256798f94
+Create Date: 2026-10-18 09:12:44.318207
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '733860e8795c'
+down_revision: Union[str, Sequence[str], None] = '40a256798f94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+REMOVED_KEYS = "__removed__"
+
+history = sa.table(
+    'history',
+    sa.column('portfolio_id', sa.String),
+    sa.column('date', sa.String),
+    sa.column('time', sa.String),
+    sa.column('seq_no', sa.String),
+    sa.column('before_image', sa.Text),
+    sa.column('after_image', sa.Text),
+    sa.column('image_format', sa.String),
+)
+
+
+def _load(image):
+    """Parsed image; raises ValueError for an image that is not a JSON object"""
+    if not image:
+        return None
+    data = json.loads(image)
+    if not isinstance(data, dict):
+        raise ValueError("image is not a JSON object")
+    return data
+
+
+def _dump(data):
+    return json.dumps(data, separators=(",", ":")) if data else None
+
+
+def _to_delta(before_image, after_image):
+    try:
+        before_data = _load(before_image)
+        after_data = _load(after_image)
+    except ValueError:
+        # Images that do not parse are kept exactly as written, as full images
+        return before_image, after_image, 'J'
+    if not after_data:
+        return _dump(before_data), after_image, 'D'
+    base = before_data or {}
+    delta = {key: value for key, value in after_data.items() if key not in base or base[key] != value}
+    removed = [key for key in base if key not in after_data]
+    if removed:
+        delta[REMOVED_KEYS] = removed
+    return _dump(before_data), _dump(delta) or "{}", 'D'
+
+
+def _to_full(before_image, after_image):
+    before_data = _load(before_image)
+    if not after_image:
+        return before_image, after_image, 'J'
+    after_data = dict(before_data or {})
+    delta = json.loads(after_image)
+    for key in delta.pop(REMOVED_KEYS, []):
+        after_data.pop(key, None)
+    after_data.update(delta)
+    return before_image, json.dumps(after_data), 'J'
+
+
+def _convert(source_format, convert):
+    """Rewrite rows in ``source_format`` in primary key order, BATCH_SIZE rows at a time.
+
+    ``convert`` returns the new images and the format they are in. Runs in
+    autocommit mode so every batch commits on its own: locks are held for one
+    batch at a time and an interrupted run resumes with the rows it has not
+    converted yet.
+    """
+    key = (history.c.portfolio_id, history.c.date, history.c.time, history.c.seq_no)
+    with op.get_context().autocommit_block():
+        _convert_batches(op.get_bind(), key, source_format, convert)
+
+
+def _convert_batches(bind, key, source_format, convert):
+    last = None
+    while True:
+        query = sa.select(*key, history.c.before_image, history.c.after_image).order_by(*key).limit(BATCH_SIZE)
+        if source_format is None:
+            query = query.where(history.c.image_format.is_(None))
+        else:
+            query = query.where(history.c.image_format == source_format)
+        if last is not None:
+            query = query.where(sa.tuple_(*key) > sa.tuple_(*last))
+
+        rows = bind.execute(query).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            before_image, after_image, image_format = convert(row.before_image, row.after_image)
+            updates.append({
+                "k_portfolio_id": row.portfolio_id,
+                "k_date": row.date,
+                "k_time": row.time,
+                "k_seq_no": row.seq_no,
+                "before_image": before_image,
+                "after_image": after_image,
+                "image_format": image_format,
+            })
+        bind.execute(
+            history.update()
+            .where(history.c.portfolio_id == sa.bindparam("k_portfolio_id"))
+            .where(history.c.date == sa.bindparam("k_date"))
+            .where(history.c.time == sa.bindparam("k_time"))
+            .where(history.c.seq_no == sa.bindparam("k_seq_no"))
+            .values(
+                before_image=sa.bindparam("before_image"),
+                after_image=sa.bindparam("after_image"),
+                image_format=sa.bindparam("image_format"),
+            ),
+            updates
+        )
+        last = tuple(rows[-1][:4])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A rerun after an interrupted conversion finds the column already added
+    if 'image_format' not in {column['name'] for column in sa.inspect(op.get_bind()).get_columns('history')}:
+        op.add_column('history', sa.Column('image_format', sa.String(length=1), nullable=True))
+    _convert(None, _to_delta)
+    with op.batch_alter_table('history') as batch_op:
+        batch_op.create_check_constraint('ck_history_image_format', "image_format IN ('J', 'D')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _convert('D', _to_full)
+    with op.batch_alter_table('history') as batch_op:
+        batch_op.drop_constraint('ck_history_image_format', type_='check')
+        batch_op.drop_column('image_format')
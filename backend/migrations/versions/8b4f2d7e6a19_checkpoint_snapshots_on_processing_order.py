@@ -0,0 +1,46 @@
+"""Checkpoint portfolio snapshots on processing order
+
+Revision ID: 8b4f2d7e6a19
+Revises: 3d9a71e0b6c4
+Create Date: 2026-10-18 18:05:12.640391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4f2d7e6a19'
+down_revision: Union[str, Sequence[str], None] = '3d9a71e0b6c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('portfolio_snapshots', sa.Column('checkpoint_process_date', sa.DateTime(), nullable=True))
+    op.add_column('portfolio_snapshots', sa.Column('checkpoint_portfolio_id', sa.String(length=8), nullable=True))
+    
+    # Existing checkpoints are keys of the snapshot's own transactions; take the
+    # processing time from that row, or the snapshot time if it is gone
+    op.execute("""
+        UPDATE portfolio_snapshots
+        SET checkpoint_portfolio_id = portfolio_id,
+            checkpoint_process_date = COALESCE(
+                (SELECT t.process_date FROM transactions t
+                 WHERE t.date = portfolio_snapshots.checkpoint_date
+                   AND t.time = portfolio_snapshots.checkpoint_time
+                   AND t.portfolio_id = portfolio_snapshots.portfolio_id
+                   AND t.sequence_no = portfolio_snapshots.checkpoint_sequence_no),
+                taken_at
+            )
+        WHERE checkpoint_date IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('portfolio_snapshots', 'checkpoint_portfolio_id')
+    op.drop_column('portfolio_snapshots', 'checkpoint_process_date')
@@ -0,0 +1,107 @@
+"""Index History by portfolio and process date
+
+Revision ID: a4f81d2c9e35
+Revises: e3a91c6d5b28
+Create Date: 2026-10-18 12:31:08.554102
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4f81d2c9e35'
+down_revision: Union[str, Sequence[str], None] = 'e3a91c6d5b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+INDEX_NAME = 'idx_history_portfolio_process_date'
+
+history = sa.table(
+    'history',
+    sa.column('portfolio_id', sa.String),
+    sa.column('date', sa.String),
+    sa.column('time', sa.String),
+    sa.column('seq_no', sa.String),
+    sa.column('process_date', sa.DateTime),
+)
+
+
+def _slot_time(date_str, time_str):
+    """The moment a row's ``date``/``time`` slot stands for; ``time`` is HHMMSS plus optional hundredths"""
+    try:
+        moment = datetime.strptime(date_str + time_str[:6], "%Y%m%d%H%M%S")
+    except (TypeError, ValueError):
+        return None
+    hundredths = time_str[6:8]
+    return moment.replace(microsecond=int(hundredths) * 10000) if hundredths.isdigit() else moment
+
+
+def _backfill_process_date():
+    """Fill missing process dates from the row's slot, in primary key order.
+
+    Runs in autocommit mode so every batch commits on its own: locks are held
+    for one batch at a time and an interrupted run resumes where it stopped.
+    """
+    key = (history.c.portfolio_id, history.c.date, history.c.time, history.c.seq_no)
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        last = None
+        while True:
+            query = sa.select(*key).where(history.c.process_date.is_(None)).order_by(*key).limit(BATCH_SIZE)
+            if last is not None:
+                query = query.where(sa.tuple_(*key) > sa.tuple_(*last))
+            rows = bind.execute(query).fetchall()
+            if not rows:
+                break
+
+            updates = [{
+                "k_portfolio_id": row.portfolio_id,
+                "k_date": row.date,
+                "k_time": row.time,
+                "k_seq_no": row.seq_no,
+                "process_date": _slot_time(row.date, row.time),
+            } for row in rows]
+            updates = [update for update in updates if update["process_date"] is not None]
+            if updates:
+                bind.execute(
+                    history.update()
+                    .where(history.c.portfolio_id == sa.bindparam("k_portfolio_id"))
+                    .where(history.c.date == sa.bindparam("k_date"))
+                    .where(history.c.time == sa.bindparam("k_time"))
+                    .where(history.c.seq_no == sa.bindparam("k_seq_no"))
+                    .values(process_date=sa.bindparam("process_date")),
+                    updates
+                )
+            last = tuple(rows[-1])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # History.time holds HHMMSS plus hundredths; SQLite does not enforce VARCHAR lengths
+    if op.get_bind().dialect.name != 'sqlite':
+        op.alter_column('history', 'time', existing_type=sa.String(length=6), type_=sa.String(length=8),
+                        existing_nullable=False)
+
+    _backfill_process_date()
+
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.create_index(INDEX_NAME, 'history', ['portfolio_id', 'process_date'], unique=False,
+                            postgresql_concurrently=True, if_not_exists=True)
+    else:
+        op.create_index(INDEX_NAME, 'history', ['portfolio_id', 'process_date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The wider time column and backfilled process dates are kept: values no longer fit String(6)
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index(INDEX_NAME, table_name='history', postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(INDEX_NAME, table_name='history')
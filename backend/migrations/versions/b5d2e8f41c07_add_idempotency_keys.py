@@ -0,0 +1,38 @@
+"""Add idempotency keys for transaction ingestion
+
+Revision ID: b5d2e8f41c07
+Revises: 733860e8795c
+Create Date: 2026-10-18 10:05:12.481930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2e8f41c07'
+down_revision: Union[str, Sequence[str], None] = '733860e8795c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('idempotency_keys',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('request_hash', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.CheckConstraint("status IN ('pending', 'processed', 'failed', 'rejected')"),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('idx_idempotency_created_at', 'idempotency_keys', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_idempotency_created_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
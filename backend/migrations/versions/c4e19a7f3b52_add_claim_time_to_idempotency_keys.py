@@ -0,0 +1,34 @@
+"""Add claim time to idempotency keys
+
+Revision ID: c4e19a7f3b52
+Revises: 8b4f2d7e6a19
+Create Date: 2026-10-18 19:40:27.905114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e19a7f3b52'
+down_revision: Union[str, Sequence[str], None] = '8b4f2d7e6a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('idempotency_keys', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE idempotency_keys SET claimed_at = created_at")
+    # SQLite recreates the table, which would drop the unnamed status check
+    with op.batch_alter_table('idempotency_keys', table_args=(
+        sa.CheckConstraint("status IN ('pending', 'processed', 'failed', 'rejected')"),
+    )) as batch_op:
+        batch_op.alter_column('claimed_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('idempotency_keys', 'claimed_at')
@@ -0,0 +1,65 @@
+"""Add tax lots and realized gains
+
+Revision ID: c7e25a9f3d14
+Revises: a4f81d2c9e35
+Create Date: 2026-10-18 14:05:37.219846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e25a9f3d14'
+down_revision: Union[str, Sequence[str], None] = 'a4f81d2c9e35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('tax_lots',
+    sa.Column('portfolio_id', sa.String(length=8), nullable=False),
+    sa.Column('investment_id', sa.String(length=10), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.Time(), nullable=False),
+    sa.Column('sequence_no', sa.String(length=6), nullable=False),
+    sa.Column('quantity', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('remaining_quantity', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('cost_basis', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=True),
+    sa.Column('status', sa.String(length=1), nullable=False),
+    sa.CheckConstraint("status IN ('O', 'C')"),
+    sa.ForeignKeyConstraint(['portfolio_id'], ['portfolios.port_id'], ),
+    sa.PrimaryKeyConstraint('portfolio_id', 'investment_id', 'date', 'time', 'sequence_no')
+    )
+    op.create_index('idx_tax_lot_open', 'tax_lots', ['portfolio_id', 'investment_id', 'status'], unique=False)
+    op.create_table('realized_gains',
+    sa.Column('portfolio_id', sa.String(length=8), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('time', sa.Time(), nullable=False),
+    sa.Column('sequence_no', sa.String(length=6), nullable=False),
+    sa.Column('lot_date', sa.Date(), nullable=False),
+    sa.Column('lot_time', sa.Time(), nullable=False),
+    sa.Column('lot_sequence_no', sa.String(length=6), nullable=False),
+    sa.Column('investment_id', sa.String(length=10), nullable=False),
+    sa.Column('quantity', sa.Numeric(precision=15, scale=4), nullable=False),
+    sa.Column('proceeds', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('cost_basis', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('gain', sa.Numeric(precision=15, scale=2), nullable=False),
+    sa.Column('method', sa.String(length=4), nullable=False),
+    sa.CheckConstraint("method IN ('FIFO', 'LIFO', 'SPEC')"),
+    sa.ForeignKeyConstraint(['portfolio_id'], ['portfolios.port_id'], ),
+    sa.PrimaryKeyConstraint('portfolio_id', 'date', 'time', 'sequence_no', 'lot_date', 'lot_time', 'lot_sequence_no')
+    )
+    op.create_index('idx_realized_gain_investment', 'realized_gains', ['portfolio_id', 'investment_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_realized_gain_investment', table_name='realized_gains')
+    op.drop_table('realized_gains')
+    op.drop_index('idx_tax_lot_open', table_name='tax_lots')
+    op.drop_table('tax_lots')
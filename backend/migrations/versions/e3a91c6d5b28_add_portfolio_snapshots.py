@@ -0,0 +1,37 @@
+"""Add portfolio snapshots for transaction replay
+
+Revision ID: e3a91c6d5b28
+Revises: b5d2e8f41c07
+Create Date: 2026-10-18 11:20:43.107215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a91c6d5b28'
+down_revision: Union[str, Sequence[str], None] = 'b5d2e8f41c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('portfolio_snapshots',
+    sa.Column('portfolio_id', sa.String(length=8), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.Column('checkpoint_date', sa.Date(), nullable=True),
+    sa.Column('checkpoint_time', sa.Time(), nullable=True),
+    sa.Column('checkpoint_sequence_no', sa.String(length=6), nullable=True),
+    sa.Column('state', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['portfolio_id'], ['portfolios.port_id'], ),
+    sa.PrimaryKeyConstraint('portfolio_id', 'taken_at')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('portfolio_snapshots')
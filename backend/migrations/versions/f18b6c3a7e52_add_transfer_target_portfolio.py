@@ -0,0 +1,35 @@
+"""Add target portfolio to transfer transactions
+
+Revision ID: f18b6c3a7e52
+Revises: c7e25a9f3d14
+Create Date: 2026-10-18 15:12:09.430517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f18b6c3a7e52'
+down_revision: Union[str, Sequence[str], None] = 'c7e25a9f3d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FOREIGN_KEY_NAME = 'fk_transactions_target_portfolio_id'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('transactions', sa.Column('target_portfolio_id', sa.String(length=8), nullable=True))
+    # SQLite cannot add a constraint in place; there the service rejects unknown targets
+    if op.get_bind().dialect.name != 'sqlite':
+        op.create_foreign_key(FOREIGN_KEY_NAME, 'transactions', 'portfolios', ['target_portfolio_id'], ['port_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint(FOREIGN_KEY_NAME, 'transactions', type_='foreignkey')
+    op.drop_column('transactions', 'target_portfolio_id')
@@ -1,5 +1,16 @@
-from .database import Portfolio, Position, Base, engine, SessionLocal
+from .database import (Portfolio, Position, Base, engine, SessionLocal, get_db, get_session_factory,
+                       async_engine, AsyncSessionLocal, get_async_db, get_async_session_factory)
+from .engine import create_db_engine, create_async_db_engine, pool_status
 from .transactions import Transaction
 from .history import History
+from .idempotency import IdempotencyKey
+from .snapshot import PortfolioSnapshot
+from .tax_lot import TaxLot, RealizedGain
+from .sequence import HistorySequenceAllocator, history_sequence
+from .diagnostics import QueryDiagnostics, QueryBudgetExceeded, query_budget
 
-__all__ = ["Portfolio", "Position", "Transaction", "History", "Base", "engine", "SessionLocal"]
+__all__ = ["Portfolio", "Position", "Transaction", "History", "IdempotencyKey", "PortfolioSnapshot", "TaxLot",
+           "RealizedGain", "Base", "engine", "SessionLocal", "get_db", "get_session_factory", "async_engine",
+           "AsyncSessionLocal", "get_async_db", "get_async_session_factory", "create_db_engine",
+           "create_async_db_engine", "pool_status", "HistorySequenceAllocator", "history_sequence",
+           "QueryDiagnostics", "QueryBudgetExceeded", "query_budget"]
@@ -1,9 +1,11 @@
-from sqlalchemy import create_engine, Column, String, Numeric, Date, DateTime, CheckConstraint, ForeignKeyConstraint, Index
+from sqlalchemy import Column, String, Numeric, Integer, Date, DateTime, CheckConstraint, ForeignKeyConstraint, Index
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from decimal import Decimal
 from typing import Dict, List, Optional
 from datetime import datetime, date
+from .engine import SQLITE_DATABASE_URL, create_async_db_engine, create_db_engine
 
 Base = declarative_base()
 
@@ -26,14 +28,19 @@ class Portfolio(Base):
     last_user = Column(String(8))
     last_trans = Column(String(8))
     
+    # Optimistic concurrency: ORM updates match on the version they read and bump it
+    version = Column(Integer, nullable=False, server_default="1")
+    
     positions = relationship("Position", back_populates="portfolio", cascade="all, delete-orphan")
-    transactions = relationship("Transaction", back_populates="portfolio", cascade="all, delete-orphan")
+    transactions = relationship("Transaction", back_populates="portfolio", cascade="all, delete-orphan",
+                                foreign_keys="Transaction.portfolio_id")
     history_records = relationship("History", back_populates="portfolio", cascade="all, delete-orphan")
     
     __table_args__ = (
         Index('idx_portfolio_status', 'status'),
         Index('idx_portfolio_client_type', 'client_type'),
     )
+    __mapper_args__ = {"version_id_col": version}
     
     def validate_portfolio(self) -> Dict[str, bool]:
         errors = []
@@ -55,8 +62,7 @@ class Portfolio(Base):
     def calculate_total_value(self) -> Decimal:
         total = Decimal('0.00')
         for position in self.positions:
-            if position.status == 'A':
-                total += position.market_value or Decimal('0.00')
+            total += position.valued_amount()
         
         total += self.cash_balance or Decimal('0.00')
         return total
@@ -65,6 +71,14 @@ class Portfolio(Base):
         self.total_value = self.calculate_total_value()
         self.last_maint = date.today()
     
+    def apply_value_change(self, delta: Decimal):
+        """Adjust total_value by a known change instead of rescanning positions"""
+        if self.total_value is None:
+            self.update_total_value()
+            return
+        self.total_value = self.total_value + delta
+        self.last_maint = date.today()
+    
     def to_dict(self) -> Dict:
         return {
             "port_id": self.port_id,
@@ -97,6 +111,8 @@ class Position(Base):
     last_maint_date = Column(DateTime)
     last_maint_user = Column(String(8))
     
+    version = Column(Integer, nullable=False, server_default="1")
+    
     portfolio = relationship("Portfolio", back_populates="positions")
     
     __table_args__ = (
@@ -109,6 +125,13 @@ class Position(Base):
         Index('idx_position_investment_id', 'investment_id'),
         Index('idx_position_status', 'status'),
     )
+    __mapper_args__ = {"version_id_col": version}
+    
+    def valued_amount(self) -> Decimal:
+        """This row's contribution to Portfolio.calculate_total_value"""
+        if self.status == 'A':
+            return self.market_value or Decimal('0.00')
+        return Decimal('0.00')
     
     def calculate_gain_loss(self) -> Dict[str, Decimal]:
         if not self.cost_basis or not self.market_value:
@@ -157,9 +180,33 @@ class Position(Base):
         }
 
 
-SQLITE_DATABASE_URL = "sqlite:///./portfolio.db"
-
-engine = create_engine(
-    SQLITE_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def get_db():
+    """FastAPI dependency yielding a request-scoped session"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_session_factory():
+    """FastAPI dependency for handlers that manage their own session lifetime, e.g. streaming responses"""
+    return SessionLocal
+
+
+async def get_async_db():
+    """FastAPI dependency yielding a request-scoped AsyncSession"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_async_session_factory():
+    """Async counterpart of get_session_factory"""
+    return AsyncSessionLocal
@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_IGNORED_FRAMES = (os.sep + "sqlalchemy" + os.sep, os.sep + "asyncio" + os.sep, "greenlet", __file__)
+_MAX_PARAMETER_TEXT = 500
+
+
+def _caller() -> Optional[str]:
+    """The innermost application frame that issued the current statement"""
+    for frame in reversed(traceback.extract_stack()):
+        if not any(part in frame.filename for part in _IGNORED_FRAMES):
+            return f"{frame.filename}:{frame.lineno} in {frame.name}"
+    return None
+
+
+def _parameter_text(parameters) -> str:
+    text = repr(parameters)
+    return text if len(text) <= _MAX_PARAMETER_TEXT else text[:_MAX_PARAMETER_TEXT] + "..."
+
+
+class QueryDiagnosticsError(AssertionError):
+    """Raised in strict mode when a repeated statement pattern is detected"""
+
+
+class QueryDiagnostics:
+    """Opt-in detection of N+1 query patterns and slow statements on an engine.
+    
+    A statement whose SQL text runs ``repeat_threshold`` times within one
+    database transaction is reported once as a likely N+1, typically a lazy
+    relationship loaded inside a loop. Statements slower than
+    ``slow_query_seconds`` are logged with their bound parameters and, when
+    ``explain`` is on, the database's query plan. Findings are logged and
+    the latest ``max_findings`` are kept in ``findings``. With ``strict``, an N+1 finding raises
+    ``QueryDiagnosticsError`` from the offending statement instead.
+    """
+    
+    def __init__(self, repeat_threshold: int = 5, slow_query_seconds: float = 0.5,
+                 explain: bool = True, strict: bool = False, max_findings: int = 1000):
+        if repeat_threshold < 2:
+            raise ValueError("repeat_threshold must be at least 2")
+        if max_findings < 1:
+            raise ValueError("max_findings must be at least 1")
+        self.repeat_threshold = repeat_threshold
+        self.slow_query_seconds = slow_query_seconds
+        self.explain = explain
+        self.strict = strict
+        self.findings: Deque[Dict] = deque(maxlen=max_findings)
+        self._lock = threading.Lock()
+        
+    @classmethod
+    def from_env(cls) -> Optional["QueryDiagnostics"]:
+        """Diagnostics configured from ``DB_DIAGNOSTICS*`` variables, or None when not enabled"""
+        if os.getenv("DB_DIAGNOSTICS", "false").lower() != "true":
+            return None
+        return cls(
+            repeat_threshold=int(os.getenv("DB_DIAGNOSTICS_REPEAT_THRESHOLD", "5")),
+            slow_query_seconds=int(os.getenv("DB_DIAGNOSTICS_SLOW_QUERY_MS", "500")) / 1000,
+            explain=os.getenv("DB_DIAGNOSTICS_EXPLAIN", "true").lower() == "true",
+            max_findings=int(os.getenv("DB_DIAGNOSTICS_MAX_FINDINGS", "1000"))
+        )
+        
+    def install(self, engine) -> "QueryDiagnostics":
+        target = getattr(engine, "sync_engine", engine)
+        event.listen(target, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(target, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(target, "commit", self._end_unit_of_work)
+        event.listen(target, "rollback", self._end_unit_of_work)
+        return self
+        
+    def remove(self, engine):
+        target = getattr(engine, "sync_engine", engine)
+        event.remove(target, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(target, "after_cursor_execute", self._after_cursor_execute)
+        event.remove(target, "commit", self._end_unit_of_work)
+        event.remove(target, "rollback", self._end_unit_of_work)
+        
+    def _statement_counts(self, conn) -> Dict[str, int]:
+        return conn.info.setdefault("diagnostics_statement_counts", {})
+        
+    def _end_unit_of_work(self, conn):
+        conn.info.pop("diagnostics_statement_counts", None)
+        
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._diagnostics_started = time.perf_counter()
+            
+        counts = self._statement_counts(conn)
+        counts[statement] = counts.get(statement, 0) + 1
+        if counts[statement] == self.repeat_threshold:
+            finding = self._record("repeated", statement=statement, count=counts[statement],
+                                   parameters=_parameter_text(parameters), location=_caller())
+            logger.warning("Possible N+1: statement ran %d times in one transaction at %s: %s",
+                           finding["count"], finding["location"], statement)
+            if self.strict:
+                raise QueryDiagnosticsError(f"Statement ran {finding['count']} times in one transaction "
+                                            f"at {finding['location']}: {statement}")
+                                            
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_diagnostics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < self.slow_query_seconds:
+            return
+            
+        plan = self._explain(conn, statement, parameters[0] if executemany else parameters) if self.explain else None
+        finding = self._record("slow", statement=statement, seconds=elapsed,
+                               parameters=_parameter_text(parameters), plan=plan, location=_caller())
+        logger.warning("Slow query (%.1f ms) at %s: %s\nParameters: %s%s",
+                       elapsed * 1000, finding["location"], statement, finding["parameters"],
+                       "\nPlan:\n" + "\n".join(plan) if plan else "")
+                       
+    def _explain(self, conn, statement: str, parameters) -> Optional[List[str]]:
+        dialect = conn.dialect.name
+        if dialect == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN "
+        elif dialect == "postgresql":
+            prefix = "EXPLAIN "
+        else:
+            return None
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+        except Exception as e:
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            cursor.close()
+            
+    def _record(self, kind: str, **details) -> Dict:
+        finding = dict(details, kind=kind)
+        with self._lock:
+            self.findings.append(finding)
+        return finding
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A code path ran more statements than its budget allowed"""
+
+
+@contextmanager
+def query_budget(engine, max_queries: int):
+    """Fail with ``QueryBudgetExceeded`` if the block runs more than ``max_queries`` statements.
+    
+    Yields the list of statements executed so far, so tests can also assert on it.
+    """
+    target = getattr(engine, "sync_engine", engine)
+    statements: List[str] = []
+    
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+        
+    event.listen(target, "before_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(target, "before_cursor_execute", count)
+    if len(statements) > max_queries:
+        raise QueryBudgetExceeded(f"{len(statements)} statements ran, budget is {max_queries}:\n"
+                                  + "\n".join(statements))
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from .diagnostics import QueryDiagnostics
+
+SQLITE_DATABASE_URL = "sqlite:///./portfolio.db"
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection.
+    
+    ``checkout_timeouts`` counts only checkouts that gave up after
+    ``pool_timeout``; failures to connect are not pool pressure.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return connection
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool for async engines"""
+
+
+def create_db_engine(url: Optional[str] = None) -> Engine:
+    """Build the application engine from ``url`` or the ``DATABASE_URL`` environment variable.
+    
+    SQLite gets WAL journaling, ``synchronous=NORMAL``, a memory-mapped I/O
+    window and a busy timeout so concurrent workers wait instead of failing on
+    locks. PostgreSQL goes through psycopg with a sized, pre-pinged and
+    recycled connection pool.
+    
+    ``DB_DIAGNOSTICS=true`` installs ``QueryDiagnostics`` (N+1 and slow-query logging).
+    """
+    return _with_diagnostics(_build_engine(_resolve_url(url), create_engine, InstrumentedQueuePool))
+
+
+def create_async_db_engine(url: Optional[str] = None) -> AsyncEngine:
+    """Async counterpart of ``create_db_engine`` with the same URL, pool and pragma settings.
+    
+    SQLite runs on aiosqlite; PostgreSQL uses psycopg's native async mode.
+    """
+    url = _resolve_url(url)
+    if url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return _with_diagnostics(_build_engine(url, create_async_engine, InstrumentedAsyncQueuePool))
+
+
+def _with_diagnostics(engine):
+    diagnostics = QueryDiagnostics.from_env()
+    if diagnostics is not None:
+        diagnostics.install(engine)
+    return engine
+
+
+def _resolve_url(url: Optional[str]):
+    url = make_url(url or os.getenv("DATABASE_URL", SQLITE_DATABASE_URL))
+    if url.drivername == "postgresql":
+        url = url.set(drivername="postgresql+psycopg")
+    return url
+
+
+def _build_engine(url, factory, poolclass):
+    backend = url.get_backend_name()
+    
+    if backend == "sqlite":
+        return _create_sqlite_engine(url, factory, poolclass)
+    if backend == "postgresql":
+        return factory(
+            url,
+            poolclass=poolclass,
+            pool_size=_env_int("DB_POOL_SIZE", 10),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", 20),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+            pool_pre_ping=True,
+            pool_use_lifo=True
+        )
+    return factory(url)
+
+
+def _create_sqlite_engine(url, factory, poolclass):
+    busy_timeout_ms = _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+    mmap_size = _env_int("SQLITE_MMAP_SIZE", 268435456)
+    in_memory = url.database in (None, "", ":memory:")
+    
+    options = {"connect_args": {"check_same_thread": False, "timeout": busy_timeout_ms / 1000}}
+    if not in_memory:
+        options.update(
+            poolclass=poolclass,
+            pool_size=_env_int("DB_POOL_SIZE", 5),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", 30)
+        )
+    engine = factory(url, **options)
+    
+    @event.listens_for(getattr(engine, "sync_engine", engine), "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cursor.close()
+        
+    return engine
+
+
+def pool_status(engine: Engine) -> Dict:
+    """Pool occupancy and checkout wait statistics for ``engine`` (sync or async)"""
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if not isinstance(pool, QueuePool):
+        return status
+        
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    checked_out = pool.checkedout()
+    status.update(
+        size=pool.size(),
+        max_overflow=pool._max_overflow,
+        checked_out=checked_out,
+        checked_in=pool.checkedin(),
+        overflow=pool.overflow(),
+        utilization=checked_out / capacity if capacity else 0.0
+    )
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            status.update(
+                checkouts=pool.checkouts,
+                checkout_timeouts=pool.checkout_timeouts,
+                avg_wait_seconds=pool.total_wait_seconds / pool.checkouts if pool.checkouts else 0.0,
+                max_wait_seconds=pool.max_wait_seconds
+            )
+    return status
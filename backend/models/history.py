@@ -1,10 +1,39 @@
-from sqlalchemy import Column, String, DateTime, CheckConstraint, ForeignKeyConstraint, Index, Text
+from sqlalchemy import Column, String, DateTime, CheckConstraint, ForeignKeyConstraint, Index, Text, insert
 from sqlalchemy.orm import relationship
 from .database import Base
-from typing import Dict, Optional
+from .sequence import history_sequence
+from typing import Dict, Optional, Tuple
 from datetime import datetime
 import json
 
+IMAGE_FORMAT_FULL = "J"
+IMAGE_FORMAT_DELTA = "D"
+REMOVED_KEYS = "__removed__"
+
+
+def encode_images(before_data: Optional[Dict], after_data: Optional[Dict]) -> Tuple[Optional[str], Optional[str]]:
+    """Compact JSON for the before image and only the changed fields for the after image"""
+    before_image = json.dumps(before_data, separators=(",", ":")) if before_data else None
+    if not after_data:
+        return before_image, None
+    
+    base = before_data or {}
+    delta = {key: value for key, value in after_data.items() if key not in base or base[key] != value}
+    removed = [key for key in base if key not in after_data]
+    if removed:
+        delta[REMOVED_KEYS] = removed
+    return before_image, json.dumps(delta, separators=(",", ":"))
+
+
+def decode_after_image(before_data: Optional[Dict], after_image: str) -> Dict:
+    delta = json.loads(after_image)
+    after_data = dict(before_data or {})
+    for key in delta.pop(REMOVED_KEYS, []):
+        after_data.pop(key, None)
+    after_data.update(delta)
+    return after_data
+
+
 class History(Base):
     __tablename__ = "history"
     
@@ -17,6 +46,7 @@ class History(Base):
     action_code = Column(String(1), CheckConstraint("action_code IN ('A', 'C', 'D')"))
     before_image = Column(Text)
     after_image = Column(Text)
+    image_format = Column(String(1), CheckConstraint("image_format IN ('J', 'D')"))
     reason_code = Column(String(4))
     
     process_date = Column(DateTime)
@@ -33,56 +63,98 @@ class History(Base):
         Index('idx_history_date', 'date'),
         Index('idx_history_record_type', 'record_type'),
         Index('idx_history_action_code', 'action_code'),
+        Index('idx_history_portfolio_process_date', 'portfolio_id', 'process_date'),
     )
     
     @classmethod
     def create_audit_record(cls, portfolio_id: str, record_type: str, action_code: str, 
                            before_data: Optional[Dict] = None, after_data: Optional[Dict] = None,
                            reason_code: str = "AUTO", user: str = "SYSTEM", db_session=None):
-        now = datetime.now()
-        date_str = now.strftime("%Y%m%d")
-        time_str = now.strftime("%H%M%S%f")[:8]
-        
-        seq_no = "0001"
         if db_session:
-            existing_count = db_session.query(cls).filter(
-                cls.portfolio_id == portfolio_id,
-                cls.date == date_str,
-                cls.time == time_str
-            ).count()
-            seq_no = f"{existing_count + 1:04d}"
+            history_sequence.ensure_reconciled(db_session)
         
-        return cls(
+        return cls(**cls.build_audit_values(
             portfolio_id=portfolio_id,
-            date=date_str,
-            time=time_str,
-            seq_no=seq_no,
             record_type=record_type,
             action_code=action_code,
-            before_image=json.dumps(before_data) if before_data else None,
-            after_image=json.dumps(after_data) if after_data else None,
+            before_data=before_data,
+            after_data=after_data,
             reason_code=reason_code,
-            process_date=now,
-            process_user=user
-        )
+            user=user
+        ))
+    
+    @classmethod
+    def bulk_insert(cls):
+        """``insert(History)`` for lists of ``build_audit_values`` rows.
+        
+        NULL images are rendered rather than omitted, so rows with and without a
+        before image share one statement and go out as a single executemany.
+        """
+        return insert(cls).execution_options(render_nulls=True)
+    
+    @classmethod
+    def build_audit_values(cls, portfolio_id: str, record_type: str, action_code: str,
+                           before_data: Optional[Dict] = None, after_data: Optional[Dict] = None,
+                           reason_code: str = "AUTO", user: str = "SYSTEM",
+                           now: Optional[datetime] = None) -> Dict:
+        """Column values for an audit row, usable with a bulk ``insert(History)``"""
+        now = now or datetime.now()
+        date_str, time_str, seq_no = history_sequence.allocate(portfolio_id, now)
+        before_image, after_image = encode_images(before_data, after_data)
+        return {
+            "portfolio_id": portfolio_id,
+            "date": date_str,
+            "time": time_str,
+            "seq_no": seq_no,
+            "record_type": record_type,
+            "action_code": action_code,
+            "before_image": before_image,
+            "after_image": after_image,
+            "image_format": IMAGE_FORMAT_DELTA,
+            "reason_code": reason_code,
+            "process_date": now,
+            "process_user": user
+        }
     
     def get_before_data(self) -> Optional[Dict]:
-        if self.before_image:
+        return self._decoded_images()[0]
+    
+    def get_after_data(self) -> Optional[Dict]:
+        return self._decoded_images()[1]
+    
+    def _decoded_images(self) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Parse both images once; the cache is keyed on the raw column values.
+        
+        The returned dicts are shared by later calls and must not be mutated.
+        """
+        source = (self.before_image, self.after_image, self.image_format)
+        cached = getattr(self, "_image_cache", None)
+        if cached is not None and cached[0] == source:
+            return cached[1]
+        
+        before_data = self._parse_image(self.before_image)
+        if self.image_format == IMAGE_FORMAT_DELTA and self.after_image:
             try:
-                return json.loads(self.before_image)
+                after_data = decode_after_image(before_data, self.after_image)
             except json.JSONDecodeError:
-                return None
-        return None
+                after_data = None
+        else:
+            after_data = self._parse_image(self.after_image)
+        
+        self._image_cache = (source, (before_data, after_data))
+        return before_data, after_data
     
-    def get_after_data(self) -> Optional[Dict]:
-        if self.after_image:
+    @staticmethod
+    def _parse_image(image: Optional[str]) -> Optional[Dict]:
+        if image:
             try:
-                return json.loads(self.after_image)
+                return json.loads(image)
             except json.JSONDecodeError:
                 return None
         return None
     
     def to_dict(self) -> Dict:
+        before_data, after_data = self._decoded_images()
         return {
             "portfolio_id": self.portfolio_id,
             "date": self.date,
@@ -90,8 +162,8 @@ class History(Base):
             "seq_no": self.seq_no,
             "record_type": self.record_type,
             "action_code": self.action_code,
-            "before_data": self.get_before_data(),
-            "after_data": self.get_after_data(),
+            "before_data": before_data,
+            "after_data": after_data,
             "reason_code": self.reason_code,
             "process_date": self.process_date.isoformat() if self.process_date else None,
             "process_user": self.process_user
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, String, DateTime, Text, CheckConstraint, Index
+from .database import Base
+from typing import Dict, Optional
+import json
+
+
+class IdempotencyKey(Base):
+    """Outcome of a submitted transaction, keyed by the client's idempotency key.
+    
+    The primary key is the unique index that decides which of two concurrent
+    submissions of the same key wins. ``claimed_at`` is when the current owner
+    of a ``pending`` key claimed it, so a claim left by a crashed request can
+    be recognised as stale and taken over.
+    """
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(64), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(10), CheckConstraint("status IN ('pending', 'processed', 'failed', 'rejected')"),
+                    nullable=False)
+    result = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    claimed_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_idempotency_created_at', 'created_at'),
+    )
+    
+    def get_result(self) -> Optional[Dict]:
+        return json.loads(self.result) if self.result else None
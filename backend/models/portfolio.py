@@ -1,6 +1,7 @@
 from pydantic import BaseModel
-from typing import List
-from datetime import datetime
+from typing import List, Optional
+from datetime import date, datetime, time
+from decimal import Decimal
 
 
 class PortfolioHolding(BaseModel):
@@ -42,3 +43,44 @@ class TransactionResponse(BaseModel):
     accountNumber: str
     transactions: List[dict]
     message: str
+    nextCursor: Optional[str] = None
+
+
+class HistoryResponse(BaseModel):
+    portfolioId: str
+    records: List[dict]
+    message: str
+    nextCursor: Optional[str] = None
+
+
+class TransactionSubmission(BaseModel):
+    date: date
+    time: time
+    portfolioId: str
+    sequenceNo: str
+    investmentId: Optional[str] = None
+    type: str
+    quantity: Optional[Decimal] = None
+    price: Optional[Decimal] = None
+    amount: Optional[Decimal] = None
+    currency: Optional[str] = None
+    targetPortfolioId: Optional[str] = None
+    processUser: Optional[str] = None
+    idempotencyKey: Optional[str] = None
+
+
+class BulkTransactionSubmission(BaseModel):
+    transactions: List[TransactionSubmission]
+
+
+class TransactionIngestResult(BaseModel):
+    idempotencyKey: str
+    status: str
+    errors: List[str]
+    transaction: Optional[dict] = None
+    replayed: bool
+
+
+class BulkTransactionIngestResponse(BaseModel):
+    results: List[TransactionIngestResult]
+    counts: dict
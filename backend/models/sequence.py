@@ -0,0 +1,109 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import and_, func, select
+
+
+class HistorySequenceAllocator:
+    """Allocates History ``seq_no`` values in memory instead of counting rows.
+
+    Keys are ``(portfolio_id, date, time)`` where ``time`` has 1/100s resolution.
+    Only the latest slot per portfolio is kept, so memory is O(portfolios).
+    Worker processes share the key space without coordinating: worker ``w`` of
+    ``n`` only hands out numbers congruent to ``w + 1`` modulo ``n``. Slots never
+    move backwards for a portfolio, which protects against clock skew after a
+    restart once the allocator has been reconciled with the database.
+    """
+
+    MAX_SEQ_NO = 9999
+    SLOT_TICK = timedelta(microseconds=10000)
+
+    def __init__(self, worker_id: int = 0, worker_count: int = 1):
+        self._lock = threading.Lock()
+        self._slots: Dict[str, Tuple[str, str, int]] = {}
+        self._reconciled = False
+        self.configure(worker_id, worker_count)
+
+    @classmethod
+    def from_env(cls) -> "HistorySequenceAllocator":
+        return cls(
+            worker_id=int(os.getenv("HISTORY_SEQ_WORKER_ID", "0")),
+            worker_count=int(os.getenv("HISTORY_SEQ_WORKER_COUNT", "1"))
+        )
+
+    def configure(self, worker_id: int, worker_count: int):
+        if worker_count < 1 or not 0 <= worker_id < worker_count:
+            raise ValueError("worker_id must be in range 0..worker_count-1")
+        if worker_count > self.MAX_SEQ_NO:
+            raise ValueError(f"worker_count cannot exceed {self.MAX_SEQ_NO}")
+        with self._lock:
+            self.worker_id = worker_id
+            self.worker_count = worker_count
+            self._slots.clear()
+            self._reconciled = False
+
+    def allocate(self, portfolio_id: str, now: Optional[datetime] = None) -> Tuple[str, str, str]:
+        """Return ``(date, time, seq_no)`` strings for a new History row"""
+        now = now or datetime.now()
+        with self._lock:
+            date_str, time_str = self._slot(now)
+            last = self._slots.get(portfolio_id)
+            if last and (last[0], last[1]) >= (date_str, time_str):
+                date_str, time_str, last_seq = last
+                seq = self._next_seq(last_seq)
+            else:
+                seq = self._next_seq(0)
+
+            if seq > self.MAX_SEQ_NO:
+                next_slot = datetime.strptime(date_str + time_str + "0000", "%Y%m%d%H%M%S%f") + self.SLOT_TICK
+                date_str, time_str = self._slot(next_slot)
+                seq = self._next_seq(0)
+
+            self._slots[portfolio_id] = (date_str, time_str, seq)
+            return date_str, time_str, f"{seq:04d}"
+
+    def ensure_reconciled(self, db_session):
+        if not self._reconciled:
+            self.reconcile(db_session)
+
+    def reconcile(self, db_session):
+        """Seed the latest slot per portfolio from rows dated today or later"""
+        from .history import History
+
+        slot = History.date.concat(History.time)
+        latest = select(
+            History.portfolio_id,
+            func.max(slot).label("slot")
+        ).where(
+            History.date >= datetime.now().strftime("%Y%m%d")
+        ).group_by(History.portfolio_id).subquery()
+
+        rows = db_session.execute(
+            select(History.portfolio_id, History.date, History.time, func.max(History.seq_no))
+            .join(latest, and_(History.portfolio_id == latest.c.portfolio_id, slot == latest.c.slot))
+            .group_by(History.portfolio_id, History.date, History.time)
+        )
+
+        with self._lock:
+            for portfolio_id, date_str, time_str, max_seq in rows:
+                current = self._slots.get(portfolio_id)
+                candidate = (date_str, time_str, int(max_seq))
+                if not current or candidate > current:
+                    self._slots[portfolio_id] = candidate
+            self._reconciled = True
+
+    def _next_seq(self, last_seq: int) -> int:
+        """Smallest number above ``last_seq`` in this worker's residue class"""
+        first = self.worker_id + 1
+        if last_seq < first:
+            return first
+        steps = (last_seq - first) // self.worker_count + 1
+        return first + steps * self.worker_count
+
+    @staticmethod
+    def _slot(moment: datetime) -> Tuple[str, str]:
+        return moment.strftime("%Y%m%d"), moment.strftime("%H%M%S%f")[:8]
+
+
+history_sequence = HistorySequenceAllocator.from_env()
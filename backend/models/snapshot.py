@@ -0,0 +1,39 @@
+from sqlalchemy import Column, String, Date, Time, DateTime, LargeBinary, ForeignKeyConstraint
+from .database import Base
+from typing import Optional, Tuple
+
+
+class PortfolioSnapshot(Base):
+    """Serialized replay state of one portfolio as of a checkpoint transaction.
+    
+    The checkpoint is the position of the last transaction folded into
+    ``state`` in processing order: its ``process_date`` followed by its full
+    ``(date, time, portfolio_id, sequence_no)`` key. For an incoming transfer
+    that key is the sending portfolio's. All checkpoint columns are NULL for a
+    snapshot taken before the portfolio had any processed transactions.
+    """
+    __tablename__ = "portfolio_snapshots"
+    
+    portfolio_id = Column(String(8), primary_key=True)
+    taken_at = Column(DateTime, primary_key=True)
+    
+    checkpoint_process_date = Column(DateTime)
+    checkpoint_date = Column(Date)
+    checkpoint_time = Column(Time)
+    checkpoint_portfolio_id = Column(String(8))
+    checkpoint_sequence_no = Column(String(6))
+    state = Column(LargeBinary, nullable=False)
+    
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['portfolio_id'],
+            ['portfolios.port_id']
+        ),
+    )
+    
+    @property
+    def checkpoint(self) -> Optional[Tuple]:
+        if self.checkpoint_process_date is None:
+            return None
+        return (self.checkpoint_process_date, self.checkpoint_date, self.checkpoint_time,
+                self.checkpoint_portfolio_id, self.checkpoint_sequence_no)
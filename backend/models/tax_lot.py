@@ -0,0 +1,97 @@
+from sqlalchemy import Column, String, Numeric, Date, Time, CheckConstraint, ForeignKeyConstraint, Index
+from .database import Base
+from typing import Dict, Tuple
+
+
+class TaxLot(Base):
+    """Shares of one investment acquired by a single buy transaction.
+    
+    A lot is keyed by its buy transaction. Sells reduce ``remaining_quantity``
+    and ``cost_basis`` (the cost of the remaining shares) until the lot is
+    closed.
+    """
+    __tablename__ = "tax_lots"
+    
+    portfolio_id = Column(String(8), primary_key=True)
+    investment_id = Column(String(10), primary_key=True)
+    date = Column(Date, primary_key=True)
+    time = Column(Time, primary_key=True)
+    sequence_no = Column(String(6), primary_key=True)
+    
+    quantity = Column(Numeric(15, 4), nullable=False)
+    remaining_quantity = Column(Numeric(15, 4), nullable=False)
+    cost_basis = Column(Numeric(15, 2), nullable=False)
+    currency = Column(String(3))
+    status = Column(String(1), CheckConstraint("status IN ('O', 'C')"), nullable=False)
+    
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['portfolio_id'],
+            ['portfolios.port_id']
+        ),
+        Index('idx_tax_lot_open', 'portfolio_id', 'investment_id', 'status'),
+    )
+    
+    @property
+    def key(self) -> Tuple:
+        """Acquisition key ``(date, time, sequence_no)``; lots sort by it"""
+        return self.date, self.time, self.sequence_no
+        
+    def to_dict(self) -> Dict:
+        return {
+            "portfolio_id": self.portfolio_id,
+            "investment_id": self.investment_id,
+            "date": self.date.isoformat() if self.date else None,
+            "time": self.time.isoformat() if self.time else None,
+            "sequence_no": self.sequence_no,
+            "quantity": float(self.quantity) if self.quantity is not None else None,
+            "remaining_quantity": float(self.remaining_quantity) if self.remaining_quantity is not None else None,
+            "cost_basis": float(self.cost_basis) if self.cost_basis is not None else None,
+            "currency": self.currency,
+            "status": self.status
+        }
+
+
+class RealizedGain(Base):
+    """The part of a sell matched against one lot"""
+    __tablename__ = "realized_gains"
+    
+    portfolio_id = Column(String(8), primary_key=True)
+    date = Column(Date, primary_key=True)
+    time = Column(Time, primary_key=True)
+    sequence_no = Column(String(6), primary_key=True)
+    lot_date = Column(Date, primary_key=True)
+    lot_time = Column(Time, primary_key=True)
+    lot_sequence_no = Column(String(6), primary_key=True)
+    
+    investment_id = Column(String(10), nullable=False)
+    quantity = Column(Numeric(15, 4), nullable=False)
+    proceeds = Column(Numeric(15, 2), nullable=False)
+    cost_basis = Column(Numeric(15, 2), nullable=False)
+    gain = Column(Numeric(15, 2), nullable=False)
+    method = Column(String(4), CheckConstraint("method IN ('FIFO', 'LIFO', 'SPEC')"), nullable=False)
+    
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['portfolio_id'],
+            ['portfolios.port_id']
+        ),
+        Index('idx_realized_gain_investment', 'portfolio_id', 'investment_id'),
+    )
+    
+    def to_dict(self) -> Dict:
+        return {
+            "portfolio_id": self.portfolio_id,
+            "investment_id": self.investment_id,
+            "date": self.date.isoformat() if self.date else None,
+            "time": self.time.isoformat() if self.time else None,
+            "sequence_no": self.sequence_no,
+            "lot_date": self.lot_date.isoformat() if self.lot_date else None,
+            "lot_time": self.lot_time.isoformat() if self.lot_time else None,
+            "lot_sequence_no": self.lot_sequence_no,
+            "quantity": float(self.quantity) if self.quantity is not None else None,
+            "proceeds": float(self.proceeds) if self.proceeds is not None else None,
+            "cost_basis": float(self.cost_basis) if self.cost_basis is not None else None,
+            "gain": float(self.gain) if self.gain is not None else None,
+            "method": self.method
+        }
@@ -19,18 +19,23 @@ class Transaction(Base):
     price = Column(Numeric(15, 4))
     amount = Column(Numeric(15, 2))
     currency = Column(String(3))
+    target_portfolio_id = Column(String(8))
     status = Column(String(1), CheckConstraint("status IN ('P', 'D', 'F', 'R')"))
     
     process_date = Column(DateTime)
     process_user = Column(String(8))
     
-    portfolio = relationship("Portfolio", back_populates="transactions")
+    portfolio = relationship("Portfolio", back_populates="transactions", foreign_keys=[portfolio_id])
     
     __table_args__ = (
         ForeignKeyConstraint(
             ['portfolio_id'], 
             ['portfolios.port_id']
         ),
+        ForeignKeyConstraint(
+            ['target_portfolio_id'],
+            ['portfolios.port_id']
+        ),
         Index('idx_transaction_portfolio_id', 'portfolio_id'),
         Index('idx_transaction_date', 'date'),
         Index('idx_transaction_investment_id', 'investment_id'),
@@ -69,6 +74,14 @@ class Transaction(Base):
         if self.type in ['BU', 'SL'] and (not self.price or self.price <= 0):
             errors.append("Positive price required for buy/sell transactions")
             
+        if self.type == 'TR':
+            if not self.target_portfolio_id or len(self.target_portfolio_id) != 8:
+                errors.append("Target portfolio ID must be 8 characters for transfers")
+            elif self.target_portfolio_id == self.portfolio_id:
+                errors.append("Transfer target must differ from the source portfolio")
+            if not self.amount or self.amount <= 0:
+                errors.append("Positive amount required for transfers")
+                
         return {"valid": len(errors) == 0, "errors": errors}
     
     def can_transition_to(self, new_status: str) -> bool:
@@ -103,6 +116,7 @@ class Transaction(Base):
             "price": float(self.price) if self.price else 0.0,
             "amount": float(self.amount) if self.amount else 0.0,
             "currency": self.currency,
+            "target_portfolio_id": self.target_portfolio_id,
             "status": self.status,
             "process_date": self.process_date.isoformat() if self.process_date else None,
             "process_user": self.process_user
@@ -0,0 +1,34 @@
+"""
+Periodic full recompute of Portfolio.total_value.
+
+PortfolioService keeps totals up to date incrementally; this script recomputes
+them from the positions table and reports (or fixes) any drift.
+"""
+import argparse
+import sys
+from decimal import Decimal
+from models import SessionLocal
+from services import PortfolioService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fix", action="store_true", help="overwrite drifted totals with the recomputed value")
+    parser.add_argument("--tolerance", type=Decimal, default=Decimal("0.00"), help="ignore drift up to this amount")
+    args = parser.parse_args()
+    
+    session = SessionLocal()
+    try:
+        drifted = PortfolioService(session).reconcile_total_values(fix=args.fix, tolerance=args.tolerance)
+    finally:
+        session.close()
+        
+    for item in drifted:
+        print(f"{item['port_id']}/{item['account_no']}: stored={item['stored']} "
+              f"expected={item['expected']} drift={item['drift']}")
+    print(f"{len(drifted)} portfolio(s) drifted" + (" and were fixed" if args.fix and drifted else ""))
+    return 1 if drifted and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Rebuild positions and cash balances from the transaction log.
+
+Each portfolio starts from its latest snapshot and replays the processed
+transactions after it. By default the replayed state is only compared with
+the live tables; --rebuild overwrites drifted rows and --snapshot records a
+new checkpoint so the next replay starts from there. --rebuild skips
+portfolios that have no snapshot yet; run --snapshot first to baseline them.
+"""
+import argparse
+import sys
+from decimal import Decimal
+from models import SessionLocal
+from services.replay import ReplayEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--portfolio", action="append", dest="portfolios", metavar="PORT_ID",
+                        help="only replay this portfolio (repeatable); default is every portfolio")
+    parser.add_argument("--rebuild", action="store_true", help="overwrite drifted live state with the replayed state")
+    parser.add_argument("--snapshot", action="store_true", help="checkpoint the replayed state afterwards")
+    parser.add_argument("--tolerance", type=Decimal, default=Decimal("0.00"),
+                        help="ignore differences up to this amount when verifying")
+    args = parser.parse_args()
+    
+    session = SessionLocal()
+    try:
+        engine = ReplayEngine(session)
+        skipped = []
+        if args.rebuild:
+            skipped = engine.unbaselined(args.portfolios)
+            drifted = engine.rebuild(args.portfolios)
+        else:
+            drifted = engine.verify(args.portfolios, tolerance=args.tolerance)
+        snapshots = engine.snapshot(args.portfolios) if args.snapshot else 0
+    finally:
+        session.close()
+        
+    for item in drifted:
+        position = f" {item['investment_id']}@{item['date']}" if item["investment_id"] else ""
+        print(f"{item['port_id']}{position} {item['field']}: live={item['live']} replayed={item['replayed']}")
+    print(f"{len(drifted)} difference(s)" + (" rebuilt" if args.rebuild and drifted else ""))
+    if skipped:
+        print(f"{len(skipped)} portfolio(s) without a snapshot not rebuilt: {', '.join(skipped)}; "
+              "run with --snapshot first")
+    if args.snapshot:
+        print(f"{snapshots} snapshot(s) written")
+    return 1 if drifted and not args.rebuild else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,84 +1,146 @@
-from fastapi import APIRouter, HTTPException
-from models.portfolio import PortfolioSummary, PortfolioHolding
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import get_async_db, get_async_session_factory
+from models.portfolio import HistoryResponse, PortfolioSummary, TransactionResponse
+from services import AsyncPortfolioService
 from validation.portfolio import validate_account_number
-from datetime import datetime
-from typing import List
+from datetime import date, datetime
+from typing import Optional
+import json
 
 router = APIRouter(prefix="/api", tags=["portfolio"])
 
-
-def generate_mock_portfolio(account_number: str) -> PortfolioSummary:
-    """Generate mock portfolio data matching the frontend's mock data structure"""
-    holdings = [
-        PortfolioHolding(
-            symbol="AAPL",
-            name="Apple Inc.",
-            shares=150,
-            currentPrice=185.25,
-            marketValue=27787.50,
-            gainLoss=2287.50,
-            gainLossPercent=8.97,
-        ),
-        PortfolioHolding(
-            symbol="MSFT",
-            name="Microsoft Corporation",
-            shares=100,
-            currentPrice=378.85,
-            marketValue=37885.00,
-            gainLoss=3885.00,
-            gainLossPercent=11.42,
-        ),
-        PortfolioHolding(
-            symbol="GOOGL",
-            name="Alphabet Inc.",
-            shares=75,
-            currentPrice=142.56,
-            marketValue=10692.00,
-            gainLoss=692.00,
-            gainLossPercent=6.92,
-        ),
-        PortfolioHolding(
-            symbol="TSLA",
-            name="Tesla Inc.",
-            shares=200,
-            currentPrice=245.67,
-            marketValue=49134.00,
-            gainLoss=1386.00,
-            gainLossPercent=2.90,
-        ),
-    ]
-    
-    return PortfolioSummary(
-        accountNumber=account_number,
-        totalValue=125750.50,
-        totalGainLoss=8250.50,
-        totalGainLossPercent=7.02,
-        holdings=holdings,
-        lastUpdated=datetime.now().strftime("%B %d, %Y, %I:%M %p"),
-    )
+STREAM_LINES_PER_CHUNK = 500
 
 
 @router.get("/portfolio/{account_number}", response_model=PortfolioSummary)
-async def get_portfolio(account_number: str):
+async def get_portfolio(account_number: str, db: AsyncSession = Depends(get_async_db)):
     """Get portfolio summary and holdings for an account"""
     # Removed account validation - IDOR vulnerability
     # is_valid, message = validate_account_number(account_number)
     # if not is_valid:
     #     raise HTTPException(status_code=400, detail=message)
     
-    return generate_mock_portfolio(account_number)
+    summary = await AsyncPortfolioService(db).get_portfolio_summary(account_number)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return summary
 
 
-@router.get("/transactions/{account_number}")
-async def get_transactions(account_number: str):
-    """Get transaction history for an account (placeholder)"""
+@router.get("/transactions/{account_number}", response_model=TransactionResponse)
+async def get_transactions(
+    account_number: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get transaction history for an account, one keyset page at a time"""
     # Removed account validation - IDOR vulnerability
     # is_valid, message = validate_account_number(account_number)
     # if not is_valid:
     #     raise HTTPException(status_code=400, detail=message)
     
-    return {
-        "accountNumber": account_number,
-        "transactions": [],
-        "message": "Transaction history endpoint - placeholder implementation"
-    }
+    try:
+        transactions, next_cursor = await AsyncPortfolioService(db).list_transactions(
+            account_number,
+            limit=limit,
+            cursor=cursor,
+            from_date=from_date,
+            to_date=to_date,
+            transaction_type=type,
+            status=status
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return TransactionResponse(
+        accountNumber=account_number,
+        transactions=transactions,
+        message=f"Returned {len(transactions)} transactions",
+        nextCursor=next_cursor
+    )
+
+
+@router.get("/history/{portfolio_id}", response_model=HistoryResponse)
+async def get_history(
+    portfolio_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    from_time: Optional[datetime] = None,
+    to_time: Optional[datetime] = None,
+    record_type: Optional[str] = None,
+    action_code: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a portfolio's audit trail in process time order, one keyset page at a time"""
+    try:
+        records, next_cursor = await AsyncPortfolioService(db).list_history(
+            portfolio_id,
+            limit=limit,
+            cursor=cursor,
+            from_time=from_time,
+            to_time=to_time,
+            record_type=record_type,
+            action_code=action_code
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+        
+    return HistoryResponse(
+        portfolioId=portfolio_id,
+        records=records,
+        message=f"Returned {len(records)} history records",
+        nextCursor=next_cursor
+    )
+
+
+@router.get("/transactions/{account_number}/stream")
+async def stream_transactions(
+    account_number: str,
+    from_date: Optional[date] = None,
+    to_date: Optional[date] = None,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    session_factory=Depends(get_async_session_factory)
+):
+    """Stream an account's full transaction history as NDJSON"""
+    # The response outlives request-scoped dependencies, so the generator owns its session
+    db = session_factory()
+    rows = AsyncPortfolioService(db).iter_transactions(
+        account_number,
+        from_date=from_date,
+        to_date=to_date,
+        transaction_type=type,
+        status=status
+    )
+    try:
+        first = await anext(rows, None)
+    except ValueError as e:
+        await db.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        await db.close()
+        raise
+    
+    async def generate():
+        try:
+            if first is None:
+                return
+            lines = [json.dumps(first.to_dict())]
+            async for transaction in rows:
+                lines.append(json.dumps(transaction.to_dict()))
+                if len(lines) >= STREAM_LINES_PER_CHUNK:
+                    yield "\n".join(lines) + "\n"
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+        finally:
+            await rows.aclose()
+            await db.close()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
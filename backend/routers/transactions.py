@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy.orm import Session
+from models import get_db
+from models.portfolio import (BulkTransactionSubmission, BulkTransactionIngestResponse, TransactionIngestResult,
+                              TransactionSubmission)
+from services.ingestion import TransactionIngestService
+from typing import Dict, Optional, Union
+
+router = APIRouter(prefix="/api", tags=["transactions"])
+
+MAX_BULK_SUBMISSIONS = 10000
+MAX_KEY_LENGTH = 64
+
+# Status code for a single submission, by ingest status
+SINGLE_STATUS_CODES = {
+    "processed": 201,
+    "failed": 422,
+    "rejected": 422,
+    "conflict": 409,
+    "pending": 202
+}
+
+
+def _submission(transaction: TransactionSubmission, key: Optional[str]) -> Dict:
+    key = transaction.idempotencyKey or key
+    if not key:
+        raise HTTPException(status_code=400, detail="An idempotency key is required for every transaction")
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency keys are at most {MAX_KEY_LENGTH} characters")
+    return {
+        "idempotency_key": key,
+        "date": transaction.date,
+        "time": transaction.time,
+        "portfolio_id": transaction.portfolioId,
+        "sequence_no": transaction.sequenceNo,
+        "investment_id": transaction.investmentId,
+        "type": transaction.type,
+        "quantity": transaction.quantity,
+        "price": transaction.price,
+        "amount": transaction.amount,
+        "currency": transaction.currency,
+        "target_portfolio_id": transaction.targetPortfolioId,
+        "process_user": transaction.processUser
+    }
+
+
+@router.post("/transactions", response_model=Union[BulkTransactionIngestResponse, TransactionIngestResult])
+def submit_transactions(
+    payload: Union[BulkTransactionSubmission, TransactionSubmission],
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Submit one transaction, or ``{"transactions": [...]}`` in bulk, exactly once.
+    
+    Each transaction carries an ``idempotencyKey``; a single submission may
+    send it as the ``Idempotency-Key`` header instead. Resubmitting a key
+    returns the original result with ``replayed`` set, so clients can retry
+    safely. A single submission answers 201 when processed, 200 on replay,
+    409 when the key was used for a different transaction and 422 when the
+    transaction is rejected or fails processing. A bulk submission always answers 200 with one
+    result per transaction, in order.
+    """
+    if isinstance(payload, BulkTransactionSubmission):
+        if len(payload.transactions) > MAX_BULK_SUBMISSIONS:
+            raise HTTPException(status_code=413,
+                                detail=f"At most {MAX_BULK_SUBMISSIONS} transactions per request")
+        submissions = [_submission(transaction, None) for transaction in payload.transactions]
+        results = TransactionIngestService(db).submit(submissions) if submissions else []
+        counts: Dict[str, int] = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        return {"results": results, "counts": counts}
+        
+    result = TransactionIngestService(db).submit([_submission(payload, idempotency_key)])[0]
+    response.status_code = 200 if result["replayed"] else SINGLE_STATUS_CODES[result["status"]]
+    return result
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from validation.batch import validate_columns, validate_records
+import json
+
+router = APIRouter(prefix="/api", tags=["validation"])
+
+
+def _validate_body(body: bytes, max_errors: int):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise ValueError("Request body must be JSON") from None
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+        
+    record_type = payload.get("recordType")
+    if isinstance(payload.get("columns"), dict):
+        columns = payload["columns"]
+        if not all(isinstance(column, list) for column in columns.values()):
+            raise ValueError("Each column must be a list")
+        return validate_columns(record_type, columns, max_errors)
+    if isinstance(payload.get("records"), list):
+        if not all(isinstance(record, dict) for record in payload["records"]):
+            raise ValueError("Each record must be an object")
+        return validate_records(record_type, payload["records"], max_errors)
+    raise ValueError("Provide either 'columns' or 'records'")
+
+
+@router.post("/validate/batch")
+async def validate_batch(request: Request, max_errors: int = Query(100000, alias="maxErrors", ge=0)):
+    """Validate a batch of portfolio, position or transaction records before loading.
+    
+    The body is ``{"recordType": ..., "columns": {field: [values]}}`` or
+    ``{"recordType": ..., "records": [{field: value}]}``; the column form is
+    faster for large files. Errors come back as ``[row, [code index, ...]]``
+    pairs that index into ``codes``.
+    """
+    body = await request.body()
+    try:
+        # Parsing and validating a large batch is CPU bound, so keep it off the event loop
+        result = await run_in_threadpool(_validate_body, body, max_errors)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The result is plain JSON types already; skip jsonable_encoder's walk over every error
+    return JSONResponse(result)
@@ -0,0 +1,50 @@
+"""
+Performance benchmarks for the service layer, model serialization and API.
+
+Runs every benchmark against a scratch SQLite database seeded with synthetic
+data and writes the results to a JSON baseline. With --compare, results are
+checked against an earlier baseline and the exit status is 1 when any
+benchmark's median latency regressed by more than --threshold.
+"""
+import argparse
+import logging
+import sys
+from benchmarks import BenchmarkEnvironment, compare, default_benchmarks, load_baseline, run_benchmarks, save_baseline
+
+
+def _print_result(name, result):
+    print(f"{name:<48} {result['median_us']:>11,.1f} us  p95 {result['p95_us']:>11,.1f} us  "
+          f"{result['ops_per_second']:>11,.0f} ops/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="benchmark-results.json", help="where to write this run's results")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline JSON to check this run against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed relative slowdown of the median before a regression is flagged")
+    parser.add_argument("--filter", default="*", help="only run benchmarks whose name matches this glob")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every benchmark's iteration count")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    
+    baseline = load_baseline(args.compare) if args.compare else None
+    with BenchmarkEnvironment() as env:
+        document = run_benchmarks(default_benchmarks(env, args.filter), scale=args.scale, progress=_print_result)
+    save_baseline(document, args.output)
+    print(f"Results written to {args.output}")
+    
+    if baseline is None:
+        return 0
+        
+    rows = compare(baseline, document, threshold=args.threshold)
+    regressions = [row for row in rows if row["regression"]]
+    for row in rows:
+        change = "n/a" if row["change"] is None else f"{row['change']:+.1%}"
+        print(f"{row['name']:<48} {change:>8}" + ("  REGRESSION" if row["regression"] else ""))
+    print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
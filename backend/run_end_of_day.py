@@ -0,0 +1,53 @@
+"""
+Parallel end-of-day transaction processing and revaluation.
+
+Pending transactions are processed through PortfolioService by a pool of
+worker processes, each owning a hash partition of the portfolio IDs. Progress
+is checkpointed per partition; rerunning for the same date resumes it. With
+--price-file, positions are then marked to market from that file.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import date
+from services.eod_runner import EndOfDayRunner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today(),
+                        help="process pending transactions dated on or before this day (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--partitions", type=int, help="hash partitions (default: one per worker)")
+    parser.add_argument("--checkpoint-dir", default="eod_checkpoints", help="where partition checkpoints are kept")
+    parser.add_argument("--portfolios-per-commit", type=int, default=100, help="portfolios per commit and checkpoint")
+    parser.add_argument("--price-file", help="CSV or Parquet prices to revalue positions with after processing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    
+    stats = EndOfDayRunner(
+        workers=args.workers,
+        partitions=args.partitions,
+        checkpoint_dir=args.checkpoint_dir,
+        portfolios_per_commit=args.portfolios_per_commit,
+        process_date=args.date,
+        price_file=args.price_file
+    ).run()
+    
+    for partition in stats["partitions"]:
+        print(f"partition {partition['partition']}: {partition['portfolios']} portfolios, "
+              f"{partition['processed']} processed, {partition['failed']} failed"
+              + (" (resumed)" if partition["resumed"] else ""))
+    for error in stats["errors"]:
+        print(f"{error['portfolio_id']}/{error['sequence_no']}: {'; '.join(error['errors'])}")
+    if stats["revaluation"]:
+        print(f"revalued {stats['revaluation']['positions_updated']} positions in "
+              f"{stats['revaluation']['portfolios_updated']} portfolios")
+    print(f"{stats['processed']} processed, {stats['failed']} failed in {stats['elapsed_seconds']:.2f}s "
+          f"({stats['transactions_per_second']:,.0f} transactions/sec)")
+    return 0 if stats["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
 from .portfolio_service import PortfolioService
+from .async_portfolio_service import AsyncPortfolioService
+from .audit_sink import AuditSink
 
-__all__ = ["PortfolioService"]
+__all__ = ["PortfolioService", "AsyncPortfolioService", "AuditSink"]
@@ -0,0 +1,155 @@
+import numpy as np
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import BigInteger, cast, func, select
+from sqlalchemy.orm import Session
+from models import Portfolio, Position
+
+CENTS = 100
+QUANTITY_SCALE = 10000
+
+
+def _scaled(column, scale: int):
+    """Column as an integer count of 1/scale units; NULL becomes 0"""
+    return func.coalesce(cast(func.round(column * scale), BigInteger), 0)
+
+
+def _to_scaled(value: Optional[Decimal], scale: int) -> int:
+    return int((value or Decimal('0')) * scale)
+
+
+class PositionFrame:
+    """Position columns as NumPy arrays in scaled-integer form.
+    
+    Money is held in int64 cents and quantity in 1/10000 units, matching the
+    Numeric(15, 2) and Numeric(15, 4) columns, so sums are exact.
+    """
+    
+    def __init__(self, portfolio_id: np.ndarray, investment_id: np.ndarray, quantity: np.ndarray,
+                 cost_basis: np.ndarray, market_value: np.ndarray, status: np.ndarray, currency: np.ndarray):
+        self.portfolio_id = portfolio_id
+        self.investment_id = investment_id
+        self.quantity = quantity
+        self.cost_basis = cost_basis
+        self.market_value = market_value
+        self.status = status
+        self.currency = currency
+        
+    def __len__(self) -> int:
+        return len(self.portfolio_id)
+        
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple]) -> "PositionFrame":
+        """Build from ``(portfolio_id, investment_id, quantity, cost_basis, market_value, status, currency)``
+        tuples whose numeric fields are already scaled integers"""
+        columns = list(zip(*rows)) or [()] * 7
+        return cls(
+            np.array(columns[0], dtype=object),
+            np.array(columns[1], dtype=object),
+            np.array(columns[2], dtype=np.int64),
+            np.array(columns[3], dtype=np.int64),
+            np.array(columns[4], dtype=np.int64),
+            np.array(columns[5], dtype="U1"),
+            np.array(columns[6], dtype="U3")
+        )
+        
+    @classmethod
+    def from_positions(cls, positions: Iterable[Position]) -> "PositionFrame":
+        return cls.from_rows(
+            (p.portfolio_id, p.investment_id, _to_scaled(p.quantity, QUANTITY_SCALE),
+             _to_scaled(p.cost_basis, CENTS), _to_scaled(p.market_value, CENTS), p.status or "", p.currency or "")
+            for p in positions
+        )
+        
+    @classmethod
+    def load(cls, db: Session, portfolio_ids: Optional[List[str]] = None,
+             batch_size: int = 50000) -> "PositionFrame":
+        """Load positions with the scaling done in SQL, so no Decimal objects are built"""
+        query = select(
+            Position.portfolio_id,
+            Position.investment_id,
+            _scaled(Position.quantity, QUANTITY_SCALE),
+            _scaled(Position.cost_basis, CENTS),
+            _scaled(Position.market_value, CENTS),
+            func.coalesce(Position.status, ""),
+            func.coalesce(Position.currency, "")
+        )
+        if portfolio_ids is not None:
+            query = query.where(Position.portfolio_id.in_(portfolio_ids))
+        result = db.execute(query.execution_options(yield_per=batch_size))
+        return cls.from_rows(row for partition in result.partitions() for row in partition)
+
+
+def load_cash_balances(db: Session, portfolio_ids: Optional[List[str]] = None) -> Dict[str, int]:
+    """Cash balance per portfolio in cents"""
+    query = select(Portfolio.port_id, _scaled(Portfolio.cash_balance, CENTS))
+    if portfolio_ids is not None:
+        query = query.where(Portfolio.port_id.in_(portfolio_ids))
+    return dict(db.execute(query).all())
+
+
+def gain_loss(frame: PositionFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized Position.calculate_gain_loss.
+    
+    Returns gain/loss in cents and gain/loss percent in hundredths of a
+    percent, rounded half-even like ``Decimal.quantize(Decimal('0.01'))``.
+    Rows without both a cost basis and a market value get zeros.
+    """
+    valued = (frame.cost_basis != 0) & (frame.market_value != 0)
+    gain = np.where(valued, frame.market_value - frame.cost_basis, 0)
+    
+    # gain * 10000 / cost can overflow int64, so divide in two exact steps
+    sign = np.where(frame.cost_basis < 0, -1, 1)
+    numerator = gain * sign
+    denominator = np.where(valued, frame.cost_basis * sign, 1)
+    whole, remainder = np.divmod(numerator * 100, denominator)
+    fraction, remainder = np.divmod(remainder * 100, denominator)
+    percent = whole * 100 + fraction
+    twice = remainder * 2
+    percent += (twice > denominator) | ((twice == denominator) & (percent % 2 == 1))
+    return gain, np.where(valued, percent, 0)
+
+
+def portfolio_totals(frame: PositionFrame, cash_balances: Optional[Dict[str, int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized Portfolio.calculate_total_value for every portfolio.
+    
+    Returns sorted portfolio ids and their totals in cents: active market
+    value plus cash. Portfolios that only appear in ``cash_balances`` are included.
+    """
+    cash_balances = cash_balances or {}
+    ids = np.array(sorted(set(frame.portfolio_id.tolist()) | set(cash_balances)), dtype=object)
+    totals = np.array([cash_balances.get(portfolio_id, 0) for portfolio_id in ids], dtype=np.int64)
+    if len(frame):
+        index = np.searchsorted(ids, frame.portfolio_id)
+        np.add.at(totals, index, np.where(frame.status == "A", frame.market_value, 0))
+    return ids, totals
+
+
+def analyze(frame: PositionFrame, cash_balances: Optional[Dict[str, int]] = None) -> Dict[str, np.ndarray]:
+    """Gain/loss, gain %, per-portfolio totals and portfolio weights in one pass.
+    
+    ``weight`` is each position's share of its portfolio's total value
+    (inactive positions weigh 0). Money fields are int64 cents; use
+    ``to_decimal`` to compare them with the Decimal model methods.
+    """
+    gain, percent = gain_loss(frame)
+    ids, totals = portfolio_totals(frame, cash_balances)
+    
+    weight = np.zeros(len(frame), dtype=np.float64)
+    if len(frame):
+        position_totals = totals[np.searchsorted(ids, frame.portfolio_id)]
+        active = (frame.status == "A") & (position_totals != 0)
+        np.divide(frame.market_value, position_totals, out=weight, where=active)
+        
+    return {
+        "gain_loss": gain,
+        "gain_loss_percent": percent,
+        "weight": weight,
+        "portfolio_id": ids,
+        "total_value": totals
+    }
+
+
+def to_decimal(scaled: int, scale: int = CENTS) -> Decimal:
+    """Convert one scaled integer back to a Decimal with matching places"""
+    return Decimal(int(scaled)).scaleb(-len(str(scale)) + 1)
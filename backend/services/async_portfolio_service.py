@@ -0,0 +1,68 @@
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Transaction
+from models.portfolio import PortfolioSummary
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import date, datetime
+from .cache import TTLCache, portfolio_cache
+from .history_archive import HistoryArchive, history_archive, merge_history
+from .portfolio_service import (build_portfolio_summary, history_cursor, history_page, history_statement,
+                                portfolio_summary_statement, transactions_page, transactions_statement)
+
+
+class AsyncPortfolioService:
+    """Read paths of PortfolioService over an AsyncSession.
+    
+    Queries await the database instead of blocking the event loop, so one
+    worker can serve many slow reads concurrently. Results and the summary
+    cache are shared with the synchronous service.
+    """
+    
+    def __init__(self, db: AsyncSession, cache: Optional[TTLCache] = portfolio_cache,
+                 archive: Optional[HistoryArchive] = history_archive):
+        self.db = db
+        self.cache = cache
+        self.archive = archive
+        
+    async def get_portfolio_summary(self, account_no: str) -> Optional[PortfolioSummary]:
+        """Summary and holdings for an account, served from the cache when possible"""
+        if self.cache is None:
+            return await self._load_portfolio_summary(account_no)
+        return await self.cache.get_or_load_async(account_no, lambda: self._load_portfolio_summary(account_no))
+        
+    async def _load_portfolio_summary(self, account_no: str) -> Optional[PortfolioSummary]:
+        result = await self.db.execute(portfolio_summary_statement(account_no))
+        portfolios = result.unique().scalars().all()
+        if not portfolios:
+            return None
+        return build_portfolio_summary(account_no, portfolios)
+        
+    async def list_transactions(self, account_no: str, limit: int = 100, cursor: Optional[str] = None,
+                                from_date: Optional[date] = None, to_date: Optional[date] = None,
+                                transaction_type: Optional[str] = None, status: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of an account's transactions; see PortfolioService.list_transactions"""
+        statement = transactions_statement(account_no, from_date, to_date, transaction_type, status, cursor)
+        rows = (await self.db.execute(statement.limit(limit + 1))).scalars().all()
+        return transactions_page(rows, limit)
+        
+    async def list_history(self, portfolio_id: str, limit: int = 100, cursor: Optional[str] = None,
+                           from_time: Optional[datetime] = None, to_time: Optional[datetime] = None,
+                           record_type: Optional[str] = None, action_code: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of a portfolio's audit trail; see PortfolioService.list_history"""
+        statement = history_statement(portfolio_id, from_time, to_time, record_type, action_code, cursor)
+        rows = (await self.db.execute(statement.limit(limit + 1))).scalars().all()
+        if self.archive is not None:
+            # Segment reads decompress blocks; keep them off the event loop
+            archived = await asyncio.to_thread(self.archive.query, portfolio_id, from_time, to_time, record_type,
+                                               action_code, history_cursor(cursor), limit + 1)
+            rows = merge_history(rows, archived, limit + 1)
+        return history_page(rows, limit)
+        
+    async def iter_transactions(self, account_no: str, batch_size: int = 1000,
+                                from_date: Optional[date] = None, to_date: Optional[date] = None,
+                                transaction_type: Optional[str] = None, status: Optional[str] = None) -> AsyncIterator[Transaction]:
+        """Stream an account's transactions in key order through a server-side cursor where supported"""
+        statement = transactions_statement(account_no, from_date, to_date, transaction_type, status)
+        result = await self.db.stream_scalars(statement.execution_options(yield_per=batch_size))
+        async for transaction in result:
+            yield transaction
@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models import History, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class AuditSink:
+    """Collects History rows and writes them with bulk ``History.bulk_insert()`` statements.
+
+    Rows are staged on the trade's session and only leave it once that session
+    commits, so a rolled back trade never produces audit rows. Two modes:
+
+    - ``"commit"``: staged rows are bulk inserted inside the trade's own commit.
+      Audit data is exactly as durable as the trade.
+    - ``"deferred"``: committed rows go to an in-memory queue that a background
+      thread flushes on ``max_batch`` rows or every ``flush_interval`` seconds.
+      Queued rows are lost if the process dies before the next flush.
+
+    The deferred queue, including a batch being flushed, holds at most
+    ``max_queue`` rows plus one trade's rows. When it is full, the
+    committing thread waits for the flusher to make room, which pushes back
+    on producers instead of growing memory while the database is unavailable.
+    A batch that fails ``max_attempts`` flushes in a row is split in halves
+    until the failing rows are isolated. Each such row is logged with its
+    values and dropped, so one bad row cannot block the queue. Operational
+    errors, such as a locked or unreachable database, are never blamed on a
+    row: the batch stays queued and is retried.
+    """
+
+    MODES = ("commit", "deferred")
+
+    def __init__(self, mode: str = "commit", max_batch: int = 500, flush_interval: float = 1.0,
+                 session_factory: Callable[[], Session] = SessionLocal, max_queue: int = 50000,
+                 max_attempts: int = 3):
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of: {', '.join(self.MODES)}")
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        if max_queue < max_batch:
+            raise ValueError("max_queue must be at least max_batch")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+        self.mode = mode
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+
+        self._pending_key = f"audit_sink_pending_{id(self)}"
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._room = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        self._flushed_rows = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._failed_attempts = 0
+        self._in_flight = 0
+        self._dropped_rows = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+        if mode == "deferred":
+            self.start()
+
+    def add(self, values: Dict, db: Session):
+        self.add_many([values], db)
+
+    def add_many(self, rows: List[Dict], db: Session):
+        if not rows:
+            return
+        pending = db.info.get(self._pending_key)
+        if pending is None:
+            pending = db.info[self._pending_key] = []
+            event.listen(db, "before_commit", self._before_commit)
+            event.listen(db, "after_commit", self._after_commit)
+            event.listen(db, "after_rollback", self._after_rollback)
+        pending.extend(rows)
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop the background thread and write everything still queued"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+            self._room.notify_all()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Write queued rows now; returns the number of rows written.
+
+        Raises the flush error after putting unwritten rows back on the queue.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                    isolate = self._failed_attempts >= self.max_attempts
+                    self._in_flight = len(batch)
+                if not batch:
+                    return written
+
+                started = time.perf_counter()
+                pieces = [batch]
+                try:
+                    batch_written = self._write_pieces(pieces, isolate)
+                except Exception:
+                    with self._lock:
+                        self._queue.extendleft(row for piece in pieces for row in reversed(piece))
+                        self._in_flight = 0
+                        self._failed_flushes += 1
+                        self._failed_attempts += 1
+                    raise
+
+                with self._lock:
+                    self._in_flight = 0
+                    self._failed_attempts = 0
+                    self._room.notify_all()
+                self._record_flush(batch_written, time.perf_counter() - started)
+                written += batch_written
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "queue_depth": len(self._queue),
+                "flushed_rows": self._flushed_rows,
+                "flushes": self._flushes,
+                "failed_flushes": self._failed_flushes,
+                "dropped_rows": self._dropped_rows,
+                "last_flush_seconds": self._last_flush_seconds,
+                "max_flush_seconds": self._max_flush_seconds,
+                "avg_flush_seconds": self._total_flush_seconds / self._flushes if self._flushes else 0.0
+            }
+
+    def _write(self, rows: List[Dict]):
+        db = self.session_factory()
+        try:
+            db.execute(History.bulk_insert(), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_pieces(self, pieces: List[List[Dict]], isolate: bool) -> int:
+        """Write and remove pieces from the end of ``pieces``; unwritten ones stay on it when this raises.
+
+        When isolating, a failing piece is split in halves and a single row
+        that fails is logged and dropped, unless the error is operational.
+        """
+        written = 0
+        while pieces:
+            piece = pieces[-1]
+            try:
+                self._write(piece)
+            except OperationalError:
+                raise
+            except Exception:
+                if not isolate:
+                    raise
+                pieces.pop()
+                if len(piece) > 1:
+                    middle = len(piece) // 2
+                    pieces.extend((piece[middle:], piece[:middle]))
+                else:
+                    logger.error("Dropping audit row that cannot be written: %r", piece[0], exc_info=True)
+                    with self._lock:
+                        self._dropped_rows += 1
+                continue
+            pieces.pop()
+            written += len(piece)
+        return written
+
+    def _before_commit(self, db: Session):
+        if self.mode != "commit":
+            return
+        rows = db.info.get(self._pending_key)
+        if not rows:
+            return
+        db.info[self._pending_key] = []
+
+        started = time.perf_counter()
+        db.execute(History.bulk_insert(), rows)
+        self._record_flush(len(rows), time.perf_counter() - started)
+
+    def _after_commit(self, db: Session):
+        rows = db.info.get(self._pending_key)
+        if not rows:
+            return
+        db.info[self._pending_key] = []
+        with self._wakeup:
+            # Wait for room while a flusher can make it; a trade's rows are never split
+            while (len(self._queue) + self._in_flight >= self.max_queue and not self._stopping
+                   and self._flusher_alive()):
+                self._wakeup.notify()
+                self._room.wait(self.flush_interval)
+            self._queue.extend(rows)
+            if len(self._queue) >= self.max_batch:
+                self._wakeup.notify()
+
+    def _after_rollback(self, db: Session):
+        if db.info.get(self._pending_key):
+            db.info[self._pending_key] = []
+
+    def _flusher_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._thread is not threading.current_thread()
+
+    def _record_flush(self, rows: int, seconds: float):
+        with self._lock:
+            self._flushed_rows += rows
+            self._flushes += 1
+            self._last_flush_seconds = seconds
+            self._max_flush_seconds = max(self._max_flush_seconds, seconds)
+            self._total_flush_seconds += seconds
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                self._wakeup.wait_for(
+                    lambda: self._stopping or len(self._queue) >= self.max_batch,
+                    timeout=self.flush_interval
+                )
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                # Unwritten rows were put back on the queue; the next interval retries them
+                logger.exception("Audit sink flush failed")
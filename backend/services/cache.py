@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries also expire after ``ttl`` seconds"""
+    
+    def __init__(self, max_entries: int = 10000, ttl: float = 30.0):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        # key -> [in-flight loads, invalidations since the first of them started]
+        self._loads: Dict[Hashable, list] = {}
+        
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+            
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._store(key, value)
+                
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Return the cached value or call ``loader``; ``None`` results are not cached.
+        
+        A value loaded while its key was invalidated is returned but not stored,
+        so a read racing a commit cannot put a stale entry back in the cache.
+        Invalidating other keys does not affect the load.
+        """
+        value = self.get(key)
+        if value is None:
+            generation = self._begin_load(key)
+            try:
+                value = loader()
+            finally:
+                self._end_load(key, generation, value)
+        return value
+        
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """``get_or_load`` for coroutine loaders"""
+        value = self.get(key)
+        if value is None:
+            generation = self._begin_load(key)
+            try:
+                value = await loader()
+            finally:
+                self._end_load(key, generation, value)
+        return value
+        
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            loads = self._loads.get(key)
+            if loads is not None:
+                loads[1] += 1
+            if self._entries.pop(key, None) is not None:
+                self._invalidations += 1
+                
+    def clear(self):
+        with self._lock:
+            for loads in self._loads.values():
+                loads[1] += 1
+            self._entries.clear()
+            
+    def _begin_load(self, key: Hashable) -> int:
+        """Register an in-flight load of ``key`` and return the key's current generation"""
+        with self._lock:
+            loads = self._loads.setdefault(key, [0, 0])
+            loads[0] += 1
+            return loads[1]
+            
+    def _end_load(self, key: Hashable, generation: int, value: Optional[Any]):
+        """Store ``value`` unless ``key`` was invalidated since its load began"""
+        with self._lock:
+            loads = self._loads[key]
+            loads[0] -= 1
+            if loads[0] == 0:
+                del self._loads[key]
+            if value is not None and loads[1] == generation:
+                self._store(key, value)
+                
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations
+            }
+
+
+portfolio_cache = TTLCache(
+    max_entries=int(os.getenv("PORTFOLIO_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PORTFOLIO_CACHE_TTL", "30"))
+)
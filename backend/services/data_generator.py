@@ -0,0 +1,260 @@
+import json
+import time as timer
+import numpy as np
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, List, Tuple
+from sqlalchemy import insert
+from sqlalchemy.engine import Connection, Engine
+from models import Portfolio, Position, Transaction, History
+from models.history import IMAGE_FORMAT_DELTA
+
+CLIENT_TYPES = (["I", "C", "T"], [0.80, 0.15, 0.05])
+PORTFOLIO_STATUSES = (["A", "C", "S"], [0.95, 0.03, 0.02])
+CURRENCIES = (["USD", "EUR", "GBP"], [0.85, 0.10, 0.05])
+TRANSACTION_TYPES = (["BU", "SL", "FE"], [0.50, 0.35, 0.15])
+# Statuses of processed transactions; ``pending_share`` of the rows are drawn as 'P' instead
+TRANSACTION_STATUSES = (["D", "F", "R"], [0.97, 0.02, 0.01])
+
+# Independent random streams, so each table is reproducible on its own
+STREAM_MARKET, STREAM_PORTFOLIOS, STREAM_TRANSACTIONS = range(3)
+
+# Draws are vectorized per block; the block sizes are fixed so output never depends on batching
+PORTFOLIO_BLOCK = 100
+TRANSACTION_BLOCK = 10000
+
+
+class SyntheticDataGenerator:
+    """Deterministic synthetic portfolios, positions, transactions and audit history.
+    
+    Row counts are ``portfolios``, ``portfolios * positions_per_date * days``
+    positions, ``transactions`` transactions and one History row per processed
+    transaction. About ``pending_share`` of the transactions are left pending
+    (status 'P', no process date) for the end-of-day runner to pick up.
+    Values follow simple market-like distributions:
+    
+    - Instrument prices start log-normal and follow a geometric random walk.
+    - Holdings favour popular instruments (Zipf).
+    - Quantities and cash balances are log-normal.
+    - Trading activity is skewed towards a minority of portfolios.
+    
+    The same ``seed`` always yields the same rows. ``total_value`` is
+    consistent with ``Portfolio.calculate_total_value``, so the reconciler
+    reports no drift on generated data.
+    """
+    
+    def __init__(self, portfolios: int = 1000, positions_per_date: int = 20, days: int = 30,
+                 transactions: int = 100000, instruments: int = 5000, seed: int = 42,
+                 start_date: date = date(2024, 1, 2), pending_share: float = 0.02):
+        if min(portfolios, positions_per_date, days, instruments) < 1 or transactions < 0:
+            raise ValueError("counts must be positive")
+        if not 0.0 <= pending_share <= 1.0:
+            raise ValueError("pending_share must be between 0 and 1")
+        if positions_per_date > instruments:
+            raise ValueError("positions_per_date cannot exceed instruments")
+        self.portfolios = portfolios
+        self.positions_per_date = positions_per_date
+        self.days = days
+        self.transactions = transactions
+        self.instruments = instruments
+        self.seed = seed
+        # 'P' goes last, so a zero share draws exactly the statuses it always did
+        self.statuses = TRANSACTION_STATUSES[0] + ["P"]
+        self.status_weights = [weight * (1.0 - pending_share) for weight in TRANSACTION_STATUSES[1]] + [pending_share]
+        self.dates = [start_date + timedelta(days=offset) for offset in range(days)]
+        
+        rng = self._rng(STREAM_MARKET)
+        self.investment_ids = [f"EQ{index:08d}" for index in range(instruments)]
+        self.currencies = rng.choice(CURRENCIES[0], size=instruments, p=CURRENCIES[1])
+        popularity = 1.0 / np.arange(1, instruments + 1) ** 1.1
+        self.popularity = popularity / popularity.sum()
+        start_prices = rng.lognormal(mean=3.5, sigma=1.0, size=instruments)
+        returns = rng.normal(loc=0.0003, scale=0.02, size=(instruments, days))
+        returns[:, 0] = 0.0
+        self.prices = np.round(start_prices[:, None] * np.exp(np.cumsum(returns, axis=1)), 4)
+        
+    def _rng(self, stream: int) -> np.random.Generator:
+        return np.random.default_rng([self.seed, stream])
+        
+    @staticmethod
+    def port_id(index: int) -> str:
+        return f"P{index:07d}"
+        
+    def portfolio_blocks(self) -> Iterator[Tuple[List[Tuple], List[Tuple]]]:
+        """Yield ``(portfolio_rows, position_rows)`` for consecutive blocks of portfolios"""
+        rng = self._rng(STREAM_PORTFOLIOS)
+        holdings = self.positions_per_date
+        for first in range(0, self.portfolios, PORTFOLIO_BLOCK):
+            count = min(PORTFOLIO_BLOCK, self.portfolios - first)
+            client_types = rng.choice(CLIENT_TYPES[0], size=count, p=CLIENT_TYPES[1])
+            statuses = rng.choice(PORTFOLIO_STATUSES[0], size=count, p=PORTFOLIO_STATUSES[1])
+            cash = np.round(rng.lognormal(mean=8.0, sigma=1.5, size=count), 2)
+            open_days = rng.integers(30, 3650, size=count)
+            
+            portfolio_rows = []
+            position_rows = []
+            for offset in range(count):
+                index = first + offset
+                port_id = self.port_id(index)
+                picks = rng.choice(self.instruments, size=holdings, replace=False, p=self.popularity)
+                quantities = np.round(rng.lognormal(mean=4.0, sigma=1.2, size=holdings), 4)
+                entry_prices = self.prices[picks, 0] * rng.normal(1.0, 0.08, size=holdings)
+                cost_basis = np.round(quantities * entry_prices, 2)
+                market_values = np.round(quantities[:, None] * self.prices[picks], 2)
+                closed = rng.random(holdings) < 0.03
+                
+                active_value = round(float(market_values[~closed].sum()), 2)
+                portfolio_rows.append((
+                    port_id, f"{1000000000 + index:010d}", f"Synthetic Client {index}"[:30],
+                    str(client_types[offset]), self.dates[0] - timedelta(days=int(open_days[offset])),
+                    self.dates[-1], str(statuses[offset]), round(active_value + float(cash[offset]), 2),
+                    float(cash[offset]), "SYNTH", None
+                ))
+                for day, position_date in enumerate(self.dates):
+                    maint_date = datetime.combine(position_date, time(18, 0))
+                    for slot in range(holdings):
+                        position_rows.append((
+                            port_id, position_date, self.investment_ids[picks[slot]],
+                            float(quantities[slot]), float(cost_basis[slot]), float(market_values[slot, day]),
+                            str(self.currencies[picks[slot]]), "C" if closed[slot] else "A",
+                            maint_date, "SYNTH"
+                        ))
+            yield portfolio_rows, position_rows
+            
+    def transaction_blocks(self) -> Iterator[Tuple[List[Tuple], List[Tuple]]]:
+        """Yield ``(transaction_rows, history_rows)``; each processed transaction has one TR audit row.
+        
+        The History key reuses the transaction's per-portfolio counter: its last
+        four digits are ``seq_no`` and the leading digits are the hundredths of
+        ``time``, which keeps keys unique up to a million transactions per portfolio.
+        """
+        rng = self._rng(STREAM_TRANSACTIONS)
+        activity = rng.lognormal(mean=0.0, sigma=1.0, size=self.portfolios)
+        activity /= activity.sum()
+        counters = np.zeros(self.portfolios, dtype=np.int64)
+        
+        for first in range(0, self.transactions, TRANSACTION_BLOCK):
+            count = min(TRANSACTION_BLOCK, self.transactions - first)
+            owners = rng.choice(self.portfolios, size=count, p=activity)
+            types = rng.choice(TRANSACTION_TYPES[0], size=count, p=TRANSACTION_TYPES[1])
+            statuses = rng.choice(self.statuses, size=count, p=self.status_weights)
+            instruments = rng.choice(self.instruments, size=count, p=self.popularity)
+            days = rng.integers(0, self.days, size=count)
+            seconds = rng.integers(9 * 3600 + 1800, 16 * 3600, size=count)
+            quantities = np.maximum(np.round(rng.lognormal(mean=3.0, sigma=1.0, size=count)), 1)
+            slippage = rng.normal(1.0, 0.002, size=count)
+            fees = np.round(rng.uniform(5, 50, size=count), 2)
+            
+            transaction_rows = []
+            history_rows = []
+            for offset in range(count):
+                owner = owners[offset]
+                counters[owner] += 1
+                sequence = int(counters[owner])
+                trade_date = self.dates[days[offset]]
+                trade_time = time(*divmod(int(seconds[offset]) // 60, 60), int(seconds[offset]) % 60)
+                status = str(statuses[offset])
+                process_date = None if status == "P" else datetime.combine(trade_date, trade_time)
+                type_ = str(types[offset])
+                if type_ == "FE":
+                    investment_id, quantity, price, amount, currency = None, None, None, float(fees[offset]), "USD"
+                else:
+                    instrument = instruments[offset]
+                    investment_id = self.investment_ids[instrument]
+                    quantity = float(quantities[offset])
+                    price = round(float(self.prices[instrument, days[offset]] * slippage[offset]), 4)
+                    amount = round(quantity * price, 2)
+                    currency = str(self.currencies[instrument])
+                row = (trade_date, trade_time, self.port_id(owner), f"{sequence:06d}", investment_id, type_,
+                       quantity, price, amount, currency, status, process_date, "SYNTH")
+                transaction_rows.append(row)
+                if process_date is not None:
+                    history_rows.append(self._history_row(row, sequence))
+            yield transaction_rows, history_rows
+            
+    @staticmethod
+    def _history_row(transaction: Tuple, sequence: int) -> Tuple:
+        trade_date, trade_time, portfolio_id, sequence_no = transaction[:4]
+        after_data = dict(zip(TRANSACTION_COLUMNS, transaction))
+        after_data.update(
+            date=trade_date.isoformat(),
+            time=trade_time.isoformat(),
+            process_date=transaction[11].isoformat(),
+            quantity=after_data["quantity"] or 0.0,
+            price=after_data["price"] or 0.0,
+            target_portfolio_id=None
+        )
+        return (
+            portfolio_id, trade_date.strftime("%Y%m%d"),
+            trade_time.strftime("%H%M%S") + f"{sequence // 10000 % 100:02d}", f"{sequence % 10000:04d}",
+            "TR", "A", None, json.dumps(after_data, separators=(",", ":")), IMAGE_FORMAT_DELTA, "PROC",
+            transaction[11], "SYNTH"
+        )
+        
+    def write(self, engine: Engine, batch_size: int = 10000) -> Dict:
+        """Bulk load every table; returns row counts, elapsed seconds and rows per second.
+        
+        PostgreSQL is loaded with COPY, other databases with executemany inserts
+        of ``batch_size`` rows. Each generated block is committed separately.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        started = timer.perf_counter()
+        counts = {"portfolios": 0, "positions": 0, "transactions": 0, "history": 0}
+        with engine.connect() as connection:
+            load = _copy_rows if connection.dialect.name == "postgresql" else _insert_rows
+            
+            def write_rows(table, columns, rows):
+                for start in range(0, len(rows), batch_size):
+                    load(connection, table, columns, rows[start:start + batch_size])
+                return len(rows)
+                
+            for portfolio_rows, position_rows in self.portfolio_blocks():
+                counts["portfolios"] += write_rows(Portfolio.__table__, PORTFOLIO_COLUMNS, portfolio_rows)
+                counts["positions"] += write_rows(Position.__table__, POSITION_COLUMNS, position_rows)
+                connection.commit()
+            for transaction_rows, history_rows in self.transaction_blocks():
+                counts["transactions"] += write_rows(Transaction.__table__, TRANSACTION_COLUMNS, transaction_rows)
+                counts["history"] += write_rows(History.__table__, HISTORY_COLUMNS, history_rows)
+                connection.commit()
+                
+        elapsed = timer.perf_counter() - started
+        total = sum(counts.values())
+        return dict(counts, rows=total, elapsed_seconds=elapsed,
+                    rows_per_second=total / elapsed if elapsed else 0.0)
+
+
+PORTFOLIO_COLUMNS = ("port_id", "account_no", "client_name", "client_type", "create_date", "last_maint",
+                     "status", "total_value", "cash_balance", "last_user", "last_trans")
+POSITION_COLUMNS = ("portfolio_id", "date", "investment_id", "quantity", "cost_basis", "market_value",
+                    "currency", "status", "last_maint_date", "last_maint_user")
+TRANSACTION_COLUMNS = ("date", "time", "portfolio_id", "sequence_no", "investment_id", "type", "quantity",
+                       "price", "amount", "currency", "status", "process_date", "process_user")
+HISTORY_COLUMNS = ("portfolio_id", "date", "time", "seq_no", "record_type", "action_code", "before_image",
+                   "after_image", "image_format", "reason_code", "process_date", "process_user")
+
+
+def _insert_rows(connection: Connection, table, columns: Tuple[str, ...], rows: List[Tuple]):
+    if not rows:
+        return
+    dialect = connection.dialect
+    if not dialect.positional:
+        connection.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+        return
+    # Positional drivers (SQLite) take plain tuples; skipping per-row parameter
+    # construction roughly doubles the insert rate
+    compiled = insert(table).compile(dialect=dialect, column_keys=list(columns))
+    order = [columns.index(name) for name in compiled.positiontup]
+    processors = [table.c[columns[index]].type.dialect_impl(dialect).bind_processor(dialect) for index in order]
+    connection.exec_driver_sql(str(compiled), [
+        tuple(process(row[index]) if process else row[index] for index, process in zip(order, processors))
+        for row in rows
+    ])
+
+
+def _copy_rows(connection: Connection, table, columns: Tuple[str, ...], rows: List[Tuple]):
+    if rows:
+        raw = connection.connection.driver_connection
+        with raw.cursor() as cursor:
+            with cursor.copy(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
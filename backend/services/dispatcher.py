@@ -0,0 +1,223 @@
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from models import Transaction, engine as default_engine
+from .eod_runner import partition_for
+from .portfolio_service import PortfolioService
+from .tax_lots import LotSelection
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class TransactionDispatcher:
+    """Runs ``PortfolioService.process_transaction`` on per-portfolio shards.
+    
+    Each transaction goes to the shard of its ``portfolio_id``. A shard is one
+    worker thread with its own bounded queue, session and PortfolioService, and
+    it processes its queue in order. Transactions of one portfolio therefore
+    run one at a time in the order they were submitted, while different
+    portfolios run in parallel. Submit them in ``(date, time, portfolio_id,
+    sequence_no)`` order, or use ``submit_many``, which sorts by that key.
+    
+    A full queue blocks ``submit``, which pushes back on the producer. A
+    transfer runs on its source portfolio's shard. Its target may be busy on
+    another shard at the same time; row locks and version checks keep that
+    safe, but a transfer is not ordered against the target's own queue.
+    
+    Submitted transactions are added to the shard's session, so they must not
+    belong to another session. After processing they are detached again and
+    safe to read from the submitting thread.
+    """
+    
+    def __init__(self, shards: Optional[int] = None, queue_size: int = 1000, engine: Engine = default_engine,
+                 service_factory: Callable[[Session], PortfolioService] = PortfolioService):
+        self.shards = shards or int(os.getenv("TRANSACTION_SHARDS", "0")) or os.cpu_count() or 1
+        if self.shards < 1:
+            raise ValueError("shards must be at least 1")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        self.queue_size = queue_size
+        self.engine = engine
+        self.service_factory = service_factory
+        
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(self.shards)]
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._putting = 0
+        self._outstanding = 0
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._threads = [
+            threading.Thread(target=self._run, args=(shard,), name=f"transaction-shard-{shard}", daemon=True)
+            for shard in range(self.shards)
+        ]
+        for thread in self._threads:
+            thread.start()
+            
+    def shard_for(self, portfolio_id: str) -> int:
+        return partition_for(portfolio_id, self.shards)
+        
+    def submit(self, transaction: Transaction, lot_selection: Optional[LotSelection] = None,
+               timeout: Optional[float] = None) -> Future:
+        """Queue a transaction; the future resolves to ``process_transaction``'s result.
+        
+        Blocks while the shard's queue is full. Raises queue.Full if room does
+        not free up within ``timeout`` seconds, and RuntimeError after shutdown.
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Dispatcher is shut down")
+            self._outstanding += 1
+            self._putting += 1
+        try:
+            self._queues[self.shard_for(transaction.portfolio_id)].put(
+                (transaction, lot_selection, future), timeout=timeout
+            )
+        except queue.Full:
+            self._done()
+            raise
+        finally:
+            with self._idle:
+                self._putting -= 1
+                self._idle.notify_all()
+        with self._lock:
+            self._submitted += 1
+        return future
+        
+    def submit_many(self, transactions: Iterable[Transaction],
+                    lot_selections: Optional[Dict] = None) -> List[Future]:
+        """Queue transactions in ``(date, time, portfolio_id, sequence_no)`` order; futures follow the input order.
+        
+        ``lot_selections`` is keyed like ``PortfolioService.process_batch``'s.
+        """
+        transactions = list(transactions)
+        lot_selections = lot_selections or {}
+        futures: List[Optional[Future]] = [None] * len(transactions)
+        for index in sorted(range(len(transactions)), key=lambda i: transaction_key(transactions[i])):
+            transaction = transactions[index]
+            futures[index] = self.submit(transaction, lot_selections.get(transaction_key(transaction)))
+        return futures
+        
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted transaction is processed; False if ``timeout`` ran out first"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding == 0, timeout=timeout)
+            
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False):
+        """Stop accepting transactions and stop the shards once their queues are empty.
+        
+        With ``cancel_pending`` queued transactions are dropped and their
+        futures cancelled; the one each shard is processing still completes.
+        Submits already in progress finish queueing first, so every accepted
+        future is either processed or cancelled.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        # A stop marker queued ahead of an in-flight put would strand that put's future
+        while True:
+            if cancel_pending:
+                # Also makes room for producers blocked on a full queue
+                self._cancel_queued()
+            with self._idle:
+                if self._idle.wait_for(lambda: self._putting == 0, timeout=0.05 if cancel_pending else None):
+                    break
+        if cancel_pending:
+            self._cancel_queued()
+        for shard_queue in self._queues:
+            shard_queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+                
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "shards": self.shards,
+                "queue_size": self.queue_size,
+                "queue_depths": [shard_queue.qsize() for shard_queue in self._queues],
+                "outstanding": self._outstanding,
+                "submitted": self._submitted,
+                "processed": self._processed,
+                "failed": self._failed
+            }
+            
+    def __enter__(self) -> "TransactionDispatcher":
+        return self
+        
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        
+    def _cancel_queued(self):
+        for shard_queue in self._queues:
+            while True:
+                try:
+                    item = shard_queue.get_nowait()
+                except queue.Empty:
+                    break
+                item[2].cancel()
+                self._done()
+                
+    def _done(self, failed: Optional[bool] = None):
+        with self._idle:
+            self._outstanding -= 1
+            if failed is not None:
+                self._processed += 1
+                if failed:
+                    self._failed += 1
+            if self._outstanding == 0:
+                self._idle.notify_all()
+                
+    def _run(self, shard: int):
+        shard_queue = self._queues[shard]
+        # Nothing outlives a transaction in the identity map, so objects need not expire on commit
+        db = Session(self.engine, autoflush=False, expire_on_commit=False)
+        try:
+            service = self.service_factory(db)
+            broken = None
+        except Exception as e:
+            # Keep consuming so producers are not blocked forever; every transaction fails with the cause
+            logger.exception("Shard %d could not start", shard)
+            service, broken = None, e
+        try:
+            while True:
+                item = shard_queue.get()
+                if item is _STOP:
+                    return
+                transaction, lot_selection, future = item
+                if not future.set_running_or_notify_cancel():
+                    self._done()
+                    continue
+                try:
+                    if broken is not None:
+                        raise broken
+                    db.add(transaction)
+                    result = service.process_transaction(transaction, lot_selection)
+                except Exception as e:
+                    logger.exception("Shard %d failed on transaction %s", shard, transaction.sequence_no)
+                    db.rollback()
+                    result = e
+                finally:
+                    db.expunge_all()
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+                self._done(failed=isinstance(result, Exception) or not result["success"])
+        finally:
+            db.close()
+
+
+def transaction_key(transaction: Transaction):
+    return transaction.date, transaction.time, transaction.portfolio_id, transaction.sequence_no
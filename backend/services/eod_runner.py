@@ -0,0 +1,221 @@
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from models import Transaction, create_db_engine, history_sequence
+from .mark_to_market import MarkToMarketJob
+from .portfolio_service import PortfolioService, TRANSACTION_KEY
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS_PER_PARTITION = 1000
+
+
+def partition_for(portfolio_id: str, partitions: int) -> int:
+    """Stable partition of a portfolio; unlike ``hash()`` it is the same in every process"""
+    return zlib.crc32(portfolio_id.encode()) % partitions
+
+
+class EndOfDayRunner:
+    """Runs the end-of-day transaction batch on a process pool, then revalues.
+    
+    Portfolios with pending transactions are hash-partitioned by ``portfolio_id``
+    and each partition runs in a worker process with its own engine and session.
+    Most rows belong to one portfolio, but a transfer also credits its target,
+    which may sit in another partition. Those writes can race, and the
+    optimistic version check retries the losing chunk (``retry_on_conflict``).
+    Partition ``p`` of ``n`` allocates History ``seq_no`` values as worker
+    ``p`` of ``n`` so concurrent audit rows never collide. Workers commit every
+    ``portfolios_per_commit`` portfolios and record a checkpoint, so a rerun for
+    the same date and partition count resumes where each partition stopped.
+    A finished partition starts a new pass, which only finds rows still pending,
+    such as ones added since the last run or ones that failed.
+    
+    With a ``price_file``, the positions are revalued once every partition has
+    finished, by ``MarkToMarketJob``. That job is set-based over all
+    portfolios, so it is not partitioned.
+    
+    SQLite serializes writers, so near linear scaling needs PostgreSQL.
+    """
+    
+    def __init__(self, database_url: Optional[str] = None, workers: Optional[int] = None,
+                 partitions: Optional[int] = None, checkpoint_dir: str = "eod_checkpoints",
+                 portfolios_per_commit: int = 100, process_date: Optional[date] = None,
+                 price_file: Optional[str] = None):
+        self.database_url = database_url or os.getenv("DATABASE_URL")
+        self.workers = workers or os.cpu_count() or 1
+        self.partitions = partitions or self.workers
+        if self.workers < 1 or self.partitions < 1:
+            raise ValueError("workers and partitions must be at least 1")
+        if portfolios_per_commit < 1:
+            raise ValueError("portfolios_per_commit must be at least 1")
+        self.checkpoint_dir = checkpoint_dir
+        self.portfolios_per_commit = portfolios_per_commit
+        self.process_date = process_date or date.today()
+        self.price_file = price_file
+        
+    def run(self) -> Dict:
+        """Process every pending transaction dated on or before ``process_date`` and revalue; returns merged stats"""
+        started = time.perf_counter()
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        
+        partitions: List[List[str]] = [[] for _ in range(self.partitions)]
+        for portfolio_id in self._pending_portfolios():
+            partitions[partition_for(portfolio_id, self.partitions)].append(portfolio_id)
+            
+        jobs = [{
+            "database_url": self.database_url,
+            "partition": index,
+            "partitions": self.partitions,
+            "portfolio_ids": portfolio_ids,
+            "process_date": self.process_date.isoformat(),
+            "portfolios_per_commit": self.portfolios_per_commit,
+            "checkpoint_path": self._checkpoint_path(index)
+        } for index, portfolio_ids in enumerate(partitions)]
+        
+        if self.workers == 1:
+            results = [run_partition(job) for job in jobs]
+        else:
+            # spawn so workers never inherit the parent's pooled connections
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                futures = [pool.submit(run_partition, job) for job in jobs]
+                results = [future.result() for future in as_completed(futures)]
+                
+        revaluation = self._revalue() if self.price_file else None
+        return self._merge(sorted(results, key=lambda result: result["partition"]), revaluation,
+                           time.perf_counter() - started)
+                           
+    def _revalue(self) -> Dict:
+        engine = create_db_engine(self.database_url)
+        try:
+            return MarkToMarketJob(engine).run(self.price_file)
+        finally:
+            engine.dispose()
+                           
+    def _pending_portfolios(self) -> List[str]:
+        engine = create_db_engine(self.database_url)
+        try:
+            with engine.connect() as connection:
+                return list(connection.execute(
+                    select(Transaction.portfolio_id).distinct()
+                    .where(Transaction.status == 'P', Transaction.date <= self.process_date)
+                    .order_by(Transaction.portfolio_id)
+                ).scalars())
+        finally:
+            engine.dispose()
+            
+    def _checkpoint_path(self, partition: int) -> str:
+        name = f"{self.process_date.isoformat()}-{partition:03d}-of-{self.partitions:03d}.json"
+        return os.path.join(self.checkpoint_dir, name)
+        
+    def _merge(self, results: List[Dict], revaluation: Optional[Dict], elapsed: float) -> Dict:
+        merged = {
+            "process_date": self.process_date.isoformat(),
+            "portfolios": sum(result["portfolios"] for result in results),
+            "processed": sum(result["processed"] for result in results),
+            "failed": sum(result["failed"] for result in results),
+            "resumed_partitions": sum(1 for result in results if result["resumed"]),
+            "errors": [error for result in results for error in result["errors"]],
+            "partitions": results,
+            "revaluation": revaluation,
+            "elapsed_seconds": elapsed
+        }
+        merged["success"] = merged["failed"] == 0
+        merged["transactions_per_second"] = merged["processed"] / elapsed if elapsed else 0.0
+        return merged
+
+
+def _load_checkpoint(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as handle:
+        json.dump(checkpoint, handle)
+    os.replace(temporary, path)
+
+
+def run_partition(job: Dict) -> Dict:
+    """Worker entry point: process one partition's portfolios in commit groups.
+    
+    Only transactions still in status ``P`` are loaded, so work committed after
+    the last checkpoint write is not repeated on resume.
+    """
+    previous = history_sequence.worker_id, history_sequence.worker_count
+    history_sequence.configure(job["partition"], job["partitions"])
+    try:
+        return _run_partition(job)
+    finally:
+        # A single-worker run shares the caller's allocator
+        history_sequence.configure(*previous)
+
+
+def _run_partition(job: Dict) -> Dict:
+    started = time.perf_counter()
+    checkpoint = _load_checkpoint(job["checkpoint_path"]) or {
+        "partition": job["partition"],
+        "last_portfolio_id": None,
+        "done": False,
+        "portfolios": 0,
+        "processed": 0,
+        "failed": 0,
+        "errors": []
+    }
+    resumed = checkpoint["last_portfolio_id"] is not None or checkpoint["done"]
+    if checkpoint["done"]:
+        # The job only lists portfolios that still have pending rows, so a new pass picks up just those
+        checkpoint.update(done=False, last_portfolio_id=None)
+        
+    remaining = [
+        portfolio_id for portfolio_id in job["portfolio_ids"]
+        if checkpoint["last_portfolio_id"] is None or portfolio_id > checkpoint["last_portfolio_id"]
+    ]
+    process_date = date.fromisoformat(job["process_date"])
+    group_size = job["portfolios_per_commit"]
+    
+    engine = create_db_engine(job["database_url"])
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        service = PortfolioService(db, cache=None)
+        for start in range(0, len(remaining), group_size):
+            group = remaining[start:start + group_size]
+            transactions = db.query(Transaction).filter(
+                Transaction.portfolio_id.in_(group),
+                Transaction.status == 'P',
+                Transaction.date <= process_date
+            ).order_by(*TRANSACTION_KEY).all()
+            
+            result = service.process_batch(transactions, chunk_size=max(len(transactions), 1))
+            db.expunge_all()
+            
+            checkpoint["portfolios"] += len(group)
+            checkpoint["processed"] += result["processed"]
+            checkpoint["failed"] += result["failed"]
+            room = MAX_ERRORS_PER_PARTITION - len(checkpoint["errors"])
+            checkpoint["errors"].extend(
+                {"portfolio_id": error["portfolio_id"], "sequence_no": error["sequence_no"], "errors": error["errors"]}
+                for error in result["errors"][:max(room, 0)]
+            )
+            checkpoint["last_portfolio_id"] = group[-1]
+            _save_checkpoint(job["checkpoint_path"], checkpoint)
+    finally:
+        db.close()
+        engine.dispose()
+        
+    checkpoint["done"] = True
+    _save_checkpoint(job["checkpoint_path"], checkpoint)
+    logger.info("EOD partition %d: %d portfolios, %d processed, %d failed",
+                job["partition"], checkpoint["portfolios"], checkpoint["processed"], checkpoint["failed"])
+    return dict(checkpoint, resumed=resumed, elapsed_seconds=time.perf_counter() - started)
@@ -0,0 +1,308 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import uuid
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, literal, select, tuple_
+from sqlalchemy.orm import Session
+from models import History
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HSEG1\n"
+TRAILER = struct.Struct("<Q8s")
+TRAILER_MAGIC = b"HSEGEND1"
+SEGMENT_SUFFIX = ".seg"
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+# Column order of an archived row; process_date is stored as a fixed-width string so keys sort as text
+COLUMNS = ("portfolio_id", "date", "time", "seq_no", "record_type", "action_code", "before_image",
+           "after_image", "image_format", "reason_code", "process_date", "process_user")
+ARCHIVE_KEY = (History.portfolio_id, History.process_date, History.date, History.time, History.seq_no)
+
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def _row_key(row: List) -> Tuple:
+    return row[0], row[10], row[1], row[2], row[3]
+
+
+def _values(row: List) -> Dict:
+    values = dict(zip(COLUMNS, row))
+    values["process_date"] = datetime.strptime(values["process_date"], TIMESTAMP_FORMAT)
+    return values
+
+
+class SegmentWriter:
+    """Writes one segment: compressed row blocks, then a footer holding the sparse index.
+    
+    The file is written under a temporary name and renamed into place when
+    finished, so readers never see a partial segment.
+    """
+    
+    def __init__(self, directory: str, block_rows: int):
+        name = f"history-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        self.path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        self._temp_path = self.path + ".tmp"
+        self._file = open(self._temp_path, "wb")
+        self._file.write(MAGIC)
+        self.block_rows = block_rows
+        self.rows = 0
+        self.first_key: Optional[Tuple] = None
+        self.last_key: Optional[Tuple] = None
+        self._block: List[List] = []
+        self._blocks: List[List] = []
+        self._process_dates: List[str] = []
+        
+    def add(self, row: List):
+        self._block.append(row)
+        key = _row_key(row)
+        self.first_key = self.first_key or key
+        self.last_key = key
+        self.rows += 1
+        if len(self._block) >= self.block_rows:
+            self._flush_block()
+            
+    def _flush_block(self):
+        if not self._block:
+            return
+        data = zlib.compress(json.dumps(self._block, separators=(",", ":")).encode())
+        first = self._block[0]
+        dates = [row[10] for row in self._block]
+        self._blocks.append([first[0], first[10], self._file.tell(), len(data), len(self._block)])
+        self._process_dates.extend((min(dates), max(dates)))
+        self._file.write(data)
+        self._block = []
+        
+    def finish(self) -> str:
+        self._flush_block()
+        footer = {
+            "version": 1,
+            "rows": self.rows,
+            "min_portfolio": self.first_key[0],
+            "max_portfolio": self.last_key[0],
+            "min_process_date": min(self._process_dates),
+            "max_process_date": max(self._process_dates),
+            "blocks": self._blocks
+        }
+        footer_offset = self._file.tell()
+        self._file.write(json.dumps(footer, separators=(",", ":")).encode())
+        self._file.write(TRAILER.pack(footer_offset, TRAILER_MAGIC))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+        return self.path
+        
+    def abort(self):
+        self._file.close()
+        os.remove(self._temp_path)
+
+
+class Segment:
+    """Read-only view of a segment file through a memory map"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a history segment")
+        footer_offset, trailer = TRAILER.unpack(self._map[-TRAILER.size:])
+        if trailer != TRAILER_MAGIC:
+            raise ValueError(f"{path} is truncated")
+        footer = json.loads(self._map[footer_offset:len(self._map) - TRAILER.size])
+        self.rows = footer["rows"]
+        self.min_portfolio = footer["min_portfolio"]
+        self.max_portfolio = footer["max_portfolio"]
+        self.min_process_date = footer["min_process_date"]
+        self.max_process_date = footer["max_process_date"]
+        self.blocks = footer["blocks"]
+        self._block_keys = [(block[0], block[1]) for block in self.blocks]
+        
+    def close(self):
+        self._map.close()
+        
+    def _block_rows(self, index: int) -> List[List]:
+        _, _, offset, length, _ = self.blocks[index]
+        return json.loads(zlib.decompress(self._map[offset:offset + length]))
+        
+    def scan(self, portfolio_id: str, start: str = "", end: Optional[str] = None) -> Iterator[List]:
+        """Rows of ``portfolio_id`` with ``start <= process_date <= end``, in key order"""
+        if not self.min_portfolio <= portfolio_id <= self.max_portfolio:
+            return
+        if start > self.max_process_date or (end is not None and end < self.min_process_date):
+            return
+        # The last block starting before the range may still hold its first rows
+        index = max(bisect.bisect_left(self._block_keys, (portfolio_id, start)) - 1, 0)
+        while index < len(self.blocks) and self.blocks[index][0] <= portfolio_id:
+            for row in self._block_rows(index):
+                if row[0] < portfolio_id or row[10] < start:
+                    continue
+                if row[0] > portfolio_id or (end is not None and row[10] > end):
+                    return
+                yield row
+            index += 1
+
+
+class HistoryArchive:
+    """Immutable, compressed segment files for History rows past retention.
+    
+    ``archive`` moves rows older than a cutoff out of the ``history`` table
+    into segments of up to ``segment_rows`` rows. Rows are sorted by
+    ``(portfolio_id, process_date)`` and compressed in blocks of
+    ``block_rows``, and each segment ends with a sparse index of every block's
+    first ``(portfolio_id, process_date)``. A read maps the file, bisects the
+    index and decompresses only the blocks in range. ``query`` applies the
+    same filters as the audit history API, so callers can merge archived
+    rows with live ones.
+    """
+    
+    def __init__(self, directory: str, block_rows: int = 512, segment_rows: int = 200000):
+        if block_rows < 1 or segment_rows < block_rows:
+            raise ValueError("block_rows must be positive and segment_rows at least block_rows")
+        self.directory = directory
+        self.block_rows = block_rows
+        self.segment_rows = segment_rows
+        self._segments: Dict[str, Segment] = {}
+        self._lock = threading.Lock()
+        
+    @classmethod
+    def from_env(cls) -> Optional["HistoryArchive"]:
+        """Archive in ``HISTORY_ARCHIVE_DIR``, or None when archiving is not configured"""
+        directory = os.getenv("HISTORY_ARCHIVE_DIR")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            block_rows=int(os.getenv("HISTORY_ARCHIVE_BLOCK_ROWS", "512")),
+            segment_rows=int(os.getenv("HISTORY_ARCHIVE_SEGMENT_ROWS", "200000"))
+        )
+        
+    def segments(self) -> List[Segment]:
+        """Open segments, picking up files written since the last call"""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        with self._lock:
+            for name in names:
+                if name not in self._segments:
+                    self._segments[name] = Segment(os.path.join(self.directory, name))
+            return [self._segments[name] for name in names if name in self._segments]
+            
+    def close(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+            
+    def archive(self, db: Session, older_than: datetime, batch_size: int = 5000) -> Dict:
+        """Move rows with ``process_date`` before ``older_than`` into new segments.
+        
+        Each segment is made durable before its rows are deleted, one commit per
+        segment, so the table is never locked for the whole run. A crash between
+        the two leaves rows in both places; reads prefer the live copy, and the
+        next run archives them again into a second segment, which ``query``
+        reads through once.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        stats = {"segments": 0, "rows": 0}
+        last_key = None
+        while True:
+            writer = SegmentWriter(self.directory, self.block_rows)
+            while writer.rows < self.segment_rows:
+                rows = self._next_batch(db, older_than, last_key, min(batch_size, self.segment_rows - writer.rows))
+                if not rows:
+                    break
+                for row in rows:
+                    writer.add(row)
+                last_key = _row_key(rows[-1])
+            if not writer.rows:
+                writer.abort()
+                db.rollback()
+                return stats
+                
+            path = writer.finish()
+            self._delete_archived(db, older_than, writer.first_key, writer.last_key)
+            stats["segments"] += 1
+            stats["rows"] += writer.rows
+            logger.info("Archived %d history rows to %s", writer.rows, path)
+            
+    def _next_batch(self, db: Session, older_than: datetime, after: Optional[Tuple], limit: int) -> List[List]:
+        statement = select(*[getattr(History, column) for column in COLUMNS]).where(
+            History.process_date.is_not(None), History.process_date < older_than
+        )
+        if after is not None:
+            statement = statement.where(tuple_(*ARCHIVE_KEY) > _key_literal(after))
+        rows = db.execute(statement.order_by(*ARCHIVE_KEY).limit(limit)).all()
+        return [[*row[:10], _timestamp(row[10]), row[11]] for row in rows]
+        
+    @staticmethod
+    def _delete_archived(db: Session, older_than: datetime, first_key: Tuple, last_key: Tuple):
+        db.execute(delete(History).where(
+            History.process_date.is_not(None),
+            History.process_date < older_than,
+            tuple_(*ARCHIVE_KEY) >= _key_literal(first_key),
+            tuple_(*ARCHIVE_KEY) <= _key_literal(last_key)
+        ).execution_options(synchronize_session=False))
+        db.commit()
+        
+    def query(self, portfolio_id: str, from_time: Optional[datetime] = None, to_time: Optional[datetime] = None,
+              record_type: Optional[str] = None, action_code: Optional[str] = None,
+              after: Optional[Tuple] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Archived rows of a portfolio as ``History`` column values, in ``(process_date, date, time, seq_no)`` order.
+        
+        ``after`` is a ``(process_date, date, time, seq_no)`` keyset position;
+        with ``limit``, only the first rows after it are returned. A row archived
+        twice, by a run that crashed before deleting it, is returned once.
+        """
+        start = _timestamp(from_time) if from_time else ""
+        if after is not None:
+            start = max(start, _timestamp(after[0]))
+            after = (_timestamp(after[0]),) + tuple(after[1:])
+        end = _timestamp(to_time) if to_time else None
+        
+        matches = {}
+        for segment in self.segments():
+            found = 0
+            for row in segment.scan(portfolio_id, start, end):
+                if record_type and row[4] != record_type:
+                    continue
+                if action_code and row[5] != action_code:
+                    continue
+                if after is not None and (row[10], row[1], row[2], row[3]) <= after:
+                    continue
+                matches.setdefault((row[1], row[2], row[3]), row)
+                found += 1
+                if limit is not None and found >= limit:
+                    break
+        matches = sorted(matches.values(), key=lambda row: (row[10], row[1], row[2], row[3]))
+        if limit is not None:
+            matches = matches[:limit]
+        return [_values(row) for row in matches]
+
+
+def _key_literal(key: Tuple):
+    portfolio_id, process_date, date_str, time_str, seq_no = key
+    values = (portfolio_id, datetime.strptime(process_date, TIMESTAMP_FORMAT), date_str, time_str, seq_no)
+    return tuple_(*[literal(value, column.type) for column, value in zip(ARCHIVE_KEY, values)])
+
+
+def merge_history(live: List[History], archived: List[Dict], limit: int) -> List[History]:
+    """Live and archived rows merged in key order, first ``limit``; a live row wins over its archived copy"""
+    seen = {(row.date, row.time, row.seq_no) for row in live}
+    rows = list(live) + [History(**values) for values in archived
+                         if (values["date"], values["time"], values["seq_no"]) not in seen]
+    rows.sort(key=lambda row: (row.process_date, row.date, row.time, row.seq_no))
+    return rows[:limit]
+
+
+history_archive = HistoryArchive.from_env()
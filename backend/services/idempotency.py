@@ -0,0 +1,110 @@
+import hashlib
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models import IdempotencyKey
+from .cache import TTLCache
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+    
+    Membership tests have no false negatives and about ``error_rate`` false
+    positives up to ``capacity`` keys; beyond that the false positive rate
+    rises gradually instead of failing.
+    """
+    
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.001):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+        
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+            
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+        
+    def clear(self):
+        self._bits = bytearray(len(self._bits))
+
+
+class IdempotencyFilter:
+    """In-process screen in front of the ``idempotency_keys`` unique index.
+    
+    Recently finished results are kept in an LRU and replayed without touching
+    the database. Every other key goes through a Bloom filter: keys it has
+    never seen are new for certain, so only possible repeats are looked up,
+    with one query per request. The filter is loaded from the table once per
+    process. Keys claimed by another process meanwhile are not in it, but the
+    unique index still rejects them when they are inserted.
+    """
+    
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.001, recent: Optional[TTLCache] = None):
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.recent = recent if recent is not None else TTLCache(max_entries=100000, ttl=3600)
+        self._lock = threading.Lock()
+        self._loaded = False
+        
+    def ensure_loaded(self, db: Session):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            keys = db.execute(select(IdempotencyKey.key).execution_options(yield_per=10000)).scalars()
+            for key in keys:
+                self.bloom.add(key)
+            self._loaded = True
+            
+    def classify(self, keys: Iterable[str]) -> Tuple[Dict[str, Dict], List[str], List[str]]:
+        """Split keys into ``(recent results, possibly seen, certainly new)``"""
+        recent, maybe, new = {}, [], []
+        with self._lock:
+            for key in keys:
+                entry = self.recent.get(key)
+                if entry is not None:
+                    recent[key] = entry
+                elif key in self.bloom:
+                    maybe.append(key)
+                else:
+                    new.append(key)
+        return recent, maybe, new
+        
+    def add(self, key: str):
+        with self._lock:
+            self.bloom.add(key)
+            
+    def remember(self, key: str, entry: Dict):
+        """Record a finished ``{"request_hash", "result"}`` entry for replay"""
+        with self._lock:
+            self.bloom.add(key)
+        self.recent.set(key, entry)
+        
+    def reset(self):
+        with self._lock:
+            self.bloom.clear()
+            self._loaded = False
+        self.recent.clear()
+
+
+idempotency_filter = IdempotencyFilter(
+    capacity=int(os.getenv("IDEMPOTENCY_BLOOM_CAPACITY", "1000000")),
+    error_rate=float(os.getenv("IDEMPOTENCY_BLOOM_ERROR_RATE", "0.001")),
+    recent=TTLCache(
+        max_entries=int(os.getenv("IDEMPOTENCY_RECENT_SIZE", "100000")),
+        ttl=float(os.getenv("IDEMPOTENCY_RECENT_TTL", "3600"))
+    )
+)
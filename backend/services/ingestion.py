@@ -0,0 +1,322 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import inspect, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import IdempotencyKey, Portfolio, Transaction
+from .idempotency import IdempotencyFilter, idempotency_filter
+from .portfolio_service import PortfolioService
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_FIELDS = ("date", "time", "portfolio_id", "sequence_no", "investment_id", "type", "quantity",
+                      "price", "amount", "currency", "process_user")
+KEY_REUSED = "Idempotency key was already used for a different transaction"
+# Seconds after which a pending claim is presumed abandoned; must exceed the longest request
+CLAIM_TIMEOUT = float(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT", "900"))
+
+
+def request_hash(submission: Dict) -> str:
+    """Fingerprint of a submission's transaction fields, to tell replays from key reuse"""
+    fields = {field: submission.get(field) for field in TRANSACTION_FIELDS}
+    # Only set for transfers, so fingerprints stored before the field existed still match
+    if submission.get("target_portfolio_id") is not None:
+        fields["target_portfolio_id"] = submission["target_portfolio_id"]
+    canonical = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _build_transaction(submission: Dict) -> Transaction:
+    transaction = Transaction(
+        date=submission["date"],
+        time=submission["time"],
+        portfolio_id=submission["portfolio_id"],
+        sequence_no=submission["sequence_no"],
+        investment_id=submission.get("investment_id"),
+        type=submission["type"],
+        target_portfolio_id=submission.get("target_portfolio_id"),
+        quantity=submission.get("quantity"),
+        price=submission.get("price"),
+        currency=submission.get("currency"),
+        status="P",
+        process_user=submission.get("process_user") or "API"
+    )
+    if submission.get("amount") is None:
+        transaction.update_amount()
+    else:
+        transaction.amount = submission["amount"]
+    return transaction
+
+
+class TransactionIngestService:
+    """Accepts submitted transactions exactly once per idempotency key.
+    
+    New submissions are validated, stored together with their key in one
+    commit, and then handed to ``PortfolioService.process_batch``. A repeated
+    key returns the stored result of its first submission with ``replayed``
+    set; a repeated key with a different payload is reported as a conflict.
+    Keys are screened by ``IdempotencyFilter``, so a request needs at most one
+    lookup query however many rows it carries. A key left ``pending`` for more
+    than ``claim_timeout`` seconds, by a request that died before recording its
+    result, is taken over by the next submission of the same transaction.
+    """
+    
+    def __init__(self, db: Session, idempotency: IdempotencyFilter = idempotency_filter,
+                 portfolio_service: Optional[PortfolioService] = None, claim_timeout: float = CLAIM_TIMEOUT):
+        self.db = db
+        self.idempotency = idempotency
+        self.portfolio_service = portfolio_service or PortfolioService(db)
+        self.claim_timeout = claim_timeout
+        
+    def submit(self, submissions: List[Dict]) -> List[Dict]:
+        """Ingest ``submissions`` (snake_case transaction fields plus ``idempotency_key``); one result per row"""
+        self.idempotency.ensure_loaded(self.db)
+        hashes = [request_hash(submission) for submission in submissions]
+        results: List[Optional[Dict]] = [None] * len(submissions)
+        
+        first: Dict[str, int] = {}
+        for index, submission in enumerate(submissions):
+            first.setdefault(submission["idempotency_key"], index)
+            
+        recent, maybe, _ = self.idempotency.classify(first)
+        known = dict(recent)
+        known.update(self._load_entries(maybe))
+        for key, entry in known.items():
+            results[first[key]] = _replay(entry, hashes[first[key]])
+            
+        cutoff = datetime.now() - timedelta(seconds=self.claim_timeout)
+        stale = {key: entry["claimed_at"] for key, entry in known.items()
+                 if entry.get("claimed_at") is not None and entry["claimed_at"] <= cutoff
+                 and entry["request_hash"] == hashes[first[key]]}
+        accepted = self._take_over(submissions, hashes, {first[key]: claimed_at for key, claimed_at in stale.items()},
+                                   results) if stale else []
+        fresh = sorted(index for key, index in first.items() if key not in known)
+        if fresh:
+            accepted += self._claim(submissions, hashes, fresh, results)
+        self._process(submissions, hashes, accepted, results)
+            
+        for index, submission in enumerate(submissions):
+            if results[index] is None:
+                original = first[submission["idempotency_key"]]
+                entry = {"request_hash": hashes[original], "result": _stored(results[original])}
+                results[index] = _replay(entry, hashes[index])
+        return results
+        
+    def _load_entries(self, keys: List[str]) -> Dict[str, Dict]:
+        if not keys:
+            return {}
+        rows = self.db.execute(select(IdempotencyKey).where(IdempotencyKey.key.in_(keys))).scalars()
+        entries = {}
+        for row in rows:
+            entries[row.key] = {"request_hash": row.request_hash, "result": row.get_result() or {
+                "idempotencyKey": row.key, "status": "pending", "errors": [], "transaction": None
+            }}
+            if row.status == "pending":
+                entries[row.key]["claimed_at"] = row.claimed_at
+            else:
+                self.idempotency.remember(row.key, entries[row.key])
+        return entries
+        
+    def _take_over(self, submissions: List[Dict], hashes: List[str], claims: Dict[int, datetime],
+                   results: List) -> List[Tuple[int, Transaction]]:
+        """Move stale pending claims to this request; returns their transactions still to process.
+        
+        ``claims`` maps a submission index to the stale ``claimed_at`` of its key.
+        The claim moves with a compare-and-set on ``claimed_at``, so only one of
+        several retries takes a key over. The claim commit stored the
+        transaction with its key; if the dead request got as far as processing
+        it, only the result is recorded.
+        """
+        resumed, finished = [], []
+        for index, claimed_at in claims.items():
+            submission = submissions[index]
+            key = submission["idempotency_key"]
+            taken = self.db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key, IdempotencyKey.status == "pending",
+                       IdempotencyKey.claimed_at == claimed_at)
+                .values(claimed_at=datetime.now())
+            ).rowcount
+            self.db.commit()
+            if not taken:
+                continue
+            logger.warning("Took over stale claim of idempotency key %s", key)
+            
+            transaction = self.db.get(Transaction, (submission["date"], submission["time"],
+                                                    submission["portfolio_id"], submission["sequence_no"]))
+            if transaction is None:
+                accepted, rejected = self._validate(submissions, [index])
+                if rejected:
+                    results[index] = _result(submission, "rejected", rejected[index])
+                    finished.append(index)
+                    continue
+                transaction = accepted[0][1]
+                self.db.add(transaction)
+                self.db.commit()
+            if transaction.status == 'P':
+                resumed.append((index, transaction))
+            elif transaction.status == 'F':
+                results[index] = _result(submission, "failed", ["Transaction failed before its result was recorded"])
+                finished.append(index)
+            else:
+                results[index] = _result(submission, "processed", [])
+                finished.append(index)
+        self._record(submissions, hashes, finished, results)
+        return resumed
+        
+    def _validate(self, submissions: List[Dict], indices: List[int]) -> Tuple[List[Tuple[int, Transaction]], Dict]:
+        portfolio_ids = {submissions[index]["portfolio_id"] for index in indices}
+        portfolio_ids |= {submissions[index].get("target_portfolio_id") for index in indices} - {None}
+        existing = set(self.db.execute(
+            select(Portfolio.port_id).where(Portfolio.port_id.in_(portfolio_ids))
+        ).scalars())
+        
+        accepted, rejected = [], {}
+        for index in indices:
+            transaction = _build_transaction(submissions[index])
+            errors = transaction.validate_transaction()["errors"]
+            if transaction.portfolio_id not in existing:
+                errors.append("Portfolio not found")
+            if transaction.target_portfolio_id and transaction.target_portfolio_id not in existing:
+                errors.append("Target portfolio not found")
+            if errors:
+                rejected[index] = errors
+            else:
+                accepted.append((index, transaction))
+        return accepted, rejected
+        
+    def _claim(self, submissions: List[Dict], hashes: List[str], indices: List[int],
+               results: List) -> List[Tuple[int, Transaction]]:
+        """Store keys and accepted transactions in one commit; returns the accepted rows"""
+        accepted, rejected = self._validate(submissions, indices)
+        now = datetime.now()
+        for index, errors in rejected.items():
+            results[index] = _result(submissions[index], "rejected", errors)
+            
+        keys = {index: IdempotencyKey(
+            key=submissions[index]["idempotency_key"],
+            request_hash=hashes[index],
+            status="rejected" if index in rejected else "pending",
+            result=json.dumps(_stored(results[index])) if index in rejected else None,
+            created_at=now,
+            claimed_at=now
+        ) for index in indices}
+        
+        try:
+            self.db.add_all(keys.values())
+            self.db.add_all(transaction for _, transaction in accepted)
+            self.db.commit()
+        except IntegrityError:
+            # Another request claimed one of the keys, or a transaction already exists
+            self.db.rollback()
+            return self._claim_each(submissions, hashes, keys, accepted, results)
+            
+        for index in rejected:
+            self.idempotency.remember(submissions[index]["idempotency_key"],
+                                      {"request_hash": hashes[index], "result": _stored(results[index])})
+        for index, _ in accepted:
+            self.idempotency.add(submissions[index]["idempotency_key"])
+        self._reload([transaction for _, transaction in accepted])
+        return accepted
+        
+    def _reload(self, transactions: List[Transaction]):
+        """Refresh transactions expired by the claim commit in one query rather than one each"""
+        if not transactions:
+            return
+        columns = (Transaction.date, Transaction.time, Transaction.portfolio_id, Transaction.sequence_no)
+        # The identity holds the primary key without loading the expired attributes
+        keys = [inspect(transaction).identity for transaction in transactions]
+        self.db.execute(select(Transaction).where(tuple_(*columns).in_(keys))).scalars().all()
+        
+    def _claim_each(self, submissions: List[Dict], hashes: List[str], keys: Dict[int, IdempotencyKey],
+                    accepted: List[Tuple[int, Transaction]], results: List) -> List[Tuple[int, Transaction]]:
+        transactions = dict(accepted)
+        claimed = []
+        for index, key in keys.items():
+            value = submissions[index]["idempotency_key"]
+            transaction = transactions.get(index)
+            try:
+                self.db.add(key)
+                if transaction is not None:
+                    self.db.add(transaction)
+                self.db.commit()
+            except IntegrityError as e:
+                self.db.rollback()
+                entry = self._load_entries([value]).get(value)
+                if entry is not None:
+                    results[index] = _replay(entry, hashes[index])
+                    continue
+                if transaction is None:
+                    raise
+                logger.info("Rejected transaction for key %s: %s", value, e.orig)
+                results[index] = _result(submissions[index], "rejected", ["Transaction already exists"])
+                now = datetime.now()
+                self.db.add(IdempotencyKey(key=value, request_hash=hashes[index], status="rejected",
+                                           result=json.dumps(_stored(results[index])), created_at=now,
+                                           claimed_at=now))
+                self.db.commit()
+                transaction = None
+                
+            if transaction is not None:
+                claimed.append((index, transaction))
+                self.idempotency.add(value)
+            else:
+                self.idempotency.remember(value, {"request_hash": hashes[index],
+                                                  "result": _stored(results[index])})
+        self._reload([transaction for _, transaction in claimed])
+        return claimed
+        
+    def _process(self, submissions: List[Dict], hashes: List[str], accepted: List[Tuple[int, Transaction]],
+                 results: List):
+        if not accepted:
+            return
+        outcome = self.portfolio_service.process_batch([transaction for _, transaction in accepted])
+        failures = {error["index"]: error["errors"] for error in outcome["errors"]}
+        
+        for position, (index, _) in enumerate(accepted):
+            errors = failures.get(position)
+            results[index] = _result(submissions[index], "failed" if errors else "processed", errors or [])
+        self._record(submissions, hashes, [index for index, _ in accepted], results)
+        
+    def _record(self, submissions: List[Dict], hashes: List[str], indices: List[int], results: List):
+        """Store the final results of claimed keys"""
+        if not indices:
+            return
+        updates = [{"key": submissions[index]["idempotency_key"], "status": results[index]["status"],
+                    "result": json.dumps(_stored(results[index]))} for index in indices]
+        self.db.execute(update(IdempotencyKey), updates)
+        self.db.commit()
+        
+        for index in indices:
+            self.idempotency.remember(submissions[index]["idempotency_key"],
+                                      {"request_hash": hashes[index], "result": _stored(results[index])})
+
+
+def _result(submission: Dict, status: str, errors: List[str]) -> Dict:
+    return {
+        "idempotencyKey": submission["idempotency_key"],
+        "status": status,
+        "errors": errors,
+        "transaction": {
+            "date": submission["date"].isoformat(),
+            "time": submission["time"].isoformat(),
+            "portfolioId": submission["portfolio_id"],
+            "sequenceNo": submission["sequence_no"]
+        },
+        "replayed": False
+    }
+
+
+def _stored(result: Dict) -> Dict:
+    return {field: value for field, value in result.items() if field != "replayed"}
+
+
+def _replay(entry: Dict, request_hash_: str) -> Dict:
+    result = entry["result"]
+    if entry["request_hash"] != request_hash_:
+        return dict(result, status="conflict", errors=[KEY_REUSED], replayed=False)
+    return dict(result, replayed=True)
@@ -0,0 +1,160 @@
+import logging
+import os
+import random
+import time
+import threading
+from typing import Callable, Dict, Iterable, TypeVar
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from models import Portfolio
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LOCK_RETRIES = int(os.getenv("PORTFOLIO_LOCK_RETRIES", "5"))
+LOCK_BACKOFF_SECONDS = float(os.getenv("PORTFOLIO_LOCK_BACKOFF_SECONDS", "0.01"))
+WRITE_RETRIES = int(os.getenv("PORTFOLIO_WRITE_RETRIES", "5"))
+
+# PostgreSQL: deadlock detected, serialization failure, lock not available (lock_timeout)
+POSTGRES_LOCK_CONFLICTS = ("40P01", "40001", "55P03")
+
+
+class PortfolioLockError(Exception):
+    """Portfolios could not be locked within the retry budget"""
+
+
+def is_lock_conflict(error: DBAPIError) -> bool:
+    """Whether a database error is a lock conflict worth retrying"""
+    code = getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
+    if code in POSTGRES_LOCK_CONFLICTS:
+        return True
+    return "database is locked" in str(error.orig) or "database table is locked" in str(error.orig)
+
+
+def is_audit_collision(error: Exception) -> bool:
+    """Whether an insert lost a History key to another process that allocated the same ``seq_no``"""
+    if not isinstance(error, IntegrityError):
+        return False
+    constraint = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+    return constraint == "history_pkey" or "UNIQUE constraint failed: history." in str(error.orig)
+
+
+def is_write_conflict(error: Exception) -> bool:
+    """Whether another writer got there first: a stale row version, a lock conflict or a taken audit key"""
+    if isinstance(error, StaleDataError) or is_audit_collision(error):
+        return True
+    return isinstance(error, DBAPIError) and is_lock_conflict(error)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Jittered exponential backoff before retry number ``attempt + 1``"""
+    return LOCK_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+
+
+class ConflictStats:
+    """Thread-safe counts of optimistic write attempts and the conflicts among them"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._attempts = 0
+        self._conflicts = 0
+        self._exhausted = 0
+        
+    def record(self, conflict: bool = False, exhausted: bool = False):
+        with self._lock:
+            self._attempts += 1
+            self._conflicts += conflict
+            self._exhausted += exhausted
+            
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "attempts": self._attempts,
+                "conflicts": self._conflicts,
+                "retries_exhausted": self._exhausted,
+                "conflict_rate": self._conflicts / self._attempts if self._attempts else 0.0
+            }
+
+
+write_conflicts = ConflictStats()
+
+
+def retry_on_conflict(operation: Callable[[], T], reset: Callable[[], None], retries: int = WRITE_RETRIES,
+                      stats: ConflictStats = write_conflicts) -> T:
+    """Run ``operation``, retrying it with backoff when it loses a race with another writer.
+    
+    Portfolio and Position rows carry a version column, so an update based on
+    a stale read fails at flush with StaleDataError instead of silently
+    overwriting the other writer's change. History keys are allocated per
+    process, so an audit row can also collide with another process's; the
+    retry allocates a fresh key. ``reset`` must undo the failed attempt (roll
+    back the session and restore any in-memory state) so the next attempt
+    reads the rows afresh. After ``retries`` retries the conflict
+    is raised. Every attempt is counted in ``stats``.
+    """
+    for attempt in range(retries + 1):
+        try:
+            result = operation()
+        except Exception as e:
+            conflict = is_write_conflict(e)
+            stats.record(conflict=conflict, exhausted=conflict and attempt == retries)
+            if not conflict or attempt == retries:
+                raise
+            reset()
+            delay = backoff_delay(attempt)
+            logger.info("Write conflict (%s), retrying in %.3fs", type(e).__name__, delay)
+            time.sleep(delay)
+            continue
+        stats.record()
+        return result
+
+
+def lock_portfolios(db: Session, port_ids: Iterable[str], retries: int = LOCK_RETRIES) -> Dict[str, Portfolio]:
+    """Lock portfolios for the rest of the session's transaction and return them by ``port_id``.
+    
+    Every caller takes the locks in ``port_id`` order, so two workers moving
+    money between the same portfolios queue up instead of deadlocking.
+    PostgreSQL locks the rows with ``SELECT ... FOR UPDATE``. SQLite has no
+    row locks, so the transaction takes the database write lock up front with
+    ``BEGIN IMMEDIATE``; a reader that later tries to write can then never
+    deadlock with another writer. A conflict (a deadlock reported by another
+    code path, lock_timeout, or SQLite's busy timeout) is retried up to
+    ``retries`` times with jittered backoff before PortfolioLockError.
+    The locked rows are reloaded, so the returned values are current.
+    """
+    port_ids = sorted(set(port_ids))
+    statement = select(Portfolio).where(Portfolio.port_id.in_(port_ids)).order_by(Portfolio.port_id)
+    statement = statement.execution_options(populate_existing=True)
+    sqlite = db.get_bind().dialect.name == "sqlite"
+    for attempt in range(retries + 1):
+        try:
+            if sqlite:
+                _begin_immediate(db)
+                portfolios = db.execute(statement).scalars().all()
+            else:
+                # A savepoint keeps a failed attempt from aborting the caller's transaction
+                with db.begin_nested():
+                    portfolios = db.execute(statement.with_for_update()).scalars().all()
+            return {portfolio.port_id: portfolio for portfolio in portfolios}
+        except DBAPIError as e:
+            if not is_lock_conflict(e):
+                raise
+            if attempt == retries:
+                raise PortfolioLockError(f"Could not lock portfolios {', '.join(port_ids)}") from e
+            delay = backoff_delay(attempt)
+            logger.info("Lock conflict on portfolios %s, retrying in %.3fs", port_ids, delay)
+            time.sleep(delay)
+
+
+def _begin_immediate(db: Session):
+    """Start the connection's SQLite transaction as a writer, unless it already is one.
+    
+    pysqlite opens a transaction only at the first write, and a write holds the
+    write lock, so an open transaction already owns it.
+    """
+    connection = db.connection()
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
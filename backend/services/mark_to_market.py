@@ -0,0 +1,178 @@
+import csv
+import logging
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import Column, MetaData, Numeric, String, Table, and_, func, insert, select, update
+from sqlalchemy.engine import Connection, Engine
+from models import Portfolio, Position, engine as default_engine
+from .cache import TTLCache, portfolio_cache
+
+logger = logging.getLogger(__name__)
+
+_staging = MetaData()
+
+mtm_prices = Table(
+    "mtm_prices", _staging,
+    Column("investment_id", String(10), primary_key=True),
+    Column("price", Numeric(15, 4), nullable=False),
+    prefixes=["TEMPORARY"]
+)
+
+mtm_portfolios = Table(
+    "mtm_portfolios", _staging,
+    Column("portfolio_id", String(8), primary_key=True),
+    prefixes=["TEMPORARY"]
+)
+
+
+def read_price_file(path: str, chunk_size: int = 10000) -> Iterator[List[Tuple[str, Decimal]]]:
+    """Stream ``(investment_id, price)`` chunks from a CSV or Parquet file.
+    
+    CSV files need ``investment_id`` and ``price`` header columns. Parquet
+    files need the same column names and require pyarrow. Rows with a
+    missing id or a non-positive or unparsable price are logged and skipped.
+    """
+    if str(path).endswith(".parquet"):
+        rows = _read_parquet(path, chunk_size)
+    else:
+        rows = _read_csv(path)
+        
+    chunk = []
+    for line, (investment_id, raw_price) in enumerate(rows, start=1):
+        price = _parse_price(raw_price)
+        investment_id = (investment_id or "").strip()
+        if price is None or not investment_id or len(investment_id) > 10:
+            logger.warning("Skipping price row %d: %r, %r", line, investment_id, raw_price)
+            continue
+        chunk.append((investment_id, price))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _read_csv(path: str) -> Iterator[Tuple[str, str]]:
+    with open(path, newline="") as handle:
+        for row in csv.DictReader(handle):
+            yield row.get("investment_id"), row.get("price")
+
+
+def _read_parquet(path: str, batch_size: int) -> Iterator[Tuple[str, object]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Reading Parquet price files requires pyarrow") from e
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=["investment_id", "price"]):
+        columns = batch.to_pydict()
+        yield from zip(columns["investment_id"], columns["price"])
+
+
+def _parse_price(raw) -> Optional[Decimal]:
+    try:
+        price = Decimal(str(raw).strip()).quantize(Decimal("0.0001"))
+    except (InvalidOperation, ValueError):
+        return None
+    return price if price.is_finite() and price > 0 else None
+
+
+class MarkToMarketJob:
+    """Revalues active positions from a price feed with set-based SQL.
+    
+    Each chunk of prices is loaded into a temporary staging table and applied
+    with one ``UPDATE positions ... FROM mtm_prices`` statement, then committed,
+    so memory and transaction size are bounded by ``chunk_size`` regardless of
+    the number of positions. Portfolios touched by any chunk get their
+    ``total_value`` recomputed in a single statement at the end. Both updates
+    bump the row versions, so a service write based on an older read retries.
+    """
+    
+    def __init__(self, engine: Engine = default_engine, chunk_size: int = 10000, user: str = "MTM",
+                 cache: Optional[TTLCache] = portfolio_cache):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.user = user
+        self.cache = cache
+        
+    def run(self, path: str) -> Dict:
+        """Apply a price file; returns row counts, elapsed seconds and throughput"""
+        return self.apply(read_price_file(path, self.chunk_size))
+        
+    def apply(self, price_chunks) -> Dict:
+        started = time.perf_counter()
+        stats = {"prices": 0, "positions_updated": 0, "portfolios_updated": 0}
+        
+        # Temporary tables live on one connection, so the whole run stays on it
+        with self.engine.connect() as connection:
+            _staging.create_all(connection)
+            connection.commit()
+            try:
+                for chunk in price_chunks:
+                    latest = dict(chunk)
+                    stats["prices"] += len(latest)
+                    stats["positions_updated"] += self._apply_chunk(connection, latest)
+                    connection.commit()
+                stats["portfolios_updated"] = self._refresh_totals(connection)
+                connection.commit()
+            finally:
+                connection.rollback()
+                _staging.drop_all(connection)
+                connection.commit()
+                
+        if self.cache is not None and stats["portfolios_updated"]:
+            self.cache.clear()
+            
+        elapsed = time.perf_counter() - started
+        stats["elapsed_seconds"] = elapsed
+        stats["rows_per_second"] = stats["positions_updated"] / elapsed if elapsed else 0.0
+        logger.info("Mark-to-market: %(prices)d prices, %(positions_updated)d positions, "
+                    "%(portfolios_updated)d portfolios in %(elapsed_seconds).2fs", stats)
+        return stats
+        
+    def _apply_chunk(self, connection: Connection, prices: Dict[str, Decimal]) -> int:
+        connection.execute(mtm_prices.delete())
+        connection.execute(insert(mtm_prices), [
+            {"investment_id": investment_id, "price": price} for investment_id, price in prices.items()
+        ])
+        
+        priced = and_(Position.investment_id == mtm_prices.c.investment_id, Position.status == 'A')
+        touched = select(Position.portfolio_id).distinct().where(priced).where(
+            Position.portfolio_id.not_in(select(mtm_portfolios.c.portfolio_id))
+        )
+        connection.execute(insert(mtm_portfolios).from_select(["portfolio_id"], touched))
+        
+        result = connection.execute(
+            update(Position.__table__)
+            .where(priced)
+            .values(
+                market_value=func.round(Position.quantity * mtm_prices.c.price, 2),
+                last_maint_date=datetime.now(),
+                last_maint_user=self.user,
+                version=Position.version + 1
+            )
+        )
+        return result.rowcount
+        
+    def _refresh_totals(self, connection: Connection) -> int:
+        market_values = select(
+            Position.portfolio_id,
+            func.sum(Position.market_value).label("market_value")
+        ).where(
+            Position.status == 'A',
+            Position.portfolio_id.in_(select(mtm_portfolios.c.portfolio_id))
+        ).group_by(Position.portfolio_id).subquery()
+        
+        result = connection.execute(
+            update(Portfolio.__table__)
+            .where(Portfolio.port_id == market_values.c.portfolio_id)
+            .values(
+                total_value=func.coalesce(Portfolio.cash_balance, 0) + market_values.c.market_value,
+                last_maint=date.today(),
+                version=Portfolio.version + 1
+            )
+        )
+        return result.rowcount
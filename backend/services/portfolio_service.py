@@ -1,55 +1,505 @@
-from sqlalchemy.orm import Session
-from models import Portfolio, Position, Transaction, History
-from typing import Dict, List, Optional
+from sqlalchemy import func, literal, select, tuple_
+from sqlalchemy.orm import Session, joinedload
+from models import Portfolio, Position, Transaction, History, history_sequence
+from models.portfolio import PortfolioSummary, PortfolioHolding
+from typing import Dict, Iterator, List, Optional, Tuple
 from decimal import Decimal
-from datetime import datetime, date
+from datetime import datetime, date, time
+from .audit_sink import AuditSink
+from .cache import TTLCache, portfolio_cache
+from .history_archive import HistoryArchive, history_archive, merge_history
+from .locking import WRITE_RETRIES, is_write_conflict, lock_portfolios, retry_on_conflict
+from .tax_lots import LotSelection, TaxLotLedger, default_lot_method
+from .pagination import decode_cursor, encode_cursor
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_KEY = (Transaction.date, Transaction.time, Transaction.portfolio_id, Transaction.sequence_no)
+HISTORY_KEY = (History.process_date, History.date, History.time, History.seq_no)
+HISTORY_RECORD_TYPES = ('PT', 'PS', 'TR')
+HISTORY_ACTION_CODES = ('A', 'C', 'D')
+
+
+def position_change(quantity: Optional[Decimal], cost_basis: Optional[Decimal], transaction_type: str,
+                    transaction_quantity: Decimal, amount: Decimal,
+                    relieved_cost: Optional[Decimal] = None) -> Tuple[Decimal, Decimal]:
+    """Quantity and cost basis of a position after a buy or sell.
+    
+    A sell relieves ``relieved_cost``, the cost of the tax lots it consumed,
+    when lots are tracked, and average cost otherwise.
+    """
+    quantity = quantity or Decimal('0.00')
+    cost_basis = cost_basis or Decimal('0.00')
+    
+    if transaction_type == 'BU':
+        return quantity + transaction_quantity, cost_basis + amount
+    
+    if relieved_cost is not None:
+        return quantity - transaction_quantity, cost_basis - relieved_cost
+    if quantity > 0:
+        cost_per_share = cost_basis / quantity
+        cost_basis = cost_basis - transaction_quantity * cost_per_share
+    return quantity - transaction_quantity, cost_basis
+
 
 class PortfolioService:
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, audit_sink: Optional[AuditSink] = None,
+                 cache: Optional[TTLCache] = portfolio_cache, archive: Optional[HistoryArchive] = history_archive,
+                 lot_method: Optional[str] = default_lot_method, write_retries: int = WRITE_RETRIES):
         self.db = db
+        self.audit_sink = audit_sink
+        self.cache = cache
+        self.archive = archive
+        # Retries of a write that lost a version check (or a lock) to a concurrent writer
+        self.write_retries = write_retries
+        # Tax lots are tracked only with a lot method (FIFO, LIFO or SPEC)
+        self.lots = TaxLotLedger(db, lot_method) if lot_method else None
+        history_sequence.ensure_reconciled(db)
     
-    def process_transaction(self, transaction: Transaction) -> Dict[str, bool]:
+    def process_transaction(self, transaction: Transaction,
+                            lot_selection: Optional[LotSelection] = None) -> Dict[str, bool]:
+        """Apply one transaction and commit.
+        
+        With lot tracking, a buy opens a tax lot and a sell relieves lots, by
+        specific ID when ``lot_selection`` is given; the sell's realized gains
+        are returned under ``realized_gains``. A write conflict with another
+        worker is rolled back and the transaction retried from a fresh read.
+        """
+        attempt_state = self._attempt_state([transaction])
         try:
+            return retry_on_conflict(
+                lambda: self._apply_transaction(transaction, lot_selection),
+                lambda: self._reset_attempt(attempt_state),
+                self.write_retries
+            )
+        except Exception as e:
+            self._reset_attempt(attempt_state, reattach=False)
+            transaction.transition_status('F', transaction.process_user or "SYSTEM")
+            return {"success": False, "errors": [str(e)]}
+    
+    def _apply_transaction(self, transaction: Transaction, lot_selection: Optional[LotSelection]) -> Dict:
+        validation = transaction.validate_transaction()
+        if not validation["valid"]:
+            return {"success": False, "errors": validation["errors"]}
+        
+        self._audit(
+            portfolio_id=transaction.portfolio_id,
+            record_type="TR",
+            action_code="A",
+            after_data=transaction.to_dict(),
+            reason_code="PROC",
+            user=transaction.process_user or "SYSTEM"
+        )
+        
+        value_change = Decimal('0.00')
+        realized = []
+        target = None
+        if transaction.type in ['BU', 'SL']:
+            realized = self._apply_lots(transaction, lot_selection)
+            value_change = self._process_buy_sell_transaction(transaction, self._relieved_cost(realized))
+        elif transaction.type == 'TR':
+            value_change, target = self._process_transfer_transaction(transaction)
+        elif transaction.type == 'FE':
+            value_change = self._process_fee_transaction(transaction)
+        
+        transaction.transition_status('D', transaction.process_user or "SYSTEM")
+        
+        portfolio = self.db.query(Portfolio).filter(
+            Portfolio.port_id == transaction.portfolio_id
+        ).first()
+        if portfolio:
+            portfolio.apply_value_change(value_change)
+        
+        result = {"success": True, "errors": []}
+        if self.lots is not None:
+            result["realized_gains"] = [gain.to_dict() for gain in realized]
+        accounts = {p.account_no for p in (portfolio, target) if p is not None}
+        self.db.commit()
+        for account_no in accounts:
+            self._invalidate_cached_summary(account_no)
+        return result
+    
+    def process_batch(self, transactions: List[Transaction], chunk_size: int = 1000,
+                      lot_selections: Optional[Dict[Tuple, LotSelection]] = None) -> Dict:
+        """Process transactions in chunks, committing once per chunk.
+        
+        Portfolios and positions touched by a chunk are preloaded with set-based
+        queries, effects are applied in memory and the audit rows are bulk inserted.
+        A transaction that fails is reported in ``errors`` and leaves no effects;
+        the rest of its chunk is still committed. A chunk whose commit loses a
+        write conflict is rolled back and retried as a whole. With lot tracking,
+        ``lot_selections`` maps a sell's ``(date, time, portfolio_id, sequence_no)``
+        to its specific-ID lots.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+            
+        results = {"success": True, "processed": 0, "failed": 0, "errors": []}
+        for start in range(0, len(transactions), chunk_size):
+            chunk = transactions[start:start + chunk_size]
+            attempt_state = self._attempt_state(chunk)
+            chunk_results = {}
+            
+            def attempt():
+                chunk_results.update(processed=0, failed=0, errors=[])
+                self._process_chunk(chunk, start, chunk_results, lot_selections or {})
+                
+            try:
+                retry_on_conflict(attempt, lambda: self._reset_attempt(attempt_state), self.write_retries)
+            except Exception as e:
+                if not is_write_conflict(e):
+                    raise
+                # Out of retries: the last attempt has already recorded its transactions as failed
+            results["processed"] += chunk_results["processed"]
+            results["failed"] += chunk_results["failed"]
+            results["errors"].extend(chunk_results["errors"])
+            
+        results["success"] = results["failed"] == 0
+        return results
+        
+    def _process_chunk(self, chunk: List[Transaction], offset: int, results: Dict,
+                       lot_selections: Dict[Tuple, LotSelection]):
+        port_ids = {t.portfolio_id for t in chunk}
+        targets = {t.target_portfolio_id for t in chunk if t.type == 'TR' and t.target_portfolio_id}
+        if targets:
+            # Transfers lock every portfolio in the chunk, in port_id order, before reading cash
+            try:
+                portfolios = lock_portfolios(self.db, port_ids | targets)
+            except Exception as e:
+                self._rollback()
+                for index, transaction in enumerate(chunk, start=offset):
+                    transaction.transition_status('F', transaction.process_user or "SYSTEM")
+                    self._record_failure(results, index, transaction, [str(e)])
+                return
+        else:
+            portfolios = self._load_portfolios(port_ids)
+        positions = self._load_positions({
+            (t.portfolio_id, t.investment_id, t.date)
+            for t in chunk if t.type in ['BU', 'SL']
+        })
+        if self.lots is not None:
+            self.lots.load({(t.portfolio_id, t.investment_id) for t in chunk if t.type in ['BU', 'SL']})
+        
+        audit_rows = []
+        value_changes = {}
+        succeeded = []
+        for index, transaction in enumerate(chunk, start=offset):
             validation = transaction.validate_transaction()
             if not validation["valid"]:
-                return {"success": False, "errors": validation["errors"]}
-            
-            audit_record = History.create_audit_record(
-                portfolio_id=transaction.portfolio_id,
-                record_type="TR",
-                action_code="A",
-                after_data=transaction.to_dict(),
-                reason_code="PROC",
-                user=transaction.process_user or "SYSTEM",
-                db_session=self.db
+                self._record_failure(results, index, transaction, validation["errors"])
+                continue
+                
+            user = transaction.process_user or "SYSTEM"
+            try:
+                rows = [History.build_audit_values(
+                    portfolio_id=transaction.portfolio_id,
+                    record_type="TR",
+                    action_code="A",
+                    after_data=transaction.to_dict(),
+                    reason_code="PROC",
+                    user=user
+                )]
+                
+                value_change = Decimal('0.00')
+                if transaction.type in ['BU', 'SL']:
+                    # Lots go first: an uncovered sell fails before the position changes
+                    realized = self._apply_lots(transaction, lot_selections.get(
+                        (transaction.date, transaction.time, transaction.portfolio_id, transaction.sequence_no)
+                    ))
+                    row, value_change = self._apply_buy_sell_in_memory(transaction, positions,
+                                                                       self._relieved_cost(realized))
+                    rows.append(row)
+                elif transaction.type == 'FE':
+                    portfolio = portfolios.get(transaction.portfolio_id)
+                    if portfolio:
+                        row, value_change = self._apply_fee_in_memory(transaction, portfolio)
+                        rows.append(row)
+                elif transaction.type == 'TR':
+                    rows.extend(self._apply_transfer_in_memory(transaction, portfolios))
+                    value_change = -transaction.amount
+                    value_changes[transaction.target_portfolio_id] = (
+                        value_changes.get(transaction.target_portfolio_id, Decimal('0.00')) + transaction.amount
+                    )
+            except Exception as e:
+                transaction.transition_status('F', user)
+                self._record_failure(results, index, transaction, [str(e)])
+                continue
+                
+            audit_rows.extend(rows)
+            value_changes[transaction.portfolio_id] = (
+                value_changes.get(transaction.portfolio_id, Decimal('0.00')) + value_change
             )
-            self.db.add(audit_record)
+            transaction.transition_status('D', user)
+            succeeded.append((index, transaction))
             
-            if transaction.type in ['BU', 'SL']:
-                self._process_buy_sell_transaction(transaction)
-            elif transaction.type == 'TR':
-                self._process_transfer_transaction(transaction)
-            elif transaction.type == 'FE':
-                self._process_fee_transaction(transaction)
-            
-            transaction.transition_status('D', transaction.process_user or "SYSTEM")
+        try:
+            self._write_audit_rows(audit_rows)
+            self.db.flush()
             
-            portfolio = self.db.query(Portfolio).filter(
-                Portfolio.port_id == transaction.portfolio_id
-            ).first()
-            if portfolio:
-                portfolio.update_total_value()
+            for portfolio_id, value_change in value_changes.items():
+                portfolio = portfolios.get(portfolio_id)
+                if portfolio:
+                    portfolio.apply_value_change(value_change)
+                    
+            self.db.commit()
+            results["processed"] += len(succeeded)
+            for portfolio_id in value_changes:
+                portfolio = portfolios.get(portfolio_id)
+                if portfolio:
+                    self._invalidate_cached_summary(portfolio.account_no)
+        except Exception as e:
+            self._rollback()
+            for index, transaction in succeeded:
+                transaction.transition_status('F', transaction.process_user or "SYSTEM")
+                self._record_failure(results, index, transaction, [str(e)])
+            if is_write_conflict(e):
+                raise
+                
+    def reconcile_total_values(self, fix: bool = False, tolerance: Decimal = Decimal('0.00')) -> List[Dict]:
+        """Recompute every portfolio total from positions and report drift.
+        
+        total_value is maintained incrementally, so this full recompute is meant
+        to run periodically. One aggregate query covers all portfolios; with
+        ``fix`` the drifted totals are overwritten and committed.
+        """
+        position_totals = select(
+            Position.portfolio_id,
+            func.sum(Position.market_value).label("market_value")
+        ).where(Position.status == 'A').group_by(Position.portfolio_id).subquery()
+        
+        rows = self.db.query(Portfolio, position_totals.c.market_value).outerjoin(
+            position_totals, position_totals.c.portfolio_id == Portfolio.port_id
+        )
+        
+        drifted = []
+        for portfolio, market_value in rows:
+            expected = (
+                (market_value or Decimal('0.00')) + (portfolio.cash_balance or Decimal('0.00'))
+            ).quantize(Decimal('0.01'))
+            stored = portfolio.total_value
+            if stored is not None and abs(stored - expected) <= tolerance:
+                continue
             
+            drifted.append({
+                "port_id": portfolio.port_id,
+                "account_no": portfolio.account_no,
+                "stored": stored,
+                "expected": expected,
+                "drift": stored - expected if stored is not None else None
+            })
+            logger.warning("Portfolio %s total_value drift: stored=%s expected=%s",
+                           portfolio.port_id, stored, expected)
+            if fix:
+                portfolio.total_value = expected
+        
+        if fix and drifted:
             self.db.commit()
-            return {"success": True, "errors": []}
+            for item in drifted:
+                self._invalidate_cached_summary(item["account_no"])
+        return drifted
+    
+    def get_portfolio_summary(self, account_no: str) -> Optional[PortfolioSummary]:
+        """Summary and holdings for an account, served from the cache when possible"""
+        if self.cache is None:
+            return self._load_portfolio_summary(account_no)
+        return self.cache.get_or_load(account_no, lambda: self._load_portfolio_summary(account_no))
+    
+    def _load_portfolio_summary(self, account_no: str) -> Optional[PortfolioSummary]:
+        portfolios = self.db.execute(portfolio_summary_statement(account_no)).unique().scalars().all()
+        if not portfolios:
+            return None
+        return build_portfolio_summary(account_no, portfolios)
+    
+    def list_transactions(self, account_no: str, limit: int = 100, cursor: Optional[str] = None,
+                          from_date: Optional[date] = None, to_date: Optional[date] = None,
+                          transaction_type: Optional[str] = None, status: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of an account's transactions in primary key order.
+        
+        Returns the rows and the cursor for the next page (None on the last page).
+        Raises ValueError for a malformed cursor or filter.
+        """
+        statement = transactions_statement(account_no, from_date, to_date, transaction_type, status, cursor)
+        rows = self.db.execute(statement.limit(limit + 1)).scalars().all()
+        return transactions_page(rows, limit)
+    
+    def iter_transactions(self, account_no: str, batch_size: int = 1000,
+                          from_date: Optional[date] = None, to_date: Optional[date] = None,
+                          transaction_type: Optional[str] = None, status: Optional[str] = None) -> Iterator[Transaction]:
+        """Stream an account's transactions in key order without materializing the result.
+        
+        ``yield_per`` makes drivers that support it (psycopg) use a server-side cursor.
+        """
+        statement = transactions_statement(account_no, from_date, to_date, transaction_type, status)
+        yield from self.db.execute(statement.execution_options(yield_per=batch_size)).scalars()
+    
+    def list_history(self, portfolio_id: str, limit: int = 100, cursor: Optional[str] = None,
+                     from_time: Optional[datetime] = None, to_time: Optional[datetime] = None,
+                     record_type: Optional[str] = None, action_code: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of a portfolio's audit trail in ``process_date`` order.
+        
+        Rows moved to the history archive are merged in, so archived and live
+        ranges page the same way.
+        Returns the rows and the cursor for the next page (None on the last page).
+        Raises ValueError for a malformed cursor or filter.
+        """
+        statement = history_statement(portfolio_id, from_time, to_time, record_type, action_code, cursor)
+        rows = self.db.execute(statement.limit(limit + 1)).scalars().all()
+        if self.archive is not None:
+            archived = self.archive.query(portfolio_id, from_time, to_time, record_type, action_code,
+                                          history_cursor(cursor), limit + 1)
+            rows = merge_history(rows, archived, limit + 1)
+        return history_page(rows, limit)
+        
+    def _apply_lots(self, transaction: Transaction, selection: Optional[LotSelection] = None) -> List:
+        if self.lots is None:
+            return []
+        return self.lots.apply(transaction, selection)
+        
+    def _relieved_cost(self, realized: List) -> Optional[Decimal]:
+        """Cost of the lots a sell consumed, or None without lot tracking"""
+        if self.lots is None:
+            return None
+        return sum((gain.cost_basis for gain in realized), Decimal('0.00'))
+        
+    def _rollback(self):
+        self.db.rollback()
+        if self.lots is not None:
+            self.lots.clear()
             
-        except Exception as e:
-            self.db.rollback()
-            transaction.transition_status('F', transaction.process_user or "SYSTEM")
-            return {"success": False, "errors": [str(e)]}
+    def _attempt_state(self, transactions: List[Transaction]) -> List[Tuple]:
+        """What ``_reset_attempt`` needs to put the transactions back as they were before an attempt"""
+        return [(t, t in self.db, t.status, t.process_date, t.process_user) for t in transactions]
+        
+    def _reset_attempt(self, attempt_state: List[Tuple], reattach: bool = True):
+        # A rollback expunges pending objects and leaves transient ones as the attempt left them
+        self._rollback()
+        for transaction, attached, status, process_date, process_user in attempt_state:
+            if reattach and attached and transaction not in self.db:
+                self.db.add(transaction)
+            transaction.status = status
+            transaction.process_date = process_date
+            transaction.process_user = process_user
+        
+    def _invalidate_cached_summary(self, account_no: str):
+        if self.cache is not None:
+            self.cache.invalidate(account_no)
+    
+    def _audit(self, **kwargs):
+        values = History.build_audit_values(**kwargs)
+        if self.audit_sink:
+            self.audit_sink.add(values, self.db)
+        else:
+            self.db.add(History(**values))
     
-    def _process_buy_sell_transaction(self, transaction: Transaction):
+    def _write_audit_rows(self, rows: List[Dict]):
+        if not rows:
+            return
+        if self.audit_sink:
+            self.audit_sink.add_many(rows, self.db)
+        else:
+            self.db.execute(History.bulk_insert(), rows)
+    
+    def _load_portfolios(self, portfolio_ids) -> Dict[str, Portfolio]:
+        portfolios = {}
+        if portfolio_ids:
+            for portfolio in self.db.query(Portfolio).filter(Portfolio.port_id.in_(portfolio_ids)):
+                portfolios.setdefault(portfolio.port_id, portfolio)
+        return portfolios
+        
+    def _load_positions(self, position_keys) -> Dict[Tuple, Position]:
+        if not position_keys:
+            return {}
+        query = self.db.query(Position).filter(
+            tuple_(Position.portfolio_id, Position.investment_id, Position.date).in_(position_keys)
+        )
+        return {
+            (position.portfolio_id, position.investment_id, position.date): position
+            for position in query
+        }
+        
+    @staticmethod
+    def _record_failure(results: Dict, index: int, transaction: Transaction, errors: List[str]):
+        results["failed"] += 1
+        results["errors"].append({
+            "index": index,
+            "portfolio_id": transaction.portfolio_id,
+            "sequence_no": transaction.sequence_no,
+            "errors": errors
+        })
+        
+    def _apply_buy_sell_in_memory(self, transaction: Transaction, positions: Dict[Tuple, Position],
+                                  relieved_cost: Optional[Decimal] = None) -> Tuple[Dict, Decimal]:
+        key = (transaction.portfolio_id, transaction.investment_id, transaction.date)
+        position = positions.get(key)
+        is_new = position is None
+        if is_new:
+            position = self._new_position(transaction)
+            
+        before_data = position.to_dict() if position.quantity else None
+        before_value = position.valued_amount()
+        new_quantity, new_cost_basis = self._calculate_position_change(position, transaction, relieved_cost)
+        
+        position.quantity = new_quantity
+        position.cost_basis = new_cost_basis
+        position.last_maint_date = datetime.now()
+        position.last_maint_user = transaction.process_user
+        if is_new:
+            positions[key] = position
+            self.db.add(position)
+            
+        row = History.build_audit_values(
+            portfolio_id=transaction.portfolio_id,
+            record_type="PS",
+            action_code="C",
+            before_data=before_data,
+            after_data=position.to_dict(),
+            reason_code="TRAN",
+            user=transaction.process_user or "SYSTEM"
+        )
+        return row, position.valued_amount() - before_value
+        
+    def _apply_fee_in_memory(self, transaction: Transaction, portfolio: Portfolio) -> Tuple[Dict, Decimal]:
+        before_data = portfolio.to_dict()
+        portfolio.cash_balance = (portfolio.cash_balance or Decimal('0.00')) - transaction.amount
+        portfolio.last_maint = date.today()
+        portfolio.last_user = transaction.process_user
+        
+        row = History.build_audit_values(
+            portfolio_id=transaction.portfolio_id,
+            record_type="PT",
+            action_code="C",
+            before_data=before_data,
+            after_data=portfolio.to_dict(),
+            reason_code="FEE",
+            user=transaction.process_user or "SYSTEM"
+        )
+        return row, -transaction.amount
+        
+    @staticmethod
+    def _new_position(transaction: Transaction) -> Position:
+        return Position(
+            portfolio_id=transaction.portfolio_id,
+            investment_id=transaction.investment_id,
+            date=transaction.date,
+            quantity=Decimal('0.00'),
+            cost_basis=Decimal('0.00'),
+            market_value=Decimal('0.00'),
+            currency=transaction.currency,
+            status='A',
+            last_maint_date=datetime.now(),
+            last_maint_user=transaction.process_user
+        )
+        
+    @staticmethod
+    def _calculate_position_change(position: Position, transaction: Transaction,
+                                   relieved_cost: Optional[Decimal] = None) -> Tuple[Decimal, Decimal]:
+        return position_change(position.quantity, position.cost_basis, transaction.type,
+                               transaction.quantity, transaction.amount, relieved_cost)
+        
+    def _process_buy_sell_transaction(self, transaction: Transaction,
+                                      relieved_cost: Optional[Decimal] = None) -> Decimal:
         position = self.db.query(Position).filter(
             Position.portfolio_id == transaction.portfolio_id,
             Position.investment_id == transaction.investment_id,
@@ -57,54 +507,64 @@ class PortfolioService:
         ).first()
         
         if not position:
-            position = Position(
-                portfolio_id=transaction.portfolio_id,
-                investment_id=transaction.investment_id,
-                date=transaction.date,
-                quantity=Decimal('0.00'),
-                cost_basis=Decimal('0.00'),
-                market_value=Decimal('0.00'),
-                currency=transaction.currency,
-                status='A',
-                last_maint_date=datetime.now(),
-                last_maint_user=transaction.process_user
-            )
+            position = self._new_position(transaction)
             self.db.add(position)
-        
+            
         before_data = position.to_dict() if position.quantity else None
+        before_value = position.valued_amount()
         
-        if transaction.type == 'BU':
-            new_quantity = (position.quantity or Decimal('0.00')) + transaction.quantity
-            new_cost_basis = (position.cost_basis or Decimal('0.00')) + transaction.amount
-            position.quantity = new_quantity
-            position.cost_basis = new_cost_basis
-        elif transaction.type == 'SL':
-            new_quantity = (position.quantity or Decimal('0.00')) - transaction.quantity
-            if position.quantity and position.quantity > 0:
-                cost_per_share = position.cost_basis / position.quantity
-                cost_reduction = transaction.quantity * cost_per_share
-                position.cost_basis = (position.cost_basis or Decimal('0.00')) - cost_reduction
-            position.quantity = new_quantity
+        position.quantity, position.cost_basis = self._calculate_position_change(position, transaction, relieved_cost)
         
         position.last_maint_date = datetime.now()
         position.last_maint_user = transaction.process_user
         
-        audit_record = History.create_audit_record(
+        self._audit(
             portfolio_id=transaction.portfolio_id,
             record_type="PS",
             action_code="C",
             before_data=before_data,
             after_data=position.to_dict(),
             reason_code="TRAN",
-            user=transaction.process_user or "SYSTEM",
-            db_session=self.db
+            user=transaction.process_user or "SYSTEM"
         )
-        self.db.add(audit_record)
+        return position.valued_amount() - before_value
     
-    def _process_transfer_transaction(self, transaction: Transaction):
-        pass
+    def _process_transfer_transaction(self, transaction: Transaction) -> Tuple[Decimal, Portfolio]:
+        """Move cash to the target portfolio; returns the source's value change and the target"""
+        portfolios = lock_portfolios(self.db, [transaction.portfolio_id, transaction.target_portfolio_id])
+        self._write_audit_rows(self._apply_transfer_in_memory(transaction, portfolios))
+        target = portfolios[transaction.target_portfolio_id]
+        target.apply_value_change(transaction.amount)
+        return -transaction.amount, target
+        
+    def _apply_transfer_in_memory(self, transaction: Transaction, portfolios: Dict[str, Portfolio]) -> List[Dict]:
+        """Debit the source and credit the target; both must be locked by the caller"""
+        source = portfolios.get(transaction.portfolio_id)
+        target = portfolios.get(transaction.target_portfolio_id)
+        if source is None or target is None:
+            raise ValueError("Portfolio not found")
+        if (source.cash_balance or Decimal('0.00')) < transaction.amount:
+            raise ValueError("Insufficient cash for transfer")
+            
+        rows = []
+        user = transaction.process_user or "SYSTEM"
+        for portfolio, change in ((source, -transaction.amount), (target, transaction.amount)):
+            before_data = portfolio.to_dict()
+            portfolio.cash_balance = (portfolio.cash_balance or Decimal('0.00')) + change
+            portfolio.last_maint = date.today()
+            portfolio.last_user = transaction.process_user
+            rows.append(History.build_audit_values(
+                portfolio_id=portfolio.port_id,
+                record_type="PT",
+                action_code="C",
+                before_data=before_data,
+                after_data=portfolio.to_dict(),
+                reason_code="XFER",
+                user=user
+            ))
+        return rows
     
-    def _process_fee_transaction(self, transaction: Transaction):
+    def _process_fee_transaction(self, transaction: Transaction) -> Decimal:
         portfolio = self.db.query(Portfolio).filter(
             Portfolio.port_id == transaction.portfolio_id
         ).first()
@@ -115,14 +575,176 @@ class PortfolioService:
             portfolio.last_maint = date.today()
             portfolio.last_user = transaction.process_user
             
-            audit_record = History.create_audit_record(
+            self._audit(
                 portfolio_id=transaction.portfolio_id,
                 record_type="PT",
                 action_code="C",
                 before_data=before_data,
                 after_data=portfolio.to_dict(),
                 reason_code="FEE",
-                user=transaction.process_user or "SYSTEM",
-                db_session=self.db
+                user=transaction.process_user or "SYSTEM"
             )
-            self.db.add(audit_record)
+            return -transaction.amount
+        return Decimal('0.00')
+
+
+def portfolio_summary_statement(account_no: str):
+    """SELECT for an account's portfolios with their positions eagerly joined"""
+    return select(Portfolio).options(joinedload(Portfolio.positions)).where(Portfolio.account_no == account_no)
+
+
+def transactions_statement(account_no: str, from_date: Optional[date] = None, to_date: Optional[date] = None,
+                           transaction_type: Optional[str] = None, status: Optional[str] = None,
+                           cursor: Optional[str] = None):
+    """SELECT for an account's transactions in key order, starting after ``cursor``.
+    
+    Raises ValueError for a malformed cursor or filter.
+    """
+    if transaction_type is not None and transaction_type not in ['BU', 'SL', 'TR', 'FE']:
+        raise ValueError("Invalid transaction type")
+    if status is not None and status not in Transaction.VALID_STATUS_TRANSITIONS:
+        raise ValueError("Invalid status")
+    
+    portfolio_ids = select(Portfolio.port_id).where(Portfolio.account_no == account_no)
+    statement = select(Transaction).where(Transaction.portfolio_id.in_(portfolio_ids))
+    if from_date:
+        statement = statement.where(Transaction.date >= from_date)
+    if to_date:
+        statement = statement.where(Transaction.date <= to_date)
+    if transaction_type:
+        statement = statement.where(Transaction.type == transaction_type)
+    if status:
+        statement = statement.where(Transaction.status == status)
+    if cursor:
+        after = decode_cursor(cursor, len(TRANSACTION_KEY))
+        try:
+            after = [date.fromisoformat(after[0]), time.fromisoformat(after[1]), after[2], after[3]]
+        except (TypeError, ValueError) as e:
+            raise ValueError("Invalid cursor") from e
+        statement = statement.where(tuple_(*TRANSACTION_KEY) > tuple_(
+            *[literal(value, column.type) for column, value in zip(TRANSACTION_KEY, after)]
+        ))
+    return statement.order_by(*TRANSACTION_KEY)
+
+
+def transactions_page(rows: List[Transaction], limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """Trim a ``limit + 1`` row fetch to one page and build the next page's cursor"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last.date.isoformat(), last.time.isoformat(),
+                                     last.portfolio_id, last.sequence_no])
+    return [transaction.to_dict() for transaction in rows], next_cursor
+
+
+def history_statement(portfolio_id: str, from_time: Optional[datetime] = None, to_time: Optional[datetime] = None,
+                      record_type: Optional[str] = None, action_code: Optional[str] = None,
+                      cursor: Optional[str] = None):
+    """SELECT for a portfolio's audit rows in ``process_date`` order, starting after ``cursor``.
+    
+    The equality on ``portfolio_id`` plus the range and order on ``process_date``
+    are served by ``idx_history_portfolio_process_date``; the remaining key
+    columns only break ties. Rows without a ``process_date`` are not listed.
+    Raises ValueError for a malformed cursor or filter.
+    """
+    if record_type is not None and record_type not in HISTORY_RECORD_TYPES:
+        raise ValueError("Invalid record type")
+    if action_code is not None and action_code not in HISTORY_ACTION_CODES:
+        raise ValueError("Invalid action code")
+        
+    statement = select(History).where(History.portfolio_id == portfolio_id, History.process_date.is_not(None))
+    if from_time:
+        statement = statement.where(History.process_date >= from_time)
+    if to_time:
+        statement = statement.where(History.process_date <= to_time)
+    if record_type:
+        statement = statement.where(History.record_type == record_type)
+    if action_code:
+        statement = statement.where(History.action_code == action_code)
+    after = history_cursor(cursor)
+    if after:
+        statement = statement.where(tuple_(*HISTORY_KEY) > tuple_(
+            *[literal(value, column.type) for column, value in zip(HISTORY_KEY, after)]
+        ))
+    return statement.order_by(*HISTORY_KEY)
+
+
+def history_cursor(cursor: Optional[str]) -> Optional[Tuple]:
+    """Decode a history cursor into its ``HISTORY_KEY`` values; raises ValueError when malformed"""
+    if not cursor:
+        return None
+    after = decode_cursor(cursor, len(HISTORY_KEY))
+    try:
+        return (datetime.fromisoformat(after[0]),) + tuple(str(value) for value in after[1:])
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def history_page(rows: List[History], limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """Trim a ``limit + 1`` row fetch to one page and build the next page's cursor"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([last.process_date.isoformat(), last.date, last.time, last.seq_no])
+    return [record.to_dict() for record in rows], next_cursor
+
+
+def build_portfolio_summary(account_no: str, portfolios: List[Portfolio]) -> PortfolioSummary:
+    """Map portfolios with loaded positions onto the API summary.
+    
+    Holdings use the latest active position row per investment and are summed
+    across the account's portfolios.
+    """
+    latest: Dict[Tuple[str, str], Position] = {}
+    total_value = Decimal('0.00')
+    last_updated = None
+    for portfolio in portfolios:
+        total_value += portfolio.total_value if portfolio.total_value is not None else portfolio.calculate_total_value()
+        for position in portfolio.positions:
+            if position.status != 'A':
+                continue
+            key = (position.portfolio_id, position.investment_id)
+            if key not in latest or position.date > latest[key].date:
+                latest[key] = position
+            if position.last_maint_date and (last_updated is None or position.last_maint_date > last_updated):
+                last_updated = position.last_maint_date
+    
+    totals: Dict[str, List[Decimal]] = {}
+    for position in latest.values():
+        quantity, market_value, cost_basis = totals.setdefault(
+            position.investment_id, [Decimal('0'), Decimal('0.00'), Decimal('0.00')]
+        )
+        totals[position.investment_id] = [
+            quantity + (position.quantity or Decimal('0')),
+            market_value + (position.market_value or Decimal('0.00')),
+            cost_basis + (position.cost_basis or Decimal('0.00'))
+        ]
+    
+    holdings = []
+    total_gain_loss = Decimal('0.00')
+    total_cost_basis = Decimal('0.00')
+    for investment_id in sorted(totals):
+        quantity, market_value, cost_basis = totals[investment_id]
+        gain_loss = market_value - cost_basis if cost_basis else Decimal('0.00')
+        total_gain_loss += gain_loss
+        total_cost_basis += cost_basis
+        holdings.append(PortfolioHolding(
+            symbol=investment_id,
+            name=investment_id,
+            shares=int(quantity),
+            currentPrice=round(float(market_value / quantity), 2) if quantity else 0.0,
+            marketValue=float(market_value),
+            gainLoss=float(gain_loss),
+            gainLossPercent=round(float(gain_loss / cost_basis * 100), 2) if cost_basis else 0.0
+        ))
+    
+    return PortfolioSummary(
+        accountNumber=account_no,
+        totalValue=float(total_value),
+        totalGainLoss=float(total_gain_loss),
+        totalGainLossPercent=round(float(total_gain_loss / total_cost_basis * 100), 2) if total_cost_basis else 0.0,
+        holdings=holdings,
+        lastUpdated=(last_updated or datetime.now()).strftime("%B %d, %Y, %I:%M %p"),
+    )
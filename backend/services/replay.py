@@ -0,0 +1,386 @@
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, func, literal, or_, select, tuple_, union_all
+from sqlalchemy.orm import Session
+from models import History, Portfolio, PortfolioSnapshot, Position, RealizedGain, Transaction, history_sequence
+from .cache import TTLCache, portfolio_cache
+from .portfolio_service import position_change
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+QUANTITY_PLACES = Decimal('0.0001')
+MONEY_PLACES = Decimal('0.01')
+REPLAY_USER = "REPLAY"
+# Stands in for a missing process_date: such rows sort before every checkpoint
+UNPROCESSED_MARKER = datetime(1900, 1, 1)
+
+
+class PortfolioState:
+    """Log-derived state of one portfolio: cash and each position's quantity and cost basis.
+    
+    ``positions`` maps ``(investment_id, date)`` to ``[quantity, cost_basis, currency]``.
+    ``cash_balance`` is None when no snapshot supplied an opening balance, since
+    opening cash is not in the transaction log; fees then leave cash alone.
+    """
+    
+    def __init__(self, cash_balance: Optional[Decimal] = None, positions: Optional[Dict[Tuple, List]] = None,
+                 checkpoint: Optional[Tuple] = None, snapshot_taken_at: Optional[datetime] = None):
+        self.cash_balance = cash_balance
+        self.positions = positions if positions is not None else {}
+        self.checkpoint = checkpoint
+        self.snapshot_taken_at = snapshot_taken_at
+        self.applied = 0
+        
+    def apply(self, row):
+        """Fold one processed transaction into the state, rounding as the live columns do"""
+        if row.type in ('BU', 'SL'):
+            key = (row.investment_id, row.date)
+            position = self.positions.get(key)
+            if position is None:
+                position = self.positions[key] = [Decimal('0.0000'), Decimal('0.00'), row.currency]
+            quantity, cost_basis = position_change(position[0], position[1], row.type, row.quantity, row.amount,
+                                                   row.relieved_cost)
+            position[0] = quantity.quantize(QUANTITY_PLACES)
+            position[1] = cost_basis.quantize(MONEY_PLACES)
+        elif row.type == 'FE' and self.cash_balance is not None:
+            self.cash_balance = (self.cash_balance - row.amount).quantize(MONEY_PLACES)
+        elif row.type == 'TR' and self.cash_balance is not None:
+            change = row.amount if row.incoming else -row.amount
+            self.cash_balance = (self.cash_balance + change).quantize(MONEY_PLACES)
+        self.checkpoint = (row.process_date, row.date, row.time, row.transaction_portfolio_id, row.sequence_no)
+        self.applied += 1
+        
+    def to_bytes(self) -> bytes:
+        """Compressed compact JSON; empty positions are dropped"""
+        positions = [
+            [investment_id, position_date.isoformat(), str(quantity), str(cost_basis), currency]
+            for (investment_id, position_date), (quantity, cost_basis, currency) in sorted(self.positions.items())
+            if quantity or cost_basis
+        ]
+        payload = {
+            "v": STATE_VERSION,
+            "cash": str(self.cash_balance) if self.cash_balance is not None else None,
+            "positions": positions
+        }
+        return zlib.compress(json.dumps(payload, separators=(",", ":")).encode())
+        
+    @classmethod
+    def from_snapshot(cls, snapshot: PortfolioSnapshot) -> "PortfolioState":
+        payload = json.loads(zlib.decompress(snapshot.state))
+        if payload.get("v") != STATE_VERSION:
+            raise ValueError(f"Unsupported snapshot state version {payload.get('v')} for {snapshot.portfolio_id}")
+        positions = {
+            (investment_id, date.fromisoformat(position_date)): [Decimal(quantity), Decimal(cost_basis), currency]
+            for investment_id, position_date, quantity, cost_basis, currency in payload["positions"]
+        }
+        cash = Decimal(payload["cash"]) if payload["cash"] is not None else None
+        return cls(cash, positions, snapshot.checkpoint, snapshot.taken_at)
+
+
+class ReplayEngine:
+    """Rebuilds Position and Portfolio state from the transaction log.
+    
+    Each portfolio starts from its latest ``PortfolioSnapshot`` and replays only
+    the processed (status ``D``) transactions after the snapshot's checkpoint,
+    streamed by one query for all portfolios. The log is not append-only in key
+    order: end-of-day runs process pending rows late and entries can be
+    back-dated. Replay therefore follows processing order, ``process_date`` then
+    the transaction key, and checkpoints are positions in that order. To recover
+    from a bad batch, mark its transactions reversed and ``rebuild``.
+    
+    ``verify`` diffs the replayed state against the live tables without
+    writing; ``rebuild`` overwrites drifted quantities, cost bases and cash and
+    audits each correction. Market values are not in the log: they are kept,
+    and positions the log creates start at zero until the next mark-to-market.
+    A sell with recorded realized gains relieves the cost of the lots they
+    name, as processing with lot tracking did; other sells relieve average
+    cost. Tax lots themselves are not replayed, so a rebuild that changes a
+    quantity leaves the position's lots out of step with it.
+    """
+    
+    def __init__(self, db: Session, batch_size: int = 1000, cache: Optional[TTLCache] = portfolio_cache):
+        self.db = db
+        self.batch_size = batch_size
+        self.cache = cache
+        history_sequence.ensure_reconciled(db)
+        
+    def replay(self, portfolio_ids: Optional[Iterable[str]] = None) -> Dict[str, PortfolioState]:
+        """Replayed state per portfolio, for all portfolios or only ``portfolio_ids``"""
+        ids = sorted(set(portfolio_ids)) if portfolio_ids is not None else None
+        statement = select(Portfolio.port_id)
+        if ids is not None:
+            statement = statement.where(Portfolio.port_id.in_(ids))
+        states = {port_id: PortfolioState() for port_id in self.db.execute(statement).scalars()}
+        
+        latest = self._latest_snapshots(ids)
+        for snapshot in self.db.execute(select(PortfolioSnapshot).join(latest, and_(
+            PortfolioSnapshot.portfolio_id == latest.c.portfolio_id,
+            PortfolioSnapshot.taken_at == latest.c.taken_at
+        ))).scalars():
+            if snapshot.portfolio_id in states:
+                states[snapshot.portfolio_id] = PortfolioState.from_snapshot(snapshot)
+                
+        for row in self.db.execute(self._tail_statement(ids, latest).execution_options(yield_per=self.batch_size)):
+            state = states.get(row.portfolio_id)
+            if state is not None:
+                state.apply(row)
+        return states
+        
+    def verify(self, portfolio_ids: Optional[Iterable[str]] = None,
+               tolerance: Decimal = Decimal('0.00')) -> List[Dict]:
+        """Differences between the replayed state and the live tables; writes nothing"""
+        states = self.replay(portfolio_ids)
+        portfolios, positions = self._load_live(states)
+        return self._diff(states, portfolios, positions, tolerance)
+        
+    def rebuild(self, portfolio_ids: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Overwrite drifted live state with the replayed state; returns the differences fixed.
+        
+        Portfolios without a snapshot are skipped and logged: the log alone
+        cannot explain holdings loaded outside it, so replaying from empty
+        would wipe them. Take a baseline with ``snapshot`` first.
+        """
+        states = self.replay(portfolio_ids)
+        skipped = sorted(port_id for port_id, state in states.items() if state.snapshot_taken_at is None)
+        if skipped:
+            logger.warning("Not rebuilding %d portfolio(s) without a snapshot: %s", len(skipped), ", ".join(skipped))
+            for port_id in skipped:
+                del states[port_id]
+        portfolios, positions = self._load_live(states)
+        drifted = self._diff(states, portfolios, positions, Decimal('0.00'))
+        if not drifted:
+            return drifted
+            
+        now = datetime.now()
+        rebuilt = sorted({item["port_id"] for item in drifted})
+        audit_rows = []
+        for port_id in rebuilt:
+            audit_rows.extend(self._rebuild_portfolio(states[port_id], portfolios[port_id],
+                                                      positions.setdefault(port_id, {}), now))
+        self.db.execute(History.bulk_insert(), audit_rows)
+        self.db.commit()
+        
+        if self.cache is not None:
+            for port_id in rebuilt:
+                self.cache.invalidate(portfolios[port_id].account_no)
+        logger.info("Rebuilt %d portfolio(s) from the transaction log", len(rebuilt))
+        return drifted
+        
+    def unbaselined(self, portfolio_ids: Optional[Iterable[str]] = None) -> List[str]:
+        """Portfolios with no snapshot yet, which ``rebuild`` skips"""
+        statement = select(Portfolio.port_id).where(
+            ~select(PortfolioSnapshot.portfolio_id).where(PortfolioSnapshot.portfolio_id == Portfolio.port_id).exists()
+        ).order_by(Portfolio.port_id)
+        if portfolio_ids is not None:
+            statement = statement.where(Portfolio.port_id.in_(set(portfolio_ids)))
+        return list(self.db.execute(statement).scalars())
+        
+    def snapshot(self, portfolio_ids: Optional[Iterable[str]] = None) -> int:
+        """Checkpoint each portfolio's state so later replays start from here; returns snapshots written.
+        
+        A portfolio's first snapshot records its live state, which supplies the
+        opening cash. Later snapshots fold the replayed tail into the previous
+        one, so drift in the live tables never reaches a checkpoint. Portfolios
+        with no transactions since their last snapshot are skipped.
+        """
+        states = self.replay(portfolio_ids)
+        baseline = {port_id for port_id, state in states.items() if state.snapshot_taken_at is None}
+        if baseline:
+            portfolios, positions = self._load_live({port_id: states[port_id] for port_id in baseline})
+            for port_id in baseline:
+                live = positions.get(port_id, {})
+                states[port_id].positions = {
+                    key: [position.quantity or Decimal('0.0000'), position.cost_basis or Decimal('0.00'),
+                          position.currency]
+                    for key, position in live.items()
+                }
+                states[port_id].cash_balance = portfolios[port_id].cash_balance or Decimal('0.00')
+                
+        taken_at = datetime.now()
+        written = 0
+        for port_id, state in states.items():
+            if port_id not in baseline and not state.applied:
+                continue
+            checkpoint = state.checkpoint or (None, None, None, None, None)
+            self.db.add(PortfolioSnapshot(
+                portfolio_id=port_id,
+                taken_at=taken_at,
+                checkpoint_process_date=checkpoint[0],
+                checkpoint_date=checkpoint[1],
+                checkpoint_time=checkpoint[2],
+                checkpoint_portfolio_id=checkpoint[3],
+                checkpoint_sequence_no=checkpoint[4],
+                state=state.to_bytes()
+            ))
+            written += 1
+        self.db.commit()
+        return written
+        
+    @staticmethod
+    def _latest_snapshots(ids: Optional[List[str]]):
+        statement = select(
+            PortfolioSnapshot.portfolio_id,
+            func.max(PortfolioSnapshot.taken_at).label("taken_at")
+        ).group_by(PortfolioSnapshot.portfolio_id)
+        if ids is not None:
+            statement = statement.where(PortfolioSnapshot.portfolio_id.in_(ids))
+        return statement.subquery()
+        
+    @staticmethod
+    def _tail_statement(ids: Optional[List[str]], latest):
+        checkpoints = select(
+            PortfolioSnapshot.portfolio_id,
+            PortfolioSnapshot.checkpoint_process_date,
+            PortfolioSnapshot.checkpoint_date,
+            PortfolioSnapshot.checkpoint_time,
+            PortfolioSnapshot.checkpoint_portfolio_id,
+            PortfolioSnapshot.checkpoint_sequence_no
+        ).join(latest, and_(
+            PortfolioSnapshot.portfolio_id == latest.c.portfolio_id,
+            PortfolioSnapshot.taken_at == latest.c.taken_at
+        )).subquery()
+        marker = func.coalesce(Transaction.process_date, UNPROCESSED_MARKER)
+        # A sell processed with lot tracking relieved the cost of the lots recorded in its realized gains
+        relieved_cost = select(func.sum(RealizedGain.cost_basis)).where(
+            RealizedGain.portfolio_id == Transaction.portfolio_id,
+            RealizedGain.date == Transaction.date,
+            RealizedGain.time == Transaction.time,
+            RealizedGain.sequence_no == Transaction.sequence_no
+        ).scalar_subquery()
+        
+        # Transfers also replay on the receiving portfolio as incoming rows. Both legs compare the
+        # transfer's own processing position, so the sender's key never mixes with the receiver's
+        legs = []
+        for owner, incoming in ((Transaction.portfolio_id, False), (Transaction.target_portfolio_id, True)):
+            leg = select(
+                owner.label("portfolio_id"), marker.label("process_date"), Transaction.date, Transaction.time,
+                Transaction.portfolio_id.label("transaction_portfolio_id"), Transaction.sequence_no,
+                Transaction.investment_id, Transaction.type, Transaction.quantity, Transaction.amount,
+                Transaction.currency, relieved_cost.label("relieved_cost"), literal(incoming).label("incoming")
+            ).outerjoin(checkpoints, checkpoints.c.portfolio_id == owner).where(
+                Transaction.status == 'D',
+                or_(
+                    checkpoints.c.checkpoint_process_date.is_(None),
+                    tuple_(marker, Transaction.date, Transaction.time, Transaction.portfolio_id,
+                           Transaction.sequence_no) > tuple_(
+                        checkpoints.c.checkpoint_process_date, checkpoints.c.checkpoint_date,
+                        checkpoints.c.checkpoint_time, checkpoints.c.checkpoint_portfolio_id,
+                        checkpoints.c.checkpoint_sequence_no
+                    )
+                )
+            )
+            if incoming:
+                leg = leg.where(Transaction.type == 'TR', owner.is_not(None))
+            if ids is not None:
+                leg = leg.where(owner.in_(ids))
+            legs.append(leg)
+        statement = union_all(*legs).subquery()
+        return select(statement).order_by(statement.c.process_date, statement.c.date, statement.c.time,
+                                          statement.c.transaction_portfolio_id, statement.c.sequence_no,
+                                          statement.c.portfolio_id)
+        
+    def _load_live(self, states: Dict[str, PortfolioState]) -> Tuple[Dict[str, Portfolio], Dict[str, Dict]]:
+        portfolios: Dict[str, Portfolio] = {}
+        positions: Dict[str, Dict[Tuple, Position]] = {}
+        ids = list(states)
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            for portfolio in self.db.query(Portfolio).filter(Portfolio.port_id.in_(chunk)):
+                portfolios.setdefault(portfolio.port_id, portfolio)
+            for position in self.db.query(Position).filter(Position.portfolio_id.in_(chunk)):
+                positions.setdefault(position.portfolio_id, {})[(position.investment_id, position.date)] = position
+        return portfolios, positions
+        
+    @staticmethod
+    def _diff(states: Dict[str, PortfolioState], portfolios: Dict[str, Portfolio],
+              positions: Dict[str, Dict], tolerance: Decimal) -> List[Dict]:
+        drifted = []
+        for port_id in sorted(states):
+            state = states[port_id]
+            portfolio = portfolios.get(port_id)
+            if portfolio is None:
+                continue
+            if state.cash_balance is not None:
+                live_cash = portfolio.cash_balance or Decimal('0.00')
+                if abs(live_cash - state.cash_balance) > tolerance:
+                    drifted.append(_drift(port_id, "cash_balance", None, None, live_cash, state.cash_balance))
+                    
+            live_positions = positions.get(port_id, {})
+            for key in sorted(set(live_positions) | set(state.positions)):
+                live = live_positions.get(key)
+                live_values = (live.quantity, live.cost_basis) if live is not None else (None, None)
+                replayed = state.positions.get(key) or (None, None)
+                for field, live_value, replayed_value in zip(("quantity", "cost_basis"), live_values, replayed):
+                    live_value = live_value or Decimal('0.00')
+                    replayed_value = replayed_value or Decimal('0.00')
+                    if abs(live_value - replayed_value) > tolerance:
+                        drifted.append(_drift(port_id, field, key[0], key[1], live_value, replayed_value))
+        return drifted
+        
+    def _rebuild_portfolio(self, state: PortfolioState, portfolio: Portfolio, live_positions: Dict[Tuple, Position],
+                           now: datetime) -> List[Dict]:
+        rows = []
+        for key in sorted(set(live_positions) | set(state.positions)):
+            quantity, cost_basis, currency = state.positions.get(key) or (Decimal('0.0000'), Decimal('0.00'), None)
+            position = live_positions.get(key)
+            if position is None:
+                position = Position(portfolio_id=portfolio.port_id, investment_id=key[0], date=key[1],
+                                    market_value=Decimal('0.00'), currency=currency, status='A')
+                self.db.add(position)
+                live_positions[key] = position
+                before_data = None
+            elif (position.quantity or 0) == quantity and (position.cost_basis or 0) == cost_basis:
+                continue
+            else:
+                before_data = position.to_dict()
+                
+            position.quantity = quantity
+            position.cost_basis = cost_basis
+            position.last_maint_date = now
+            position.last_maint_user = REPLAY_USER
+            rows.append(History.build_audit_values(
+                portfolio_id=portfolio.port_id,
+                record_type="PS",
+                action_code="C",
+                before_data=before_data,
+                after_data=position.to_dict(),
+                reason_code="RPLY",
+                user=REPLAY_USER,
+                now=now
+            ))
+            
+        before_data = portfolio.to_dict()
+        if state.cash_balance is not None:
+            portfolio.cash_balance = state.cash_balance
+        market_value = sum((position.valued_amount() for position in live_positions.values()), Decimal('0.00'))
+        portfolio.total_value = (market_value + (portfolio.cash_balance or Decimal('0.00'))).quantize(MONEY_PLACES)
+        portfolio.last_maint = now.date()
+        portfolio.last_user = REPLAY_USER
+        rows.append(History.build_audit_values(
+            portfolio_id=portfolio.port_id,
+            record_type="PT",
+            action_code="C",
+            before_data=before_data,
+            after_data=portfolio.to_dict(),
+            reason_code="RPLY",
+            user=REPLAY_USER,
+            now=now
+        ))
+        return rows
+
+
+def _drift(port_id: str, field: str, investment_id: Optional[str], position_date: Optional[date],
+           live: Decimal, replayed: Decimal) -> Dict:
+    return {
+        "port_id": port_id,
+        "field": field,
+        "investment_id": investment_id,
+        "date": position_date,
+        "live": live,
+        "replayed": replayed
+    }
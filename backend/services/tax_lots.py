@@ -0,0 +1,283 @@
+import logging
+import os
+from datetime import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+from models import Position, RealizedGain, TaxLot, Transaction
+
+logger = logging.getLogger(__name__)
+
+LOT_METHODS = ("FIFO", "LIFO", "SPEC")
+CENT = Decimal('0.01')
+
+# Backfilled lots have no buy; their key sorts before every buy on the position's date
+OPENING_TIME = time(0, 0)
+OPENING_SEQUENCE_NO = "000000"
+
+# Lot keys are the acquiring buy's (date, time, sequence_no); a selection names lots and the quantity taken from each
+LotSelection = List[Tuple[Tuple, Decimal]]
+Relief = Tuple[TaxLot, Decimal, Decimal]
+
+
+class LotQueue:
+    """Open lots of one investment in acquisition order.
+    
+    The lots sit in a list with a head offset, so FIFO relief consumes from
+    the front and LIFO from the back without shifting the rest, and a key index
+    finds specific-ID lots directly. A sell touches only the lots it consumes.
+    Lots emptied by a specific-ID sell stay in place until either end reaches them.
+    """
+    
+    COMPACT_AFTER = 64
+    
+    def __init__(self, lots: Iterable[TaxLot] = ()):
+        self._lots = sorted(lots, key=lambda lot: lot.key)
+        self._head = 0
+        self._reindex()
+        self.open_quantity = sum((lot.remaining_quantity for lot in self._lots), Decimal('0'))
+        
+    def _reindex(self):
+        self._positions = {lot.key: index for index, lot in enumerate(self._lots) if index >= self._head}
+        
+    def open_lots(self) -> List[TaxLot]:
+        """Lots with shares remaining, oldest first"""
+        return [lot for lot in self._lots[self._head:] if lot.remaining_quantity > 0]
+        
+    def add(self, lot: TaxLot):
+        if lot.key in self._positions:
+            raise ValueError(f"Lot {lot.key} already exists")
+        if self._head == len(self._lots) or lot.key > self._lots[-1].key:
+            self._positions[lot.key] = len(self._lots)
+            self._lots.append(lot)
+        else:
+            # A back-dated buy: rare, so a full reinsert is acceptable
+            self._lots = sorted(self._lots[self._head:] + [lot], key=lambda open_lot: open_lot.key)
+            self._head = 0
+            self._reindex()
+        self.open_quantity += lot.remaining_quantity
+        
+    def relieve(self, quantity: Decimal, method: str, selection: Optional[LotSelection] = None) -> List[Relief]:
+        """Take ``quantity`` shares from the open lots.
+        
+        Returns ``(lot, quantity, cost)`` per lot consumed. Raises ValueError
+        without changing anything when the lots cannot cover the sell.
+        """
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method {method}")
+        if quantity > self.open_quantity:
+            raise ValueError(f"Sell quantity {quantity} exceeds open lots of {self.open_quantity}")
+        if method == "SPEC":
+            return self._relieve_selected(quantity, selection)
+            
+        reliefs = []
+        remaining = quantity
+        while remaining > 0:
+            lot = self._lots[self._head] if method == "FIFO" else self._lots[-1]
+            if lot.remaining_quantity > 0:
+                taken = min(remaining, lot.remaining_quantity)
+                reliefs.append((lot, taken, self._take(lot, taken)))
+                remaining -= taken
+            if lot.remaining_quantity == 0:
+                self._drop(front=method == "FIFO")
+        return reliefs
+        
+    def _relieve_selected(self, quantity: Decimal, selection: Optional[LotSelection]) -> List[Relief]:
+        if not selection:
+            raise ValueError("Specific-ID relief needs a lot selection")
+        keys = [key for key, _ in selection]
+        if len(set(keys)) != len(keys):
+            raise ValueError("A lot may be selected only once")
+        if sum(taken for _, taken in selection) != quantity:
+            raise ValueError("Selected lot quantities must add up to the sell quantity")
+            
+        lots = []
+        for key, taken in selection:
+            index = self._positions.get(tuple(key))
+            lot = self._lots[index] if index is not None else None
+            if lot is None or taken <= 0 or taken > lot.remaining_quantity:
+                raise ValueError(f"Lot {key} cannot cover {taken}")
+            lots.append(lot)
+        return [(lot, taken, self._take(lot, taken)) for lot, (_, taken) in zip(lots, selection)]
+        
+    def _take(self, lot: TaxLot, quantity: Decimal) -> Decimal:
+        if quantity == lot.remaining_quantity:
+            cost = lot.cost_basis
+            lot.status = 'C'
+        else:
+            cost = (lot.cost_basis * quantity / lot.remaining_quantity).quantize(CENT)
+        lot.remaining_quantity -= quantity
+        lot.cost_basis -= cost
+        self.open_quantity -= quantity
+        return cost
+        
+    def _drop(self, front: bool):
+        if front:
+            del self._positions[self._lots[self._head].key]
+            self._head += 1
+            if self._head >= self.COMPACT_AFTER and self._head * 2 >= len(self._lots):
+                del self._lots[:self._head]
+                self._head = 0
+                self._reindex()
+        else:
+            del self._positions[self._lots.pop().key]
+
+
+class TaxLotLedger:
+    """Lot tracking for one session: buys open lots and sells relieve them by a lot method.
+    
+    Open lots are loaded once per ``(portfolio_id, investment_id)`` and kept in
+    a LotQueue. Changes are made on ORM rows and committed with the caller's
+    transaction; call ``clear`` after a rollback.
+    """
+    
+    def __init__(self, db: Session, method: str = "FIFO"):
+        if method not in LOT_METHODS:
+            raise ValueError(f"Unknown lot method {method}")
+        self.db = db
+        self.method = method
+        self._queues: Dict[Tuple[str, str], LotQueue] = {}
+        
+    def load(self, keys: Iterable[Tuple[str, str]]):
+        """Preload open lots for ``(portfolio_id, investment_id)`` keys with one query"""
+        missing = set(keys) - set(self._queues)
+        if not missing:
+            return
+        grouped: Dict[Tuple[str, str], List[TaxLot]] = {}
+        query = self.db.query(TaxLot).filter(
+            TaxLot.status == 'O',
+            tuple_(TaxLot.portfolio_id, TaxLot.investment_id).in_(missing)
+        )
+        for lot in query:
+            grouped.setdefault((lot.portfolio_id, lot.investment_id), []).append(lot)
+        for key in missing:
+            self._queues[key] = LotQueue(grouped.get(key, []))
+            
+    def queue(self, portfolio_id: str, investment_id: str) -> LotQueue:
+        self.load([(portfolio_id, investment_id)])
+        return self._queues[(portfolio_id, investment_id)]
+        
+    def clear(self):
+        self._queues.clear()
+        
+    def apply(self, transaction: Transaction, selection: Optional[LotSelection] = None) -> List[RealizedGain]:
+        """Open a lot for a buy, or relieve lots for a sell and return its realized gains.
+        
+        A sell with a ``selection`` uses specific-ID relief whatever the
+        ledger's method. Raises ValueError, leaving the lots unchanged, when a
+        sell cannot be covered.
+        """
+        queue = self.queue(transaction.portfolio_id, transaction.investment_id)
+        if transaction.type == 'BU':
+            lot = TaxLot(
+                portfolio_id=transaction.portfolio_id,
+                investment_id=transaction.investment_id,
+                date=transaction.date,
+                time=transaction.time,
+                sequence_no=transaction.sequence_no,
+                quantity=transaction.quantity,
+                remaining_quantity=transaction.quantity,
+                cost_basis=transaction.amount,
+                currency=transaction.currency,
+                status='O'
+            )
+            queue.add(lot)
+            self.db.add(lot)
+            return []
+            
+        method = "SPEC" if selection is not None else self.method
+        reliefs = queue.relieve(transaction.quantity, method, selection)
+        gains = []
+        allocated = Decimal('0.00')
+        for index, (lot, quantity, cost) in enumerate(reliefs):
+            if index == len(reliefs) - 1:
+                proceeds = transaction.amount - allocated
+            else:
+                proceeds = (transaction.amount * quantity / transaction.quantity).quantize(CENT)
+                allocated += proceeds
+            gains.append(RealizedGain(
+                portfolio_id=transaction.portfolio_id,
+                date=transaction.date,
+                time=transaction.time,
+                sequence_no=transaction.sequence_no,
+                lot_date=lot.date,
+                lot_time=lot.time,
+                lot_sequence_no=lot.sequence_no,
+                investment_id=transaction.investment_id,
+                quantity=quantity,
+                proceeds=proceeds,
+                cost_basis=cost,
+                gain=proceeds - cost,
+                method=method
+            ))
+        self.db.add_all(gains)
+        return gains
+
+
+def backfill_lots(db: Session, portfolio_ids: Optional[Iterable[str]] = None) -> List[TaxLot]:
+    """Open lots for active shares that no open lot covers; returns the new lots, uncommitted.
+    
+    Run this when lot tracking is turned on over existing positions, whose
+    shares were bought without lots and could not be sold otherwise. An
+    investment with no open lots gets one lot per active position, for its
+    quantity and cost basis, keyed by the position's date. An investment
+    whose open lots cover only part of its shares gets one lot for the
+    shortfall, at the cost the open lots do not account for, dated by its
+    oldest position. Covered investments are skipped, so a rerun opens nothing.
+    """
+    positions = db.query(Position).filter(Position.status == 'A', Position.quantity > 0)
+    lots = db.query(
+        TaxLot.portfolio_id, TaxLot.investment_id,
+        func.sum(TaxLot.remaining_quantity), func.sum(TaxLot.cost_basis)
+    ).filter(TaxLot.status == 'O').group_by(TaxLot.portfolio_id, TaxLot.investment_id)
+    opening = db.query(TaxLot.portfolio_id, TaxLot.investment_id, TaxLot.date).filter(
+        TaxLot.time == OPENING_TIME, TaxLot.sequence_no == OPENING_SEQUENCE_NO
+    )
+    if portfolio_ids is not None:
+        portfolio_ids = set(portfolio_ids)
+        positions = positions.filter(Position.portfolio_id.in_(portfolio_ids))
+        lots = lots.filter(TaxLot.portfolio_id.in_(portfolio_ids))
+        opening = opening.filter(TaxLot.portfolio_id.in_(portfolio_ids))
+        
+    held: Dict[Tuple[str, str], List[Position]] = {}
+    for position in positions.order_by(Position.portfolio_id, Position.investment_id, Position.date):
+        held.setdefault((position.portfolio_id, position.investment_id), []).append(position)
+    covered = {(portfolio_id, investment_id): (quantity, cost) for portfolio_id, investment_id, quantity, cost in lots}
+    taken = set(opening)
+    
+    created = []
+    for key, key_positions in held.items():
+        if key in covered:
+            open_quantity, open_cost = covered[key]
+            shortfall = sum(position.quantity for position in key_positions) - open_quantity
+            if shortfall <= 0:
+                continue
+            cost = sum((position.cost_basis or Decimal('0.00')) for position in key_positions) - open_cost
+            openings = [(key_positions[0], shortfall, max(cost, Decimal('0.00')))]
+        else:
+            openings = [(position, position.quantity, position.cost_basis or Decimal('0.00'))
+                        for position in key_positions]
+            
+        for position, quantity, cost in openings:
+            if (position.portfolio_id, position.investment_id, position.date) in taken:
+                logger.warning("Not backfilling %s %s: an opening lot for %s already exists",
+                               position.portfolio_id, position.investment_id, position.date)
+                continue
+            created.append(TaxLot(
+                portfolio_id=position.portfolio_id,
+                investment_id=position.investment_id,
+                date=position.date,
+                time=OPENING_TIME,
+                sequence_no=OPENING_SEQUENCE_NO,
+                quantity=quantity,
+                remaining_quantity=quantity,
+                cost_basis=cost,
+                currency=position.currency,
+                status='O'
+            ))
+    db.add_all(created)
+    return created
+
+
+default_lot_method = os.getenv("TAX_LOT_METHOD") or None
@@ -0,0 +1,113 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.metrics import (Histogram, MetricsMiddleware, MetricsRegistry, http_request_db_queries, http_requests,
+                         instrument_engine)
+
+
+class TestRegistry:
+    """Test Prometheus text rendering"""
+    
+    def test_histogram_buckets_are_cumulative(self):
+        """Test bucket counts accumulate and +Inf equals the observation count"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value, "/a")
+            
+        lines = registry.render().splitlines()
+        
+        assert "# TYPE latency_seconds histogram" in lines
+        assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+        assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+        assert 'latency_seconds_count{route="/a"} 4' in lines
+        
+    def test_label_values_are_escaped(self):
+        """Test quotes in label values cannot break the exposition format"""
+        registry = MetricsRegistry()
+        registry.counter("hits_total", "Hits.", ("path",)).inc(1, 'a"b')
+        
+        assert 'hits_total{path="a\\"b"} 1' in registry.render()
+        
+    def test_duplicate_names_are_rejected(self):
+        """Test a metric name can only be registered once"""
+        registry = MetricsRegistry()
+        registry.register(Histogram("x", "X."))
+        
+        try:
+            registry.counter("x", "X.")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("duplicate metric registered")
+            
+    def test_callback_metric_is_read_at_render(self):
+        """Test a callback metric reports the value current at scrape time"""
+        registry = MetricsRegistry()
+        values = [3]
+        registry.callback("conflicts_total", "Conflicts.", "counter", lambda: values[0])
+        values[0] = 5
+        
+        lines = registry.render().splitlines()
+        
+        assert "# TYPE conflicts_total counter" in lines
+        assert "conflicts_total 5" in lines
+        
+    def test_labelled_callback_metric(self):
+        """Test a labelled callback renders one sample per label value"""
+        registry = MetricsRegistry()
+        registry.callback("pool_connections", "Connections.", "gauge", lambda: {("sync",): 2, ("async",): 0},
+                          ("engine",))
+        
+        lines = registry.render().splitlines()
+        
+        assert lines[-2:] == ['pool_connections{engine="async"} 0', 'pool_connections{engine="sync"} 2']
+
+
+class TestMetricsMiddleware:
+    """Test per-request latency, size and database accounting"""
+    
+    def _app(self, db_engine):
+        instrument_engine(db_engine)
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware, server_timing=True)
+        
+        @app.get("/items/{item_id}")
+        def read_item(item_id: str, request: Request):
+            with db_engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+                connection.execute(text("SELECT 2"))
+            return {"item_id": item_id, "queries": request.state.request_stats.queries}
+            
+        return app
+        
+    def test_queries_are_counted_per_request(self, db_engine):
+        """Test statements run by the handler are attributed to its route"""
+        before = http_request_db_queries.count("GET", "/items/{item_id}")
+        
+        response = TestClient(self._app(db_engine)).get("/items/abc")
+        
+        assert response.json()["queries"] == 2
+        assert http_request_db_queries.count("GET", "/items/{item_id}") == before + 1
+        assert http_requests.value("GET", "/items/{item_id}", "200") >= 1
+        
+    def test_server_timing_header(self, db_engine):
+        """Test the Server-Timing header reports database and total time"""
+        response = TestClient(self._app(db_engine)).get("/items/abc")
+        
+        header = response.headers["server-timing"]
+        assert header.startswith("db;dur=")
+        assert 'desc="2 queries"' in header
+        assert "app;dur=" in header
+        
+    def test_unmatched_paths_share_one_series(self, db_engine):
+        """Test unknown paths do not create a series per URL"""
+        client = TestClient(self._app(db_engine))
+        before = http_requests.value("GET", "<unmatched>", "404")
+        
+        client.get("/missing/1")
+        client.get("/missing/2")
+        
+        assert http_requests.value("GET", "<unmatched>", "404") == before + 2
+
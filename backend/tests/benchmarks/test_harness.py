@@ -0,0 +1,82 @@
+import pytest
+from benchmarks import (Benchmark, BenchmarkEnvironment, compare, default_benchmarks, load_baseline,
+                        run_benchmarks, save_baseline, summarize)
+from models import Portfolio
+
+
+def _document(**medians):
+    return {"version": 1, "results": {name: {"median_us": value} for name, value in medians.items()}}
+
+
+class TestHarness:
+    """Test timing, baseline files and regression comparison"""
+    
+    def test_summarize_reports_latency_and_throughput(self):
+        """Test percentiles are in microseconds and throughput is calls per second"""
+        result = summarize([0.001] * 9 + [0.011])
+        
+        assert result["iterations"] == 10
+        assert result["median_us"] == pytest.approx(1000)
+        assert result["p99_us"] == pytest.approx(11000)
+        assert result["ops_per_second"] == pytest.approx(500)
+        
+    def test_prepare_and_reset_run_for_every_call(self):
+        """Test warmup calls are excluded from the results but still prepared"""
+        calls, resets = [], []
+        benchmark = Benchmark("sample", calls.append, prepare=lambda count: list(range(count)),
+                              reset=lambda: resets.append(1), iterations=5, warmup=2)
+                              
+        result = benchmark.measure()
+        
+        assert calls == [0, 1, 2, 3, 4, 5, 6]
+        assert len(resets) == 7
+        assert result["iterations"] == 5
+        
+    def test_compare_flags_slowdowns_beyond_threshold(self):
+        """Test only slowdowns larger than the threshold are regressions"""
+        rows = compare(_document(a=100, b=100, c=100), _document(a=105, b=120, c=50), threshold=0.10)
+        
+        assert {row["name"]: row["regression"] for row in rows} == {"a": False, "b": True, "c": False}
+        assert rows[1]["change"] == pytest.approx(0.20)
+        
+    def test_compare_ignores_benchmarks_missing_on_one_side(self):
+        """Test added or removed benchmarks are reported without failing"""
+        rows = compare(_document(old=100), _document(new=100))
+        
+        assert all(row["change"] is None and not row["regression"] for row in rows)
+        
+    def test_baseline_round_trip(self, tmp_path):
+        """Test a saved baseline loads back unchanged and unknown versions are rejected"""
+        path = str(tmp_path / "baseline.json")
+        document = run_benchmarks([Benchmark("noop", lambda _: None, iterations=3, warmup=0)])
+        save_baseline(document, path)
+        
+        assert load_baseline(path) == document
+        
+        save_baseline(dict(document, version=0), path)
+        with pytest.raises(ValueError):
+            load_baseline(path)
+
+
+class TestDefaultBenchmarks:
+    """Smoke test the benchmark cases against a small environment"""
+    
+    def test_every_benchmark_runs(self):
+        """Test the service, model and API benchmarks all complete"""
+        with BenchmarkEnvironment(portfolios=5, transactions=100) as env:
+            document = run_benchmarks(default_benchmarks(env), scale=0.01)
+            
+        names = set(document["results"])
+        assert {"service.process_transaction.BU", "service.process_transaction.SL",
+                "service.process_transaction.FE", "model.History.create_audit_record",
+                "model.Portfolio.calculate_total_value.10000", "api.portfolio", "api.transactions"} <= names
+        assert all(result["iterations"] >= 1 for result in document["results"].values())
+        
+    def test_filter_skips_unselected_cases(self):
+        """Test cases outside the filter are not built and commit no portfolios"""
+        with BenchmarkEnvironment(portfolios=5, transactions=100) as env:
+            benchmarks = default_benchmarks(env, "model.*")
+            created = env.db.query(Portfolio).filter(Portfolio.port_id.like("BENCH%")).count()
+            
+        assert benchmarks and all(benchmark.name.startswith("model.") for benchmark in benchmarks)
+        assert created == 0
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, StaticPool
+from models import Base
+
+
+@pytest.fixture
+def db_engine():
+    """In-memory SQLite engine with the full schema"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine):
+    """Session bound to the in-memory test engine"""
+    session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def file_db_engine(tmp_path):
+    """File backed SQLite engine with the full schema, shareable with async sessions"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def async_session_factory(file_db_engine):
+    """AsyncSession factory over the same database file as ``file_db_engine``"""
+    # TestClient may run each request on a fresh event loop, so connections are not pooled
+    engine = create_async_engine(f"sqlite+aiosqlite:///{file_db_engine.url.database}", poolclass=NullPool)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
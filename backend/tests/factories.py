@@ -0,0 +1,37 @@
+from datetime import date, time
+from decimal import Decimal
+from models import Portfolio, Transaction
+
+
+def make_portfolio(port_id="PORT0001", account_no="1234567890", cash=Decimal("10000.00")):
+    return Portfolio(
+        port_id=port_id,
+        account_no=account_no,
+        client_name="Test Client",
+        client_type="I",
+        create_date=date(2024, 1, 15),
+        status="A",
+        cash_balance=cash
+    )
+
+
+def make_transaction(seq, type_="BU", portfolio_id="PORT0001", investment_id="AAPL000001",
+                     quantity=Decimal("10.0000"), price=Decimal("100.0000"), amount=None):
+    transaction = Transaction(
+        date=date(2024, 2, 1),
+        time=time(9, 30, 0),
+        portfolio_id=portfolio_id,
+        sequence_no=f"{seq:06d}",
+        investment_id=investment_id,
+        type=type_,
+        quantity=quantity,
+        price=price,
+        currency="USD",
+        status="P",
+        process_user="TESTER"
+    )
+    if amount is None:
+        transaction.update_amount()
+    else:
+        transaction.amount = amount
+    return transaction
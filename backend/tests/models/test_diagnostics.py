@@ -0,0 +1,115 @@
+import logging
+import pytest
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import text
+from models import Portfolio, Position, QueryBudgetExceeded, QueryDiagnostics, query_budget
+from models.diagnostics import QueryDiagnosticsError
+from tests.factories import make_portfolio
+
+
+def _portfolios_with_positions(db_session, count=6):
+    for index in range(count):
+        portfolio = make_portfolio(port_id=f"PORT{index:04d}", account_no=f"{index:010d}")
+        portfolio.positions = [Position(date=date(2024, 2, 1), investment_id="AAPL000001",
+                                        market_value=Decimal("100.00"), status="A")]
+        db_session.add(portfolio)
+    db_session.commit()
+    db_session.expunge_all()
+
+
+class TestQueryDiagnostics:
+    """Test N+1 and slow-query detection"""
+    
+    def test_lazy_load_in_loop_is_reported(self, db_engine, db_session, caplog):
+        """Test calculate_total_value over lazily loaded positions is flagged as N+1"""
+        _portfolios_with_positions(db_session)
+        diagnostics = QueryDiagnostics(repeat_threshold=5, slow_query_seconds=60).install(db_engine)
+        try:
+            with caplog.at_level(logging.WARNING, logger="models.diagnostics"):
+                for portfolio in db_session.query(Portfolio).all():
+                    portfolio.calculate_total_value()
+        finally:
+            diagnostics.remove(db_engine)
+            
+        [finding] = diagnostics.findings
+        assert finding["kind"] == "repeated"
+        assert "FROM positions" in finding["statement"]
+        assert "calculate_total_value" in finding["location"]
+        assert "Possible N+1" in caplog.text
+        
+    def test_counts_reset_at_transaction_end(self, db_engine, db_session):
+        """Test the same statement in separate transactions is not an N+1"""
+        diagnostics = QueryDiagnostics(repeat_threshold=3, slow_query_seconds=60).install(db_engine)
+        try:
+            for _ in range(5):
+                db_session.execute(text("SELECT 1"))
+                db_session.commit()
+        finally:
+            diagnostics.remove(db_engine)
+            
+        assert list(diagnostics.findings) == []
+        
+    def test_strict_mode_raises(self, db_engine, db_session):
+        """Test strict diagnostics fail the offending statement"""
+        _portfolios_with_positions(db_session)
+        diagnostics = QueryDiagnostics(repeat_threshold=3, strict=True).install(db_engine)
+        try:
+            with pytest.raises(QueryDiagnosticsError):
+                for portfolio in db_session.query(Portfolio).all():
+                    portfolio.calculate_total_value()
+        finally:
+            diagnostics.remove(db_engine)
+            
+    def test_slow_query_logs_parameters_and_plan(self, db_engine, db_session, caplog):
+        """Test slow statements are logged with bound parameters and EXPLAIN output"""
+        diagnostics = QueryDiagnostics(slow_query_seconds=0).install(db_engine)
+        try:
+            with caplog.at_level(logging.WARNING, logger="models.diagnostics"):
+                db_session.query(Portfolio).filter(Portfolio.port_id == "PORT0001").all()
+        finally:
+            diagnostics.remove(db_engine)
+            
+        finding = diagnostics.findings[0]
+        assert finding["kind"] == "slow"
+        assert "PORT0001" in finding["parameters"]
+        assert any("portfolios" in line for line in finding["plan"])
+        assert "Plan:" in caplog.text
+        
+    def test_findings_are_bounded(self, db_engine, db_session):
+        """Test a long-lived instance keeps only the latest max_findings findings"""
+        diagnostics = QueryDiagnostics(slow_query_seconds=0, explain=False, max_findings=3).install(db_engine)
+        try:
+            for index in range(10):
+                db_session.execute(text(f"SELECT {index}"))
+        finally:
+            diagnostics.remove(db_engine)
+            
+        assert [finding["statement"] for finding in diagnostics.findings] == ["SELECT 7", "SELECT 8", "SELECT 9"]
+        
+    def test_from_env_is_opt_in(self, monkeypatch):
+        """Test diagnostics stay off unless DB_DIAGNOSTICS is set"""
+        monkeypatch.delenv("DB_DIAGNOSTICS", raising=False)
+        assert QueryDiagnostics.from_env() is None
+        
+        monkeypatch.setenv("DB_DIAGNOSTICS", "true")
+        monkeypatch.setenv("DB_DIAGNOSTICS_SLOW_QUERY_MS", "250")
+        assert QueryDiagnostics.from_env().slow_query_seconds == 0.25
+
+
+class TestQueryBudget:
+    """Test query budgets for tests"""
+    
+    def test_within_budget(self, db_engine, db_session):
+        """Test the block's statements are exposed when the budget holds"""
+        with query_budget(db_engine, 2) as statements:
+            db_session.execute(text("SELECT 1"))
+            
+        assert statements == ["SELECT 1"]
+        
+    def test_over_budget_fails(self, db_engine, db_session):
+        """Test exceeding the budget raises with the statements listed"""
+        with pytest.raises(QueryBudgetExceeded, match="3 statements ran, budget is 2"):
+            with query_budget(db_engine, 2):
+                for _ in range(3):
+                    db_session.execute(text("SELECT 1"))
@@ -0,0 +1,65 @@
+import json
+from models import History
+from models.history import encode_images
+
+
+BEFORE = {"portfolio_id": "PORT0001", "quantity": 10.0, "cost_basis": 1000.0, "status": "A"}
+AFTER = {"portfolio_id": "PORT0001", "quantity": 15.0, "cost_basis": 1600.0, "status": "A"}
+
+
+def make_record(before_data=BEFORE, after_data=AFTER):
+    return History(**History.build_audit_values(
+        portfolio_id="PORT0001",
+        record_type="PS",
+        action_code="C",
+        before_data=before_data,
+        after_data=after_data
+    ))
+
+
+class TestHistoryImages:
+    """Test delta encoded before/after images"""
+    
+    def test_after_image_stores_only_changes(self):
+        """Test unchanged fields are left out of the after image"""
+        record = make_record()
+        assert record.image_format == "D"
+        assert json.loads(record.after_image) == {"quantity": 15.0, "cost_basis": 1600.0}
+        
+    def test_round_trip(self):
+        """Test full images are rebuilt on read"""
+        record = make_record()
+        assert record.get_before_data() == BEFORE
+        assert record.get_after_data() == AFTER
+        assert record.to_dict()["after_data"] == AFTER
+        
+    def test_removed_keys(self):
+        """Test keys missing from the after image are removed on rebuild"""
+        after = {key: value for key, value in AFTER.items() if key != "status"}
+        assert make_record(after_data=after).get_after_data() == after
+        
+    def test_added_record_keeps_full_after_image(self):
+        """Test records without a before image store the after image in full"""
+        record = make_record(before_data=None)
+        assert record.before_image is None
+        assert record.get_after_data() == AFTER
+        
+    def test_legacy_full_images(self):
+        """Test rows written before delta encoding still decode"""
+        record = History(before_image=json.dumps(BEFORE), after_image=json.dumps(AFTER))
+        assert record.get_before_data() == BEFORE
+        assert record.get_after_data() == AFTER
+        
+    def test_decoded_images_are_cached(self):
+        """Test images are parsed once until the columns change"""
+        record = make_record()
+        assert record.get_after_data() is record.get_after_data()
+        
+        record.before_image, record.after_image = encode_images(AFTER, BEFORE)
+        assert record.get_after_data() == BEFORE
+        
+    def test_invalid_json(self):
+        """Test unreadable images decode to None"""
+        record = History(before_image="{not json", after_image="{}", image_format="D")
+        assert record.get_before_data() is None
+        assert record.get_after_data() == {}
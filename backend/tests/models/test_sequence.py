@@ -0,0 +1,86 @@
+import threading
+import pytest
+from datetime import datetime
+from models import History, Portfolio, HistorySequenceAllocator
+
+
+NOW = datetime(2030, 5, 1, 10, 15, 30, 120000)
+
+
+class TestHistorySequenceAllocator:
+    """Test in-memory History seq_no allocation"""
+    
+    def test_sequential_in_same_slot(self):
+        """Test numbers increase within one time slot"""
+        allocator = HistorySequenceAllocator()
+        assert allocator.allocate("PORT0001", NOW) == ("20300501", "10153012", "0001")
+        assert allocator.allocate("PORT0001", NOW) == ("20300501", "10153012", "0002")
+        assert allocator.allocate("PORT0002", NOW)[2] == "0001"
+        
+    def test_new_slot_restarts_sequence(self):
+        """Test a later slot starts again from the first number"""
+        allocator = HistorySequenceAllocator()
+        allocator.allocate("PORT0001", NOW)
+        later = NOW.replace(second=31)
+        assert allocator.allocate("PORT0001", later) == ("20300501", "10153112", "0001")
+        
+    def test_clock_going_backwards_keeps_slot(self):
+        """Test an earlier clock reading reuses the latest slot"""
+        allocator = HistorySequenceAllocator()
+        allocator.allocate("PORT0001", NOW)
+        earlier = NOW.replace(second=29)
+        assert allocator.allocate("PORT0001", earlier) == ("20300501", "10153012", "0002")
+        
+    def test_worker_residue_classes(self):
+        """Test workers never hand out the same number"""
+        first = HistorySequenceAllocator(worker_id=0, worker_count=3)
+        second = HistorySequenceAllocator(worker_id=1, worker_count=3)
+        a = {first.allocate("PORT0001", NOW)[2] for _ in range(50)}
+        b = {second.allocate("PORT0001", NOW)[2] for _ in range(50)}
+        assert len(a) == 50 and len(b) == 50
+        assert not a & b
+        
+    def test_exhausted_slot_moves_to_next_tick(self):
+        """Test running out of numbers advances the slot"""
+        allocator = HistorySequenceAllocator(worker_id=0, worker_count=5000)
+        assert allocator.allocate("PORT0001", NOW)[2] == "0001"
+        assert allocator.allocate("PORT0001", NOW)[2] == "5001"
+        assert allocator.allocate("PORT0001", NOW) == ("20300501", "10153013", "0001")
+        
+    def test_invalid_worker_configuration(self):
+        """Test worker id must fall inside the worker count"""
+        with pytest.raises(ValueError):
+            HistorySequenceAllocator(worker_id=2, worker_count=2)
+            
+    def test_thread_safety(self):
+        """Test concurrent allocation yields unique keys"""
+        allocator = HistorySequenceAllocator()
+        keys = []
+        
+        def allocate():
+            for _ in range(200):
+                keys.append(allocator.allocate("PORT0001", NOW))
+                
+        threads = [threading.Thread(target=allocate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+            
+        assert len(set(keys)) == len(keys) == 1600
+        
+    def test_reconcile_continues_after_database_rows(self, db_session):
+        """Test reconciliation resumes after the highest stored seq_no"""
+        db_session.add(Portfolio(port_id="PORT0001", account_no="1234567890", client_type="I", status="A"))
+        for seq in ("0001", "0002", "0007"):
+            db_session.add(History(portfolio_id="PORT0001", date="20300501", time="10153012", seq_no=seq,
+                                   record_type="TR", action_code="A"))
+        db_session.add(History(portfolio_id="PORT0001", date="20300501", time="09000000", seq_no="0009",
+                               record_type="TR", action_code="A"))
+        db_session.commit()
+        
+        allocator = HistorySequenceAllocator()
+        allocator.reconcile(db_session)
+        
+        earlier = NOW.replace(minute=0)
+        assert allocator.allocate("PORT0001", earlier) == ("20300501", "10153012", "0008")
@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from sqlalchemy.orm import sessionmaker
+from models import get_async_db, get_async_session_factory, get_db
+from services.cache import portfolio_cache
+from services.idempotency import idempotency_filter
+
+
+@pytest.fixture
+def db_engine(file_db_engine):
+    """Routes read through async sessions, so seed data goes to the shared database file"""
+    return file_db_engine
+
+
+@pytest.fixture
+def client(file_db_engine, async_session_factory):
+    async def get_test_db():
+        async with async_session_factory() as db:
+            yield db
+            
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=file_db_engine)
+    
+    def get_test_sync_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+            
+    app.dependency_overrides[get_db] = get_test_sync_db
+    app.dependency_overrides[get_async_db] = get_test_db
+    app.dependency_overrides[get_async_session_factory] = lambda: async_session_factory
+    portfolio_cache.clear()
+    idempotency_filter.reset()
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+    portfolio_cache.clear()
+    idempotency_filter.reset()
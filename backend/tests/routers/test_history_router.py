@@ -0,0 +1,44 @@
+import pytest
+from datetime import datetime, timedelta
+from models import History
+from tests.factories import make_portfolio
+
+
+@pytest.fixture
+def seeded(db_session):
+    db_session.add(make_portfolio("PORT0001", "1234567890"))
+    db_session.commit()
+    start = datetime(2024, 2, 1, 9, 0)
+    db_session.execute(History.bulk_insert(), [
+        History.build_audit_values("PORT0001", "TR" if index % 2 else "PS", "A", after_data={"n": index},
+                                   now=start + timedelta(minutes=index))
+        for index in range(5)
+    ])
+    db_session.commit()
+
+
+class TestGetHistory:
+    """Test GET /api/history/{portfolio_id}"""
+    
+    def test_keyset_pages(self, client, seeded):
+        """Test following nextCursor returns every record once"""
+        first = client.get("/api/history/PORT0001", params={"limit": 3}).json()
+        second = client.get("/api/history/PORT0001", params={"limit": 3, "cursor": first["nextCursor"]}).json()
+        
+        assert first["portfolioId"] == "PORT0001"
+        assert [r["after_data"]["n"] for r in first["records"] + second["records"]] == [0, 1, 2, 3, 4]
+        assert second["nextCursor"] is None
+        
+    def test_time_range_and_record_type(self, client, seeded):
+        """Test filters are applied"""
+        response = client.get("/api/history/PORT0001", params={
+            "from_time": "2024-02-01T09:01:00", "to_time": "2024-02-01T09:04:00", "record_type": "TR"
+        })
+        
+        assert response.status_code == 200
+        assert [r["after_data"]["n"] for r in response.json()["records"]] == [1, 3]
+        
+    def test_bad_filters(self, client, seeded):
+        """Test invalid filters and cursors answer 400"""
+        assert client.get("/api/history/PORT0001", params={"record_type": "XX"}).status_code == 400
+        assert client.get("/api/history/PORT0001", params={"cursor": "bogus"}).status_code == 400
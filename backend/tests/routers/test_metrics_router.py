@@ -0,0 +1,36 @@
+from app.metrics import instrument_engine
+from tests.factories import make_portfolio
+
+class TestMetricsEndpoint:
+    """Test the application's /metrics endpoint"""
+    
+    def test_portfolio_request_is_exposed(self, db_session, client, async_session_factory):
+        """Test a portfolio request shows up with its route template and query count"""
+        instrument_engine(async_session_factory.kw["bind"])
+        db_session.add(make_portfolio())
+        db_session.commit()
+        
+        assert client.get("/api/portfolio/1234567890").status_code == 200
+        response = client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'http_requests_total{method="GET",route="/api/portfolio/{account_number}",status="200"}' in response.text
+        assert 'http_request_db_queries_count{method="GET",route="/api/portfolio/{account_number}"}' in response.text
+        assert "http_requests_in_flight 1" in response.text
+        
+    def test_write_conflict_counters_are_exposed(self, client):
+        """Test the optimistic write counters are rendered"""
+        response = client.get("/metrics")
+        
+        assert "# TYPE portfolio_write_attempts_total counter" in response.text
+        assert "# TYPE portfolio_write_conflicts_total counter" in response.text
+        assert "# TYPE portfolio_write_retries_exhausted_total counter" in response.text
+        
+    def test_pool_gauges_are_exposed(self, client):
+        """Test the application engines' pool occupancy and checkout timeouts are rendered"""
+        response = client.get("/metrics")
+        
+        assert 'db_pool_checked_out_connections{engine="sync"}' in response.text
+        assert 'db_pool_overflow_connections{engine="async"}' in response.text
+        assert "# TYPE db_pool_checkout_timeouts_total counter" in response.text
@@ -0,0 +1,79 @@
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from models import Portfolio, Position
+from services import PortfolioService
+from services.cache import portfolio_cache
+from tests.factories import make_transaction
+
+
+def add_position(db_session, investment_id, position_date, quantity, cost_basis, market_value, status="A"):
+    db_session.add(Position(
+        portfolio_id="PORT0001",
+        date=position_date,
+        investment_id=investment_id,
+        quantity=Decimal(quantity),
+        cost_basis=Decimal(cost_basis),
+        market_value=Decimal(market_value),
+        currency="USD",
+        status=status,
+        last_maint_date=datetime(2024, 3, 1, 16, 30)
+    ))
+
+
+@pytest.fixture
+def seeded(db_session):
+    db_session.add(Portfolio(port_id="PORT0001", account_no="1234567890", client_type="I", status="A",
+                             cash_balance=Decimal("252.00"), total_value=Decimal("28039.50")))
+    add_position(db_session, "AAPL", date(2024, 2, 29), "100", "17000.00", "18000.00")
+    add_position(db_session, "AAPL", date(2024, 3, 1), "150", "25500.00", "27787.50")
+    add_position(db_session, "MSFT", date(2024, 3, 1), "10", "3400.00", "3700.00", status="C")
+    db_session.commit()
+
+
+class TestGetPortfolio:
+    """Test the database backed portfolio endpoint"""
+    
+    def test_summary_from_positions(self, client, seeded):
+        """Test holdings come from the latest active position rows"""
+        response = client.get("/api/portfolio/1234567890")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["accountNumber"] == "1234567890"
+        assert body["totalValue"] == 28039.50
+        assert body["totalGainLoss"] == 2287.50
+        assert body["totalGainLossPercent"] == 8.97
+        assert body["lastUpdated"] == "March 01, 2024, 04:30 PM"
+        assert body["holdings"] == [{
+            "symbol": "AAPL",
+            "name": "AAPL",
+            "shares": 150,
+            "currentPrice": 185.25,
+            "marketValue": 27787.50,
+            "gainLoss": 2287.50,
+            "gainLossPercent": 8.97
+        }]
+        
+    def test_unknown_account(self, client, seeded):
+        """Test unknown accounts return 404"""
+        assert client.get("/api/portfolio/9999999999").status_code == 404
+        
+    def test_summary_is_cached(self, client, seeded, db_session):
+        """Test repeated reads are served from the cache"""
+        client.get("/api/portfolio/1234567890")
+        db_session.query(Portfolio).update({"total_value": Decimal("1.00")})
+        db_session.commit()
+        
+        assert client.get("/api/portfolio/1234567890").json()["totalValue"] == 28039.50
+        assert portfolio_cache.stats()["hits"] >= 1
+        
+        portfolio_cache.invalidate("1234567890")
+        assert client.get("/api/portfolio/1234567890").json()["totalValue"] == 1.00
+    
+    def test_processing_invalidates_cached_summary(self, client, seeded, db_session):
+        """Test a committed transaction evicts the account's summary"""
+        client.get("/api/portfolio/1234567890")
+        fee = make_transaction(1, "FE", investment_id=None, quantity=None, price=None, amount=Decimal("39.50"))
+        assert PortfolioService(db_session).process_transaction(fee)["success"] is True
+        
+        assert client.get("/api/portfolio/1234567890").json()["totalValue"] == 28000.00
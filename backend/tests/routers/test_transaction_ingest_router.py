@@ -0,0 +1,71 @@
+import pytest
+from models import Position
+from tests.factories import make_portfolio
+
+
+@pytest.fixture
+def seeded(db_session):
+    db_session.add(make_portfolio("PORT0001", "1234567890"))
+    db_session.commit()
+
+
+def body(seq, **overrides):
+    payload = {"date": "2024-02-01", "time": "09:30:00", "portfolioId": "PORT0001", "sequenceNo": f"{seq:06d}",
+               "investmentId": "AAPL000001", "type": "BU", "quantity": "10", "price": "100", "currency": "USD"}
+    payload.update(overrides)
+    return payload
+
+
+class TestSubmitTransactions:
+    """Test POST /api/transactions"""
+    
+    def test_single_submission_and_replay(self, client, seeded, db_session):
+        """Test a header-keyed submission is applied once and replayed after"""
+        headers = {"Idempotency-Key": "abc-1"}
+        first = client.post("/api/transactions", json=body(1), headers=headers)
+        again = client.post("/api/transactions", json=body(1), headers=headers)
+        
+        assert first.status_code == 201
+        assert first.json()["status"] == "processed"
+        assert again.status_code == 200
+        assert again.json()["replayed"] is True
+        assert db_session.query(Position).one().quantity == 10
+        
+    def test_single_conflict_and_rejection(self, client, seeded):
+        """Test key reuse answers 409 and invalid transactions 422"""
+        client.post("/api/transactions", json=body(1, idempotencyKey="abc-1"))
+        
+        assert client.post("/api/transactions", json=body(2, idempotencyKey="abc-1")).status_code == 409
+        response = client.post("/api/transactions", json=body(3, idempotencyKey="abc-2", quantity="0"))
+        assert response.status_code == 422
+        assert response.json()["status"] == "rejected"
+        
+    def test_failed_single_submission(self, client, seeded, db_session):
+        """Test a transaction that fails processing is not answered as created"""
+        db_session.add(make_portfolio("PORT0002", "2234567890"))
+        db_session.commit()
+        response = client.post("/api/transactions", json=body(1, idempotencyKey="abc-1", type="TR",
+                                                                targetPortfolioId="PORT0002", investmentId=None,
+                                                                quantity=None, price=None, amount="1000000000"))
+        
+        assert response.status_code == 422
+        assert response.json()["status"] == "failed"
+        assert response.json()["errors"]
+        
+    def test_bulk_submission(self, client, seeded):
+        """Test bulk results come back in order with status counts"""
+        client.post("/api/transactions", json=body(1, idempotencyKey="k1"))
+        response = client.post("/api/transactions", json={"transactions": [
+            body(1, idempotencyKey="k1"), body(2, idempotencyKey="k2"), body(3, idempotencyKey="k3", type="XX")
+        ]})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [r["idempotencyKey"] for r in data["results"]] == ["k1", "k2", "k3"]
+        assert [r["replayed"] for r in data["results"]] == [True, False, False]
+        assert data["counts"] == {"processed": 2, "rejected": 1}
+        
+    def test_missing_key_is_rejected(self, client, seeded):
+        """Test every transaction needs an idempotency key"""
+        assert client.post("/api/transactions", json=body(1)).status_code == 400
+        assert client.post("/api/transactions", json={"transactions": [body(1)]}).status_code == 400
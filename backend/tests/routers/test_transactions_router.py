@@ -0,0 +1,90 @@
+import json
+import pytest
+from datetime import date, time
+from decimal import Decimal
+from models import Transaction
+from tests.factories import make_portfolio
+
+
+@pytest.fixture
+def seeded(db_session):
+    db_session.add(make_portfolio("PORT0001", "1234567890"))
+    db_session.add(make_portfolio("PORT0002", "1234567890"))
+    db_session.add(make_portfolio("PORT0003", "5555555555"))
+    rows = [
+        (date(2024, 1, 2), time(9, 0), "PORT0001", "000001", "BU", "D"),
+        (date(2024, 1, 2), time(9, 0), "PORT0002", "000001", "SL", "D"),
+        (date(2024, 1, 2), time(10, 0), "PORT0001", "000002", "FE", "P"),
+        (date(2024, 1, 3), time(9, 0), "PORT0001", "000003", "BU", "D"),
+        (date(2024, 1, 4), time(9, 0), "PORT0002", "000002", "BU", "F"),
+        (date(2024, 1, 4), time(9, 0), "PORT0003", "000001", "BU", "D"),
+    ]
+    for trade_date, trade_time, portfolio_id, sequence_no, type_, status in rows:
+        db_session.add(Transaction(date=trade_date, time=trade_time, portfolio_id=portfolio_id,
+                                   sequence_no=sequence_no, investment_id="AAPL000001", type=type_,
+                                   quantity=Decimal("1"), price=Decimal("10"), amount=Decimal("10.00"),
+                                   currency="USD", status=status))
+    db_session.commit()
+
+
+def keys(transactions):
+    return [(t["date"], t["portfolio_id"], t["sequence_no"]) for t in transactions]
+
+
+class TestGetTransactions:
+    """Test keyset pagination of the transactions endpoint"""
+    
+    def test_pages_follow_primary_key_order(self, client, seeded):
+        """Test cursors walk every row of the account exactly once"""
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            body = client.get("/api/transactions/1234567890", params=params).json()
+            seen.extend(keys(body["transactions"]))
+            pages += 1
+            cursor = body["nextCursor"]
+            if cursor is None:
+                break
+                
+        assert pages == 3
+        assert seen == [
+            ("2024-01-02", "PORT0001", "000001"),
+            ("2024-01-02", "PORT0002", "000001"),
+            ("2024-01-02", "PORT0001", "000002"),
+            ("2024-01-03", "PORT0001", "000003"),
+            ("2024-01-04", "PORT0002", "000002"),
+        ]
+        
+    def test_filters(self, client, seeded):
+        """Test date range, type and status filters"""
+        body = client.get("/api/transactions/1234567890",
+                          params={"from_date": "2024-01-03", "type": "BU"}).json()
+        assert keys(body["transactions"]) == [("2024-01-03", "PORT0001", "000003"),
+                                              ("2024-01-04", "PORT0002", "000002")]
+                                              
+        body = client.get("/api/transactions/1234567890",
+                          params={"to_date": "2024-01-02", "status": "D"}).json()
+        assert len(body["transactions"]) == 2
+        
+    def test_invalid_cursor_and_filters(self, client, seeded):
+        """Test malformed input is rejected with 400"""
+        assert client.get("/api/transactions/1234567890", params={"cursor": "garbage"}).status_code == 400
+        assert client.get("/api/transactions/1234567890", params={"type": "XX"}).status_code == 400
+        
+    def test_stream_ndjson(self, client, seeded):
+        """Test the streaming export yields one JSON object per line"""
+        response = client.get("/api/transactions/1234567890/stream", params={"type": "BU"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert keys(lines) == [("2024-01-02", "PORT0001", "000001"),
+                               ("2024-01-03", "PORT0001", "000003"),
+                               ("2024-01-04", "PORT0002", "000002")]
+                               
+    def test_stream_invalid_filter(self, client, seeded):
+        """Test the stream validates filters before sending data"""
+        assert client.get("/api/transactions/1234567890/stream", params={"status": "Z"}).status_code == 400
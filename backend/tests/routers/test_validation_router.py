@@ -0,0 +1,35 @@
+class TestValidateBatch:
+    """Test POST /api/validate/batch"""
+    
+    def test_columns_body(self, client):
+        """Test column-form batches return compact per-row errors"""
+        response = client.post("/api/validate/batch", json={
+            "recordType": "portfolio",
+            "columns": {"port_id": ["PORT0001", "P1"], "account_no": ["1234567890", "1234567890"],
+                        "client_type": ["I", "I"], "status": ["A", "A"]}
+        })
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["validCount"] == 1
+        assert data["errors"] == [[1, [0]]]
+        assert data["codes"][0]["code"] == "PORT_ID_LENGTH"
+        
+    def test_records_body_and_max_errors(self, client):
+        """Test row-form batches and the maxErrors limit"""
+        records = [{"port_id": "P1", "account_no": "1", "client_type": "I", "status": "A"}] * 3
+        response = client.post("/api/validate/batch?maxErrors=1",
+                               json={"recordType": "portfolio", "records": records})
+        
+        data = response.json()
+        assert data["invalidCount"] == 3
+        assert data["errors"] == [[0, [0, 1]]]
+        assert data["truncated"] is True
+        
+    def test_bad_requests(self, client):
+        """Test malformed batches are rejected with 400"""
+        assert client.post("/api/validate/batch", content=b"not json").status_code == 400
+        assert client.post("/api/validate/batch", json={"recordType": "portfolio"}).status_code == 400
+        response = client.post("/api/validate/batch", json={"recordType": "trade", "columns": {}})
+        assert response.status_code == 400
+        assert "record type" in response.json()["detail"]
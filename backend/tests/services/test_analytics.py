@@ -0,0 +1,86 @@
+import random
+import numpy as np
+from datetime import date
+from decimal import Decimal
+from models import Portfolio, Position
+from services.analytics import PositionFrame, analyze, gain_loss, load_cash_balances, to_decimal
+from tests.factories import make_portfolio
+
+
+def random_positions(count, seed=7):
+    rng = random.Random(seed)
+    positions = []
+    for index in range(count):
+        positions.append(Position(
+            portfolio_id=f"PORT{index % 13:04d}",
+            date=date(2024, 3, 1),
+            investment_id=f"INV{index:07d}",
+            quantity=Decimal(rng.randint(0, 10 ** 8)).scaleb(-4),
+            cost_basis=rng.choice([None, Decimal("0.00"), Decimal(rng.randint(-10 ** 6, 10 ** 9)).scaleb(-2)]),
+            market_value=rng.choice([None, Decimal(rng.randint(0, 10 ** 9)).scaleb(-2)]),
+            currency="USD",
+            status=rng.choice(["A", "A", "A", "C", "P"])
+        ))
+    return positions
+
+
+class TestAnalytics:
+    """Test the vectorized analytics against the Decimal model methods"""
+    
+    def test_gain_loss_matches_decimal_reference(self):
+        """Test gain/loss and gain % agree with calculate_gain_loss to the cent"""
+        positions = random_positions(2000)
+        gain, percent = gain_loss(PositionFrame.from_positions(positions))
+        for index, position in enumerate(positions):
+            expected = position.calculate_gain_loss()
+            assert to_decimal(gain[index]) == expected["gain_loss"].quantize(Decimal("0.01"))
+            assert to_decimal(percent[index]) == expected["gain_loss_percent"].quantize(Decimal("0.01"))
+            
+    def test_percent_rounds_half_even(self):
+        """Test exact half hundredths round like Decimal.quantize"""
+        frame = PositionFrame.from_rows([
+            ("PORT0001", "A", 0, 800, 801, "A", "USD"),
+            ("PORT0001", "B", 0, 1600, 1601, "A", "USD"),
+        ])
+        _, percent = gain_loss(frame)
+        assert percent.tolist() == [12, 6]
+        
+    def test_totals_and_weights_match_decimal_reference(self):
+        """Test per-portfolio totals agree with calculate_total_value and weights sum to the invested share"""
+        positions = random_positions(500)
+        portfolios = {}
+        for position in positions:
+            portfolio = portfolios.setdefault(position.portfolio_id, make_portfolio(position.portfolio_id))
+            portfolio.positions.append(position)
+        portfolios["PORT9999"] = make_portfolio("PORT9999", cash=Decimal("12.34"))
+        cash = {port_id: int(p.cash_balance * 100) for port_id, p in portfolios.items()}
+        
+        frame = PositionFrame.from_positions(positions)
+        result = analyze(frame, cash)
+        
+        assert list(result["portfolio_id"]) == sorted(portfolios)
+        for port_id, total in zip(result["portfolio_id"], result["total_value"]):
+            assert to_decimal(total) == portfolios[port_id].calculate_total_value()
+        for port_id, portfolio in portfolios.items():
+            invested = sum(p.valued_amount() for p in portfolio.positions)
+            weight = result["weight"][frame.portfolio_id == port_id].sum()
+            assert np.isclose(weight, float(invested / portfolio.calculate_total_value()))
+            
+    def test_load_from_database(self, db_session):
+        """Test loading scales columns in SQL and matches the ORM objects"""
+        db_session.add(make_portfolio("PORT0001", cash=Decimal("100.25")))
+        db_session.add(make_portfolio("PORT0002", account_no="2222222222"))
+        db_session.add_all(random_positions(40))
+        db_session.commit()
+        
+        loaded = PositionFrame.load(db_session, batch_size=7)
+        ordered = sorted(zip(loaded.investment_id, loaded.cost_basis, loaded.market_value, loaded.quantity))
+        expected = PositionFrame.from_positions(db_session.query(Position).order_by(Position.investment_id))
+        assert ordered == list(zip(expected.investment_id, expected.cost_basis, expected.market_value, expected.quantity))
+        assert load_cash_balances(db_session, ["PORT0001"]) == {"PORT0001": 10025}
+        
+    def test_empty_frame(self):
+        """Test an empty frame yields empty results and cash-only totals"""
+        result = analyze(PositionFrame.from_rows([]), {"PORT0001": 500})
+        assert len(result["gain_loss"]) == 0
+        assert result["total_value"].tolist() == [500]
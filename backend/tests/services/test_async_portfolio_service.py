@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from datetime import date, time
+from decimal import Decimal
+from sqlalchemy.orm import sessionmaker
+from models import Position, Transaction
+from services import AsyncPortfolioService, PortfolioService
+from tests.factories import make_portfolio
+
+
+@pytest.fixture
+def seeded(file_db_engine):
+    db = sessionmaker(bind=file_db_engine)()
+    db.add(make_portfolio("PORT0001", "1234567890"))
+    db.add(Position(portfolio_id="PORT0001", date=date(2024, 3, 1), investment_id="AAPL000001",
+                    quantity=Decimal("10"), cost_basis=Decimal("1000.00"), market_value=Decimal("1200.00"),
+                    currency="USD", status="A"))
+    for seq in range(1, 6):
+        db.add(Transaction(date=date(2024, 1, seq), time=time(9, 0), portfolio_id="PORT0001",
+                           sequence_no=f"{seq:06d}", investment_id="AAPL000001", type="BU",
+                           quantity=Decimal("1"), price=Decimal("10"), amount=Decimal("10.00"),
+                           currency="USD", status="D"))
+    db.commit()
+    yield db
+    db.close()
+
+
+def run(async_session_factory, call):
+    async def main():
+        async with async_session_factory() as db:
+            return await call(AsyncPortfolioService(db, cache=None))
+    return asyncio.run(main())
+
+
+class TestAsyncPortfolioService:
+    """Test the AsyncSession read paths"""
+    
+    def test_summary_matches_sync_service(self, async_session_factory, seeded):
+        """Test the async summary is identical to the synchronous one"""
+        expected = PortfolioService(seeded, cache=None).get_portfolio_summary("1234567890")
+        summary = run(async_session_factory, lambda service: service.get_portfolio_summary("1234567890"))
+        assert summary == expected
+        assert run(async_session_factory, lambda service: service.get_portfolio_summary("9999999999")) is None
+        
+    def test_list_transactions_pages(self, async_session_factory, seeded):
+        """Test keyset pages and cursors match the synchronous service"""
+        rows, cursor = run(async_session_factory, lambda service: service.list_transactions("1234567890", limit=3))
+        assert rows == PortfolioService(seeded).list_transactions("1234567890", limit=3)[0]
+        rest, last_cursor = run(async_session_factory,
+                                lambda service: service.list_transactions("1234567890", limit=3, cursor=cursor))
+        assert [row["sequence_no"] for row in rows + rest] == [f"{seq:06d}" for seq in range(1, 6)]
+        assert last_cursor is None
+        
+    def test_invalid_filter(self, async_session_factory, seeded):
+        """Test bad filters raise ValueError like the synchronous service"""
+        with pytest.raises(ValueError):
+            run(async_session_factory, lambda service: service.list_transactions("1234567890", transaction_type="XX"))
+            
+    def test_iter_transactions(self, async_session_factory, seeded):
+        """Test streaming yields every row in key order"""
+        async def collect(service):
+            return [t.sequence_no async for t in service.iter_transactions("1234567890", batch_size=2)]
+        assert run(async_session_factory, collect) == [f"{seq:06d}" for seq in range(1, 6)]
+        
+    def test_concurrent_reads(self, async_session_factory, seeded):
+        """Test many reads in flight on one event loop each get their own correct result"""
+        async def main():
+            async def read(limit):
+                async with async_session_factory() as db:
+                    rows, _ = await AsyncPortfolioService(db, cache=None).list_transactions("1234567890", limit=limit)
+                    return len(rows)
+            return await asyncio.gather(*[read(limit) for limit in range(1, 6)] * 10)
+            
+        assert asyncio.run(main()) == [1, 2, 3, 4, 5] * 10
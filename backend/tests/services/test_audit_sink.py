@@ -0,0 +1,142 @@
+import threading
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from models import History, Portfolio
+from services import AuditSink, PortfolioService
+from tests.factories import make_portfolio, make_transaction
+
+
+def audit_values(portfolio_id="PORT0001"):
+    return History.build_audit_values(
+        portfolio_id=portfolio_id,
+        record_type="TR",
+        action_code="A",
+        after_data={"status": "D"},
+        reason_code="TEST"
+    )
+
+
+class TestAuditSink:
+    """Test buffered History writes"""
+    
+    def test_commit_mode_writes_with_the_trade(self, db_session):
+        """Test staged rows are inserted by the trade's commit"""
+        db_session.add(make_portfolio())
+        sink = AuditSink(mode="commit")
+        sink.add_many([audit_values(), audit_values()], db_session)
+        
+        assert db_session.query(History).count() == 0
+        db_session.commit()
+        
+        assert db_session.query(History).count() == 2
+        assert sink.stats()["flushed_rows"] == 2
+        
+    def test_rollback_discards_rows(self, db_session):
+        """Test a rolled back trade leaves no audit rows"""
+        sink = AuditSink(mode="commit")
+        db_session.add(make_portfolio())
+        db_session.flush()
+        sink.add(audit_values(), db_session)
+        db_session.rollback()
+        db_session.commit()
+        
+        assert db_session.query(History).count() == 0
+        
+    def test_deferred_mode_queues_until_flush(self, db_engine, db_session):
+        """Test deferred rows wait in the queue until flushed"""
+        sink = AuditSink(mode="deferred", flush_interval=60,
+                         session_factory=sessionmaker(bind=db_engine))
+        try:
+            sink.add_many([audit_values() for _ in range(3)], db_session)
+            db_session.commit()
+            assert sink.stats()["queue_depth"] == 3
+            
+            assert sink.flush() == 3
+            stats = sink.stats()
+            assert stats["queue_depth"] == 0
+            assert stats["flushes"] == 1
+            assert db_session.query(History).count() == 3
+        finally:
+            sink.close()
+            
+    def test_service_routes_audit_rows_through_sink(self, db_engine, db_session):
+        """Test PortfolioService hands its audit rows to the sink"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        sink = AuditSink(mode="deferred", flush_interval=60,
+                         session_factory=sessionmaker(bind=db_engine))
+        try:
+            result = PortfolioService(db_session, audit_sink=sink).process_transaction(make_transaction(1))
+            assert result["success"] is True
+            assert sink.stats()["queue_depth"] == 2
+            
+            sink.close()
+            assert db_session.query(History).count() == 2
+        finally:
+            sink.close()
+            
+    def test_poison_row_is_isolated_and_dropped(self, db_engine, db_session):
+        """Test a batch that keeps failing is split, so its good rows land and only the bad one is dropped"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        sink = AuditSink(mode="deferred", flush_interval=60, max_attempts=2,
+                         session_factory=sessionmaker(bind=db_engine))
+        try:
+            poison = dict(audit_values(), record_type="XX")
+            sink.add_many([audit_values() for _ in range(3)] + [poison, audit_values()], db_session)
+            db_session.commit()
+            
+            for _ in range(2):
+                with pytest.raises(IntegrityError):
+                    sink.flush()
+                assert sink.stats()["queue_depth"] == 5
+                
+            assert sink.flush() == 4
+            stats = sink.stats()
+            assert (stats["queue_depth"], stats["dropped_rows"], stats["failed_flushes"]) == (0, 1, 2)
+            assert db_session.query(History).count() == 4
+        finally:
+            sink.close()
+            
+    def test_full_queue_holds_back_committers(self, db_engine, db_session):
+        """Test a commit waits while the queue is full and the flusher is stuck, then goes through"""
+        factory = sessionmaker(bind=db_engine)
+        flushing = threading.Event()
+        release = threading.Event()
+        
+        def slow_session():
+            flushing.set()
+            release.wait(10)
+            return factory()
+            
+        db_session.add(make_portfolio())
+        db_session.commit()
+        sink = AuditSink(mode="deferred", max_batch=2, max_queue=2, flush_interval=60, session_factory=slow_session)
+        try:
+            sink.add_many([audit_values(), audit_values()], db_session)
+            db_session.commit()
+            assert flushing.wait(10)
+            
+            def commit_more():
+                with factory() as other:
+                    sink.add(audit_values(), other)
+                    other.commit()
+                    
+            producer = threading.Thread(target=commit_more)
+            producer.start()
+            producer.join(0.2)
+            assert producer.is_alive()
+            
+            release.set()
+            producer.join(10)
+            assert not producer.is_alive()
+        finally:
+            release.set()
+            sink.close()
+        assert db_session.query(History).count() == 3
+        
+    def test_invalid_mode(self):
+        """Test unknown modes are rejected"""
+        with pytest.raises(ValueError):
+            AuditSink(mode="later")
@@ -0,0 +1,93 @@
+import asyncio
+import time
+import pytest
+from services.cache import TTLCache
+
+
+class TestTTLCache:
+    """Test the in-process LRU/TTL cache"""
+    
+    def test_hit_and_miss(self):
+        """Test lookups are counted"""
+        cache = TTLCache()
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+        
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted first"""
+        cache = TTLCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+        
+    def test_expiry(self):
+        """Test entries expire after the TTL"""
+        cache = TTLCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        
+    def test_get_or_load(self):
+        """Test the loader runs only on a miss and None is not cached"""
+        cache = TTLCache()
+        calls = []
+        
+        def loader():
+            calls.append(1)
+            return "value"
+            
+        assert cache.get_or_load("a", loader) == "value"
+        assert cache.get_or_load("a", loader) == "value"
+        assert len(calls) == 1
+        assert cache.get_or_load("b", lambda: None) is None
+        assert cache.stats()["size"] == 1
+        
+    def test_load_racing_invalidation_is_not_stored(self):
+        """Test a value loaded across an invalidation is not cached"""
+        cache = TTLCache()
+        
+        def loader():
+            cache.invalidate("a")
+            return "stale"
+            
+        assert cache.get_or_load("a", loader) == "stale"
+        assert cache.get("a") is None
+        
+    def test_invalidating_another_key_keeps_the_load(self):
+        """Test only an invalidation of the loaded key discards its value"""
+        cache = TTLCache()
+        
+        def loader():
+            cache.invalidate("b")
+            cache.invalidate("c")
+            return "fresh"
+            
+        def failing_loader():
+            raise RuntimeError("database unavailable")
+            
+        assert cache.get_or_load("a", loader) == "fresh"
+        assert cache.get("a") == "fresh"
+        with pytest.raises(RuntimeError):
+            cache.get_or_load("d", failing_loader)
+        assert cache._loads == {}
+        
+    def test_get_or_load_async(self):
+        """Test coroutine loaders are awaited once and cached"""
+        cache = TTLCache()
+        calls = []
+        
+        async def loader():
+            calls.append(1)
+            return "value"
+            
+        assert asyncio.run(cache.get_or_load_async("a", loader)) == "value"
+        assert asyncio.run(cache.get_or_load_async("a", loader)) == "value"
+        assert len(calls) == 1
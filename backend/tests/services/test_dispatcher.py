@@ -0,0 +1,178 @@
+import queue
+import threading
+import pytest
+from decimal import Decimal
+from sqlalchemy.orm import sessionmaker
+from models import Base, Portfolio, Transaction, create_db_engine
+from services import PortfolioService
+from services.dispatcher import TransactionDispatcher
+from tests.factories import make_portfolio, make_transaction
+
+PORTFOLIOS = [(f"PORT000{n}", f"{n}234567890") for n in range(1, 5)]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """WAL SQLite file with four portfolios, so shards can read while one writes"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'dispatch.db'}")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add_all(make_portfolio(port_id, account_no, cash=Decimal("1000.00")) for port_id, account_no in PORTFOLIOS)
+        db.commit()
+    yield engine
+    engine.dispose()
+
+
+def fee(seq, portfolio_id="PORT0001", amount="1.00"):
+    return make_transaction(seq, "FE", portfolio_id=portfolio_id, investment_id=None, quantity=None, price=None,
+                            amount=Decimal(amount))
+
+
+class RecordingService(PortfolioService):
+    """PortfolioService that records which thread processed each transaction, in order"""
+    
+    log = []
+    
+    def __init__(self, db):
+        super().__init__(db, cache=None)
+        
+    def process_transaction(self, transaction, lot_selection=None):
+        self.log.append((transaction.portfolio_id, transaction.sequence_no, threading.current_thread().name))
+        return super().process_transaction(transaction, lot_selection)
+
+
+class TestTransactionDispatcher:
+    """Test sharded, per-portfolio ordered processing in front of process_transaction"""
+    
+    def test_processes_every_portfolio(self, engine):
+        """Test transactions for several portfolios are all applied and their futures resolved"""
+        transactions = [fee(seq, port_id) for port_id, _ in PORTFOLIOS for seq in range(1, 21)]
+        with TransactionDispatcher(shards=3, engine=engine, service_factory=RecordingService) as dispatcher:
+            futures = [dispatcher.submit(transaction) for transaction in transactions]
+            assert dispatcher.drain(timeout=30)
+            stats = dispatcher.stats()
+            
+        assert all(future.result()["success"] for future in futures)
+        assert {transaction.status for transaction in transactions} == {"D"}
+        assert stats["processed"] == 80 and stats["failed"] == 0 and stats["outstanding"] == 0
+        with sessionmaker(bind=engine)() as db:
+            assert {p.cash_balance for p in db.query(Portfolio)} == {Decimal("980.00")}
+            assert db.query(Transaction).filter(Transaction.status == "D").count() == 80
+            
+    def test_each_portfolio_stays_in_order_on_one_shard(self, engine):
+        """Test a portfolio's transactions run in key order on a single thread while shards run in parallel"""
+        RecordingService.log = []
+        transactions = [fee(seq, port_id) for seq in range(1, 31) for port_id, _ in PORTFOLIOS]
+        with TransactionDispatcher(shards=4, engine=engine, service_factory=RecordingService) as dispatcher:
+            dispatcher.submit_many(reversed(transactions))
+            assert dispatcher.drain(timeout=30)
+            
+        for port_id, _ in PORTFOLIOS:
+            entries = [entry for entry in RecordingService.log if entry[0] == port_id]
+            assert [sequence_no for _, sequence_no, _ in entries] == [f"{seq:06d}" for seq in range(1, 31)]
+            assert len({thread for _, _, thread in entries}) == 1
+        assert len({thread for _, _, thread in RecordingService.log}) > 1
+        
+    def test_full_queue_pushes_back(self, engine):
+        """Test submit blocks on a full shard queue and gives up with queue.Full after its timeout"""
+        started = threading.Event()
+        release = threading.Event()
+        
+        class BlockedService(PortfolioService):
+            def process_transaction(self, transaction, lot_selection=None):
+                started.set()
+                release.wait(10)
+                return super().process_transaction(transaction, lot_selection)
+                
+        dispatcher = TransactionDispatcher(shards=1, queue_size=1, engine=engine, service_factory=BlockedService)
+        try:
+            first = dispatcher.submit(fee(1))
+            assert started.wait(10)
+            dispatcher.submit(fee(2))
+            with pytest.raises(queue.Full):
+                # The first is running; the second fills the queue
+                dispatcher.submit(fee(3), timeout=0.2)
+            release.set()
+            assert dispatcher.drain(timeout=10)
+            assert first.result()["success"]
+            assert dispatcher.stats()["submitted"] == 2
+        finally:
+            release.set()
+            dispatcher.shutdown()
+            
+    def test_shutdown_cancels_pending_and_refuses_new_work(self, engine):
+        """Test shutdown with cancel_pending drops queued transactions and later submits fail"""
+        started = threading.Event()
+        release = threading.Event()
+        
+        class BlockedService(PortfolioService):
+            def process_transaction(self, transaction, lot_selection=None):
+                started.set()
+                release.wait(10)
+                return super().process_transaction(transaction, lot_selection)
+                
+        dispatcher = TransactionDispatcher(shards=1, engine=engine, service_factory=BlockedService)
+        running = dispatcher.submit(fee(1))
+        queued = [dispatcher.submit(fee(seq)) for seq in range(2, 5)]
+        assert started.wait(10)
+        
+        stopper = threading.Thread(target=dispatcher.shutdown, kwargs={"cancel_pending": True})
+        stopper.start()
+        release.set()
+        stopper.join(10)
+        
+        assert running.result()["success"]
+        assert all(future.cancelled() for future in queued)
+        assert dispatcher.drain(timeout=0)
+        with pytest.raises(RuntimeError):
+            dispatcher.submit(fee(5))
+            
+    def test_shutdown_settles_submits_blocked_on_a_full_queue(self, engine):
+        """Test a producer blocked on a full queue during shutdown gets a cancelled future, not a stranded one"""
+        started = threading.Event()
+        release = threading.Event()
+        
+        class BlockedService(PortfolioService):
+            def process_transaction(self, transaction, lot_selection=None):
+                started.set()
+                release.wait(10)
+                return super().process_transaction(transaction, lot_selection)
+                
+        dispatcher = TransactionDispatcher(shards=1, queue_size=1, engine=engine, service_factory=BlockedService)
+        running = dispatcher.submit(fee(1))
+        assert started.wait(10)
+        queued = dispatcher.submit(fee(2))
+        blocked = []
+        producer = threading.Thread(target=lambda: blocked.append(dispatcher.submit(fee(3))))
+        producer.start()
+        while dispatcher._putting == 0:
+            producer.join(0.01)
+            
+        stopper = threading.Thread(target=dispatcher.shutdown, kwargs={"cancel_pending": True})
+        stopper.start()
+        producer.join(10)
+        release.set()
+        stopper.join(10)
+        
+        assert not stopper.is_alive()
+        assert running.result()["success"]
+        assert queued.cancelled() and blocked[0].cancelled()
+        assert dispatcher.drain(timeout=0)
+        
+    def test_unexpected_error_fails_only_its_future(self, engine):
+        """Test an exception escaping the service is set on the future and the shard keeps going"""
+        
+        class FlakyService(PortfolioService):
+            def process_transaction(self, transaction, lot_selection=None):
+                if transaction.sequence_no == "000001":
+                    raise RuntimeError("boom")
+                return super().process_transaction(transaction, lot_selection)
+                
+        with TransactionDispatcher(shards=1, engine=engine, service_factory=FlakyService) as dispatcher:
+            failed, succeeded = dispatcher.submit(fee(1)), dispatcher.submit(fee(2))
+            assert dispatcher.drain(timeout=10)
+            
+        with pytest.raises(RuntimeError):
+            failed.result()
+        assert succeeded.result()["success"]
+        assert dispatcher.stats()["failed"] == 1
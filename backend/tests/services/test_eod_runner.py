@@ -0,0 +1,111 @@
+import json
+import os
+import pytest
+from datetime import date
+from decimal import Decimal
+from sqlalchemy.orm import sessionmaker
+from models import History, Position, Transaction, history_sequence
+from services.eod_runner import EndOfDayRunner, partition_for
+from tests.factories import make_portfolio, make_transaction
+
+PORTFOLIOS = [f"PORT{index:04d}" for index in range(12)]
+
+
+@pytest.fixture
+def seeded(file_db_engine):
+    db = sessionmaker(bind=file_db_engine)()
+    for index, portfolio_id in enumerate(PORTFOLIOS):
+        db.add(make_portfolio(portfolio_id, account_no=f"{index + 1:010d}"))
+        db.add(make_transaction(1, "BU", portfolio_id=portfolio_id))
+        db.add(make_transaction(2, "SL", portfolio_id=portfolio_id, quantity=Decimal("4.0000")))
+    db.add(make_transaction(3, "BU", portfolio_id="PORT0000", quantity=Decimal("-1.0000")))
+    db.commit()
+    yield db
+    db.close()
+
+
+def make_runner(file_db_engine, tmp_path, **kwargs):
+    return EndOfDayRunner(
+        database_url=str(file_db_engine.url),
+        checkpoint_dir=str(tmp_path / "checkpoints"),
+        process_date=date(2024, 2, 1),
+        **kwargs
+    )
+
+
+class TestEndOfDayRunner:
+    """Test the partitioned end-of-day runner"""
+    
+    def test_partitions_allocate_distinct_history_sequences(self, file_db_engine, seeded, tmp_path):
+        """Test each partition writes audit seq_nos from its own residue class and the allocator is restored"""
+        before = history_sequence.worker_id, history_sequence.worker_count
+        make_runner(file_db_engine, tmp_path, workers=1, partitions=3).run()
+        
+        assert (history_sequence.worker_id, history_sequence.worker_count) == before
+        records = seeded.query(History).all()
+        assert records
+        for record in records:
+            assert int(record.seq_no) % 3 == (partition_for(record.portfolio_id, 3) + 1) % 3
+            
+    def test_partitioning_is_stable(self):
+        """Test every portfolio lands in one fixed partition"""
+        assert [partition_for(p, 4) for p in PORTFOLIOS] == [partition_for(p, 4) for p in PORTFOLIOS]
+        assert {partition_for(p, 4) for p in PORTFOLIOS} <= {0, 1, 2, 3}
+        
+    def test_processes_all_partitions_in_worker_processes(self, file_db_engine, seeded, tmp_path):
+        """Test a process pool run handles every transaction and merges stats"""
+        stats = make_runner(file_db_engine, tmp_path, workers=2, partitions=3, portfolios_per_commit=2).run()
+        
+        assert stats["portfolios"] == 12
+        assert stats["processed"] == 24
+        assert stats["failed"] == 1
+        assert stats["errors"][0]["portfolio_id"] == "PORT0000"
+        assert [p["partition"] for p in stats["partitions"]] == [0, 1, 2]
+        assert sum(p["portfolios"] for p in stats["partitions"]) == 12
+        
+        seeded.expire_all()
+        pending = seeded.query(Transaction).filter_by(status="P").all()
+        assert [(t.portfolio_id, t.sequence_no) for t in pending] == [("PORT0000", "000003")]
+        assert {p.quantity for p in seeded.query(Position)} == {Decimal("6.0000")}
+        
+    def test_resume_continues_after_the_checkpoint(self, file_db_engine, seeded, tmp_path):
+        """Test a rerun continues after the last checkpointed portfolio and finished partitions pick up new rows"""
+        runner = make_runner(file_db_engine, tmp_path, workers=1, partitions=2, portfolios_per_commit=1)
+        os.makedirs(runner.checkpoint_dir)
+        first = [p for p in PORTFOLIOS if partition_for(p, 2) == 0]
+        with open(runner._checkpoint_path(0), "w") as handle:
+            json.dump({"partition": 0, "last_portfolio_id": None, "done": True, "portfolios": len(first),
+                       "processed": 99, "failed": 0, "errors": []}, handle)
+        second = [p for p in PORTFOLIOS if partition_for(p, 2) == 1]
+        with open(runner._checkpoint_path(1), "w") as handle:
+            json.dump({"partition": 1, "last_portfolio_id": second[0], "done": False, "portfolios": 1,
+                       "processed": 0, "failed": 0, "errors": []}, handle)
+                       
+        stats = runner.run()
+        
+        assert stats["resumed_partitions"] == 2
+        assert stats["partitions"][0]["processed"] == 99 + 2 * len(first)
+        assert stats["partitions"][1]["processed"] == 2 * (len(second) - 1)
+        seeded.expire_all()
+        pending = {t.portfolio_id for t in seeded.query(Transaction).filter_by(status="P")}
+        assert pending == {second[0], "PORT0000"}
+        with open(runner._checkpoint_path(1)) as handle:
+            assert json.load(handle)["done"] is True
+            
+    def test_revalues_positions_after_processing(self, file_db_engine, seeded, tmp_path):
+        """Test a price file marks the processed positions to market once every partition is done"""
+        prices = tmp_path / "prices.csv"
+        prices.write_text("investment_id,price\nAAPL000001,150.00\n")
+        
+        stats = make_runner(file_db_engine, tmp_path, workers=1, partitions=2, price_file=str(prices)).run()
+        
+        assert stats["revaluation"]["positions_updated"] == 12
+        assert stats["revaluation"]["portfolios_updated"] == 12
+        seeded.expire_all()
+        assert {p.market_value for p in seeded.query(Position)} == {Decimal("900.00")}
+        
+    def test_revaluation_is_optional(self, file_db_engine, seeded, tmp_path):
+        """Test a run without a price file skips revaluation"""
+        stats = make_runner(file_db_engine, tmp_path, workers=1).run()
+        
+        assert stats["revaluation"] is None
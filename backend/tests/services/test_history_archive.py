@@ -0,0 +1,143 @@
+import asyncio
+import os
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy.orm import sessionmaker
+from models import History
+from services import AsyncPortfolioService, PortfolioService
+from services.history_archive import HistoryArchive, Segment
+from tests.factories import make_portfolio
+
+START = datetime(2024, 2, 1, 9, 0)
+
+
+def audit_rows(port_id, count):
+    return [History.build_audit_values(port_id, "TR" if index % 2 else "PS", "A", after_data={"n": index},
+                                       now=START + timedelta(minutes=index))
+            for index in range(count)]
+
+
+@pytest.fixture
+def audit_trail(db_session):
+    """Twenty audit rows for PORT0001 and five for PORT0002, one minute apart"""
+    db_session.add(make_portfolio("PORT0001", "1234567890"))
+    db_session.add(make_portfolio("PORT0002", "2234567890"))
+    db_session.commit()
+    db_session.execute(History.bulk_insert(), audit_rows("PORT0001", 20) + audit_rows("PORT0002", 5))
+    db_session.commit()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = HistoryArchive(str(tmp_path), block_rows=4, segment_rows=8)
+    yield archive
+    archive.close()
+
+
+def all_pages(service, port_id, limit, **filters):
+    records, cursor = service.list_history(port_id, limit=limit, **filters)
+    while cursor:
+        page, cursor = service.list_history(port_id, limit=limit, cursor=cursor, **filters)
+        records += page
+    return [record["after_data"]["n"] for record in records]
+
+
+class TestHistoryArchive:
+    """Test moving old audit rows into segment files"""
+    
+    def test_moves_rows_before_the_cutoff(self, audit_trail, archive, db_session):
+        """Test old rows leave the table in full segments and recent rows stay"""
+        stats = archive.archive(db_session, START + timedelta(minutes=12), batch_size=3)
+        
+        assert stats == {"segments": 3, "rows": 17}
+        assert [segment.rows for segment in archive.segments()] == [8, 8, 1]
+        assert db_session.query(History).filter_by(portfolio_id="PORT0001").count() == 8
+        assert db_session.query(History).filter_by(portfolio_id="PORT0002").count() == 0
+        assert not [name for name in os.listdir(archive.directory) if name.endswith(".tmp")]
+        assert archive.archive(db_session, START + timedelta(minutes=12)) == {"segments": 0, "rows": 0}
+        
+    def test_sparse_index_points_at_blocks(self, audit_trail, archive, db_session):
+        """Test every block is indexed by its first (portfolio_id, process_date)"""
+        archive.archive(db_session, START + timedelta(minutes=12))
+        segment = archive.segments()[0]
+        
+        assert [block[:2] for block in segment.blocks] == [
+            ["PORT0001", "2024-02-01T09:00:00.000000"], ["PORT0001", "2024-02-01T09:04:00.000000"]
+        ]
+        assert [row[10] for row in segment.scan("PORT0001", "2024-02-01T09:05:00.000000")] == [
+            "2024-02-01T09:05:00.000000", "2024-02-01T09:06:00.000000", "2024-02-01T09:07:00.000000"
+        ]
+        assert list(segment.scan("PORT0002")) == []
+        
+    def test_rejects_truncated_segments(self, audit_trail, archive, db_session):
+        """Test a damaged file is refused instead of misread"""
+        archive.archive(db_session, START + timedelta(minutes=12))
+        path = archive.segments()[0].path
+        archive.close()
+        with open(path, "r+b") as file:
+            file.truncate(os.path.getsize(path) - 4)
+            
+        with pytest.raises(ValueError):
+            Segment(path)
+
+
+class TestArchivedHistoryReads:
+    """Test the audit history API merges archived and live rows"""
+    
+    def test_pages_across_archive_and_table(self, audit_trail, archive, db_session):
+        """Test keyset pages are unchanged by archiving"""
+        service = PortfolioService(db_session, cache=None, archive=archive)
+        before = all_pages(service, "PORT0001", 3)
+        archive.archive(db_session, START + timedelta(minutes=12))
+        
+        assert before == list(range(20))
+        assert all_pages(service, "PORT0001", 3) == before
+        assert all_pages(service, "PORT0002", 2) == list(range(5))
+        
+    def test_filters_apply_to_archived_rows(self, audit_trail, archive, db_session):
+        """Test time range and record type filters cover both sources"""
+        archive.archive(db_session, START + timedelta(minutes=12))
+        service = PortfolioService(db_session, cache=None, archive=archive)
+        
+        assert all_pages(service, "PORT0001", 2, from_time=START + timedelta(minutes=9),
+                         to_time=START + timedelta(minutes=14), record_type="TR") == [9, 11, 13]
+        assert all_pages(service, "PORT0001", 5, action_code="D") == []
+        
+    def test_live_copy_wins_over_archived_copy(self, audit_trail, archive, db_session):
+        """Test rows left behind by an interrupted archive run are listed once"""
+        archive.archive(db_session, START + timedelta(minutes=12))
+        db_session.execute(History.bulk_insert(), archive.query("PORT0002", limit=2))
+        db_session.commit()
+        service = PortfolioService(db_session, cache=None, archive=archive)
+        
+        assert all_pages(service, "PORT0002", 2) == list(range(5))
+        
+    def test_rows_archived_twice_are_listed_once(self, audit_trail, archive, db_session):
+        """Test a rerun after a crash between writing a segment and deleting its rows does not duplicate them"""
+        archive.archive(db_session, START + timedelta(minutes=12))
+        db_session.execute(History.bulk_insert(), archive.query("PORT0002"))
+        db_session.commit()
+        archive.archive(db_session, START + timedelta(minutes=12))
+        service = PortfolioService(db_session, cache=None, archive=archive)
+        
+        assert db_session.query(History).filter_by(portfolio_id="PORT0002").count() == 0
+        assert len(archive.query("PORT0002")) == 5
+        assert all_pages(service, "PORT0002", 2) == list(range(5))
+        
+    def test_async_service_merges_archive(self, file_db_engine, async_session_factory, archive):
+        """Test the async read path sees archived rows"""
+        db = sessionmaker(bind=file_db_engine)()
+        db.add(make_portfolio("PORT0001", "1234567890"))
+        db.commit()
+        db.execute(History.bulk_insert(), audit_rows("PORT0001", 6))
+        db.commit()
+        archive.archive(db, START + timedelta(minutes=3))
+        db.close()
+        
+        async def main():
+            async with async_session_factory() as session:
+                return await AsyncPortfolioService(session, cache=None, archive=archive).list_history("PORT0001")
+        records, cursor = asyncio.run(main())
+        
+        assert [record["after_data"]["n"] for record in records] == list(range(6))
+        assert cursor is None
@@ -0,0 +1,205 @@
+import pytest
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from models import IdempotencyKey, Position, Transaction, query_budget
+from services.cache import TTLCache
+from services.idempotency import BloomFilter, IdempotencyFilter
+from services.ingestion import TransactionIngestService, request_hash
+from tests.factories import make_portfolio
+
+
+def submission(key, seq, type_="BU", portfolio_id="PORT0001", quantity=Decimal("10"), price=Decimal("100")):
+    return {
+        "idempotency_key": key,
+        "date": date(2024, 2, 1),
+        "time": time(9, 30),
+        "portfolio_id": portfolio_id,
+        "sequence_no": f"{seq:06d}",
+        "investment_id": "AAPL000001",
+        "type": type_,
+        "quantity": quantity,
+        "price": price,
+        "amount": None,
+        "currency": "USD",
+        "process_user": None
+    }
+
+
+@pytest.fixture
+def idempotency():
+    return IdempotencyFilter(capacity=1000, error_rate=0.01, recent=TTLCache(max_entries=100, ttl=60))
+
+
+@pytest.fixture
+def ingest(db_session, idempotency):
+    db_session.add(make_portfolio())
+    db_session.commit()
+    return TransactionIngestService(db_session, idempotency)
+
+
+class TestBloomFilter:
+    """Test the Bloom filter used to screen idempotency keys"""
+    
+    def test_has_no_false_negatives(self):
+        """Test every added key is reported as present"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        keys = [f"key-{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+        
+    def test_false_positive_rate_is_near_target(self):
+        """Test unseen keys are rarely reported as present at capacity"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"key-{i}")
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+        
+    def test_clear_forgets_keys(self):
+        """Test clearing empties the filter"""
+        bloom = BloomFilter(capacity=10)
+        bloom.add("a")
+        bloom.clear()
+        assert "a" not in bloom
+
+
+class TestTransactionIngest:
+    """Test exactly-once transaction ingestion"""
+    
+    def test_new_submissions_are_stored_and_processed(self, ingest, db_session):
+        """Test accepted transactions reach the portfolio and record their keys"""
+        results = ingest.submit([submission("k1", 1), submission("k2", 2)])
+        
+        assert [r["status"] for r in results] == ["processed", "processed"]
+        assert not any(r["replayed"] for r in results)
+        assert db_session.query(Position).one().quantity == Decimal("20.0000")
+        assert {t.status for t in db_session.query(Transaction)} == {"D"}
+        assert {t.process_user for t in db_session.query(Transaction)} == {"API"}
+        assert {k.status for k in db_session.query(IdempotencyKey)} == {"processed"}
+        
+    def test_resubmission_replays_original_result(self, ingest, db_session):
+        """Test a repeated key returns the stored result without reprocessing"""
+        first = ingest.submit([submission("k1", 1)])[0]
+        again = ingest.submit([submission("k1", 1)])[0]
+        
+        assert again["replayed"] is True
+        assert again["status"] == first["status"] == "processed"
+        assert again["transaction"] == first["transaction"]
+        assert db_session.query(Transaction).count() == 1
+        assert db_session.query(Position).one().quantity == Decimal("10.0000")
+        
+    def test_replay_after_restart_uses_unique_index(self, ingest, db_session, idempotency):
+        """Test a process without the in-memory state still replays from the table"""
+        ingest.submit([submission("k1", 1)])
+        idempotency.reset()
+        
+        again = ingest.submit([submission("k1", 1)])[0]
+        
+        assert again["replayed"] is True
+        assert again["status"] == "processed"
+        assert db_session.query(Transaction).count() == 1
+        
+    def test_key_claimed_elsewhere_is_replayed(self, ingest, db_session, idempotency):
+        """Test a key the filter has not seen still resolves through the unique index"""
+        ingest.submit([submission("k1", 1)])
+        # Simulate another process: the key exists but this filter never saw it
+        idempotency.reset()
+        idempotency._loaded = True
+        
+        results = ingest.submit([submission("k1", 1), submission("k2", 2)])
+        
+        assert results[0]["replayed"] is True
+        assert results[1]["status"] == "processed"
+        assert db_session.query(Transaction).count() == 2
+        
+    def test_reused_key_with_different_payload_conflicts(self, ingest, db_session):
+        """Test a key reused for another transaction is refused"""
+        ingest.submit([submission("k1", 1)])
+        result = ingest.submit([submission("k1", 2)])[0]
+        
+        assert result["status"] == "conflict"
+        assert result["replayed"] is False
+        assert db_session.query(Transaction).count() == 1
+        
+    def test_duplicate_keys_within_one_request(self, ingest, db_session):
+        """Test a key repeated in the same request is processed once"""
+        results = ingest.submit([submission("k1", 1), submission("k1", 1), submission("k1", 3)])
+        
+        assert results[0]["status"] == "processed"
+        assert results[1]["replayed"] is True
+        assert results[2]["status"] == "conflict"
+        assert db_session.query(Transaction).count() == 1
+        
+    def test_invalid_submissions_are_rejected_and_remembered(self, ingest, db_session):
+        """Test validation failures are reported, stored and replayed"""
+        results = ingest.submit([submission("k1", 1, quantity=Decimal("0")),
+                                 submission("k2", 2, portfolio_id="MISSING1")])
+                                 
+        assert [r["status"] for r in results] == ["rejected", "rejected"]
+        assert "Positive quantity required for buy/sell transactions" in results[0]["errors"]
+        assert results[1]["errors"] == ["Portfolio not found"]
+        assert db_session.query(Transaction).count() == 0
+        assert ingest.submit([submission("k1", 1, quantity=Decimal("0"))])[0]["replayed"] is True
+        
+    def test_existing_transaction_under_new_key_is_rejected(self, ingest, db_session):
+        """Test a transaction already stored under another key is not applied twice"""
+        ingest.submit([submission("k1", 1)])
+        results = ingest.submit([submission("k2", 1), submission("k3", 2)])
+        
+        assert results[0]["status"] == "rejected"
+        assert results[0]["errors"] == ["Transaction already exists"]
+        assert results[1]["status"] == "processed"
+        assert db_session.query(Position).one().quantity == Decimal("20.0000")
+        
+    def _abandon(self, db_session, key, seq, status, age):
+        """Leave ``key`` pending as a request that died after its claim commit would"""
+        claimed_at = datetime.now() - age
+        db_session.add(IdempotencyKey(key=key, request_hash=request_hash(submission(key, seq)), status="pending",
+                                      created_at=claimed_at, claimed_at=claimed_at))
+        db_session.add(Transaction(date=date(2024, 2, 1), time=time(9, 30), portfolio_id="PORT0001",
+                                   sequence_no=f"{seq:06d}", investment_id="AAPL000001", type="BU",
+                                   quantity=Decimal("10"), price=Decimal("100"), amount=Decimal("1000"),
+                                   currency="USD", status=status, process_user="API"))
+        db_session.commit()
+        
+    def test_stale_pending_claim_is_taken_over(self, ingest, db_session):
+        """Test a resubmission finishes the transaction of a request that died while pending"""
+        self._abandon(db_session, "k1", 1, "P", timedelta(hours=1))
+        
+        result = ingest.submit([submission("k1", 1)])[0]
+        
+        assert result["status"] == "processed"
+        assert result["replayed"] is False
+        assert db_session.query(Transaction).one().status == "D"
+        assert db_session.query(Position).one().quantity == Decimal("10.0000")
+        assert db_session.query(IdempotencyKey).one().status == "processed"
+        assert ingest.submit([submission("k1", 1)])[0]["replayed"] is True
+        
+    def test_recent_pending_claim_is_not_taken_over(self, ingest, db_session):
+        """Test a key claimed moments ago is reported pending and left to its owner"""
+        self._abandon(db_session, "k1", 1, "P", timedelta(seconds=1))
+        
+        result = ingest.submit([submission("k1", 1)])[0]
+        
+        assert result["status"] == "pending"
+        assert db_session.query(Transaction).one().status == "P"
+        assert db_session.query(Position).count() == 0
+        
+    def test_stale_claim_of_processed_transaction_only_records_result(self, ingest, db_session):
+        """Test a transaction processed before the crash is not applied again"""
+        self._abandon(db_session, "k1", 1, "D", timedelta(hours=1))
+        
+        result = ingest.submit([submission("k1", 1)])[0]
+        
+        assert result["status"] == "processed"
+        assert db_session.query(Position).count() == 0
+        assert db_session.query(IdempotencyKey).one().status == "processed"
+        
+    def test_statement_count_does_not_grow_with_size(self, ingest, db_engine, idempotency, db_session):
+        """Test key screening needs no per-row lookups"""
+        idempotency.ensure_loaded(db_session)
+        submissions = [submission(f"k{i}", i) for i in range(1, 51)]
+        with query_budget(db_engine, 14):
+            results = ingest.submit(submissions)
+        assert {r["status"] for r in results} == {"processed"}
@@ -0,0 +1,82 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from models import Portfolio, Position
+from services.cache import TTLCache
+from services.mark_to_market import MarkToMarketJob, read_price_file
+from tests.factories import make_portfolio
+
+
+def add_position(db_session, portfolio_id, investment_id, quantity, market_value="0.00", status="A"):
+    db_session.add(Position(portfolio_id=portfolio_id, date=date(2024, 3, 1), investment_id=investment_id,
+                            quantity=Decimal(quantity), cost_basis=Decimal("100.00"),
+                            market_value=Decimal(market_value), currency="USD", status=status))
+
+
+@pytest.fixture
+def seeded(db_session):
+    db_session.add(make_portfolio("PORT0001", cash=Decimal("50.00")))
+    db_session.add(make_portfolio("PORT0002", account_no="2222222222", cash=Decimal("0.00")))
+    db_session.add(make_portfolio("PORT0003", account_no="3333333333", cash=Decimal("10.00")))
+    add_position(db_session, "PORT0001", "AAPL000001", "10.0000")
+    add_position(db_session, "PORT0001", "MSFT000001", "2.5000")
+    add_position(db_session, "PORT0002", "AAPL000001", "1.0000")
+    add_position(db_session, "PORT0002", "MSFT000001", "4.0000", market_value="999.00", status="C")
+    add_position(db_session, "PORT0003", "IBM0000001", "3.0000", market_value="300.00")
+    db_session.commit()
+
+
+def write_prices(tmp_path, lines):
+    path = tmp_path / "prices.csv"
+    path.write_text("investment_id,price\n" + "\n".join(lines) + "\n")
+    return str(path)
+
+
+class TestMarkToMarket:
+    """Test the set-based mark-to-market job"""
+    
+    def test_revalues_active_positions_and_totals(self, db_engine, db_session, seeded, tmp_path):
+        """Test market values, touched portfolio totals and counts"""
+        path = write_prices(tmp_path, ["AAPL000001,185.2500", "MSFT000001,410.10"])
+        stats = MarkToMarketJob(db_engine, chunk_size=1, cache=None).run(path)
+        
+        assert stats["prices"] == 2
+        assert stats["positions_updated"] == 3
+        assert stats["portfolios_updated"] == 2
+        assert stats["rows_per_second"] > 0
+        
+        db_session.expire_all()
+        values = {(p.portfolio_id, p.investment_id): p.market_value for p in db_session.query(Position)}
+        assert values[("PORT0001", "AAPL000001")] == Decimal("1852.50")
+        assert values[("PORT0001", "MSFT000001")] == Decimal("1025.25")
+        assert values[("PORT0002", "AAPL000001")] == Decimal("185.25")
+        assert values[("PORT0002", "MSFT000001")] == Decimal("999.00")
+        
+        totals = {p.port_id: p.total_value for p in db_session.query(Portfolio)}
+        assert totals["PORT0001"] == Decimal("2927.75")
+        assert totals["PORT0002"] == Decimal("185.25")
+        assert totals["PORT0003"] is None
+        
+    def test_last_price_in_chunk_wins_and_bad_rows_skipped(self, db_engine, db_session, seeded, tmp_path):
+        """Test duplicate ids keep the last price and invalid rows are dropped"""
+        path = write_prices(tmp_path, ["IBM0000001,1", "IBM0000001,2", "IBM0000001,-5", ",3", "MSFT000001,abc"])
+        stats = MarkToMarketJob(db_engine, cache=None).run(path)
+        
+        assert stats["prices"] == 1
+        db_session.expire_all()
+        assert db_session.get(Position, ("PORT0003", date(2024, 3, 1), "IBM0000001")).market_value == Decimal("6.00")
+        assert db_session.query(Portfolio).filter_by(port_id="PORT0003").one().total_value == Decimal("16.00")
+        
+    def test_clears_portfolio_cache(self, db_engine, seeded, tmp_path):
+        """Test cached summaries are dropped after totals change"""
+        cache = TTLCache()
+        cache.set("1234567890", "stale")
+        MarkToMarketJob(db_engine, cache=cache).run(write_prices(tmp_path, ["AAPL000001,1"]))
+        assert cache.get("1234567890") is None
+        
+    def test_read_price_file_chunks(self, tmp_path):
+        """Test the reader streams fixed size chunks"""
+        path = write_prices(tmp_path, [f"INV{index:07d},{index + 1}" for index in range(5)])
+        chunks = list(read_price_file(path, chunk_size=2))
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        assert chunks[0][0] == ("INV0000000", Decimal("1.0000"))
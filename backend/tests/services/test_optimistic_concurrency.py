@@ -0,0 +1,198 @@
+import threading
+import pytest
+from decimal import Decimal
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+from models import Base, Portfolio, Position, Transaction, create_db_engine
+from services import PortfolioService
+from services.locking import ConflictStats, retry_on_conflict, write_conflicts
+from tests.factories import make_portfolio, make_transaction
+
+PORTFOLIO_KEY = ("PORT0001", "1234567890")
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sessions over a WAL SQLite file, so one session can commit while another is reading"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'versions.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as db:
+        db.add(make_portfolio(*PORTFOLIO_KEY, cash=Decimal("1000.00")))
+        db.commit()
+    yield factory
+    engine.dispose()
+
+
+def fee(seq, amount="10.00"):
+    return make_transaction(seq, "FE", investment_id=None, quantity=None, price=None, amount=Decimal(amount))
+
+
+def charge_elsewhere(session_factory, amount="100.00"):
+    """Take cash from the portfolio in another session, as a concurrent worker would"""
+    with session_factory() as other:
+        portfolio = other.get(Portfolio, PORTFOLIO_KEY)
+        portfolio.cash_balance -= Decimal(amount)
+        other.commit()
+
+
+def cash(session_factory) -> Decimal:
+    with session_factory() as db:
+        return db.get(Portfolio, PORTFOLIO_KEY).cash_balance
+
+
+class TestRowVersions:
+    """Test the version columns on Portfolio and Position"""
+    
+    def test_updates_bump_the_version(self, session_factory):
+        """Test a new row starts at version 1 and each update adds one"""
+        with session_factory() as db:
+            db.add(Position(portfolio_id="PORT0001", date=fee(1).date, investment_id="AAPL000001",
+                            quantity=Decimal("1"), status="A"))
+            db.commit()
+            position = db.query(Position).one()
+            portfolio = db.get(Portfolio, PORTFOLIO_KEY)
+            assert (portfolio.version, position.version) == (1, 1)
+            
+            portfolio.cash_balance -= Decimal("1.00")
+            position.quantity += 1
+            db.commit()
+            
+            assert (portfolio.version, position.version) == (2, 2)
+            
+    def test_stale_write_is_rejected(self, session_factory):
+        """Test an update based on a read another session has since changed fails instead of overwriting"""
+        with session_factory() as db:
+            portfolio = db.get(Portfolio, PORTFOLIO_KEY)
+            charge_elsewhere(session_factory)
+            portfolio.cash_balance -= Decimal("50.00")
+            
+            with pytest.raises(StaleDataError):
+                db.commit()
+                
+        assert cash(session_factory) == Decimal("900.00")
+
+
+class TestRetryOnConflict:
+    """Test the retry wrapper and its conflict counts"""
+    
+    def test_conflicts_are_retried_and_counted(self):
+        """Test a conflicting attempt is reset and retried, and the rate reflects it"""
+        stats = ConflictStats()
+        outcomes = [StaleDataError("stale"), "done"]
+        resets = []
+        
+        def operation():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+            
+        assert retry_on_conflict(operation, lambda: resets.append(1), retries=2, stats=stats) == "done"
+        assert resets == [1]
+        assert stats.stats() == {"attempts": 2, "conflicts": 1, "retries_exhausted": 0, "conflict_rate": 0.5}
+        
+    def test_other_errors_are_not_retried(self):
+        """Test an ordinary failure is raised at once"""
+        stats = ConflictStats()
+        
+        def operation():
+            raise ValueError("bad")
+            
+        with pytest.raises(ValueError):
+            retry_on_conflict(operation, lambda: None, retries=3, stats=stats)
+        assert stats.stats()["attempts"] == 1
+        assert stats.stats()["conflicts"] == 0
+
+
+class TestServiceRetries:
+    """Test PortfolioService writes retry instead of losing concurrent updates"""
+    
+    def test_transaction_keeps_the_concurrent_update(self, session_factory):
+        """Test a fee racing another writer is retried on fresh data, so neither change is lost"""
+        before = write_conflicts.stats()
+        with session_factory() as db:
+            transaction = fee(1, "50.00")
+            db.add(transaction)
+            db.commit()
+            raced = []
+            
+            @event.listens_for(db, "before_flush")
+            def race(session, flush_context, instances):
+                if not raced:
+                    raced.append(True)
+                    charge_elsewhere(session_factory)
+                    
+            result = PortfolioService(db, cache=None).process_transaction(transaction)
+            
+            assert result["success"], result
+            assert db.get(Transaction, (transaction.date, transaction.time, "PORT0001", "000001")).status == "D"
+            
+        after = write_conflicts.stats()
+        assert cash(session_factory) == Decimal("850.00")
+        assert after["conflicts"] - before["conflicts"] == 1
+        assert after["attempts"] - before["attempts"] == 2
+        
+    def test_transaction_fails_after_retries_run_out(self, session_factory):
+        """Test a transaction that conflicts on every attempt fails with nothing applied"""
+        before = write_conflicts.stats()
+        with session_factory() as db:
+            transaction = fee(1, "50.00")
+            
+            @event.listens_for(db, "before_flush")
+            def race(session, flush_context, instances):
+                charge_elsewhere(session_factory, "1.00")
+                
+            result = PortfolioService(db, cache=None, write_retries=2).process_transaction(transaction)
+            
+            assert not result["success"]
+            assert transaction.status == "F"
+            
+        after = write_conflicts.stats()
+        assert cash(session_factory) == Decimal("997.00")
+        assert after["attempts"] - before["attempts"] == 3
+        assert after["retries_exhausted"] - before["retries_exhausted"] == 1
+        
+    def test_batch_chunk_is_retried(self, session_factory):
+        """Test a chunk whose commit loses a race is rerun as a whole"""
+        with session_factory() as db:
+            transactions = [fee(seq) for seq in range(1, 6)]
+            db.add_all(transactions)
+            db.commit()
+            db.expire_all()
+            raced = []
+            
+            @event.listens_for(db, "loaded_as_persistent")
+            def race(session, instance):
+                if isinstance(instance, Portfolio) and not raced:
+                    raced.append(True)
+                    charge_elsewhere(session_factory)
+                    
+            result = PortfolioService(db, cache=None).process_batch(transactions)
+            
+            assert raced
+            assert result == {"success": True, "processed": 5, "failed": 0, "errors": []}
+            assert {t.status for t in transactions} == {"D"}
+            
+        assert cash(session_factory) == Decimal("850.00")
+        
+    def test_concurrent_writers_lose_no_updates(self, session_factory):
+        """Test fees from several threads on one portfolio all land exactly once"""
+        succeeded = []
+        
+        def worker(thread_no):
+            with session_factory() as db:
+                service = PortfolioService(db, cache=None, write_retries=50)
+                for seq in range(25):
+                    if service.process_transaction(fee(thread_no * 1000 + seq, "1.00"))["success"]:
+                        succeeded.append(1)
+                        
+        threads = [threading.Thread(target=worker, args=(thread_no,)) for thread_no in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+            
+        assert succeeded
+        assert cash(session_factory) == Decimal("1000.00") - len(succeeded)
@@ -0,0 +1,204 @@
+import pytest
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import text
+from models import Portfolio, Position, History, query_budget
+from services import PortfolioService
+from services.portfolio_service import history_statement
+from tests.factories import make_portfolio, make_transaction
+
+
+class TestProcessBatch:
+    """Test chunked batch transaction processing"""
+    
+    def test_batch_applies_buys_sells_and_fees(self, db_session):
+        """Test batch effects match the per-transaction rules"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        
+        transactions = [
+            make_transaction(1, "BU"),
+            make_transaction(2, "BU", quantity=Decimal("10.0000"), price=Decimal("120.0000")),
+            make_transaction(3, "SL", quantity=Decimal("5.0000"), price=Decimal("130.0000")),
+            make_transaction(4, "FE", investment_id=None, quantity=None, price=None, amount=Decimal("25.00")),
+        ]
+        db_session.add_all(transactions)
+        
+        result = PortfolioService(db_session).process_batch(transactions, chunk_size=2)
+        
+        assert result["success"] is True
+        assert result["processed"] == 4
+        assert result["failed"] == 0
+        
+        position = db_session.query(Position).one()
+        assert position.quantity == Decimal("15.0000")
+        assert position.cost_basis == Decimal("1650.00")
+        
+        portfolio = db_session.query(Portfolio).one()
+        assert portfolio.cash_balance == Decimal("9975.00")
+        assert all(t.status == "D" for t in transactions)
+        
+    def test_batch_writes_audit_rows(self, db_session):
+        """Test every transaction produces its audit rows with unique keys"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        
+        transactions = [make_transaction(i, "BU") for i in range(1, 6)]
+        PortfolioService(db_session).process_batch(transactions)
+        
+        records = db_session.query(History).all()
+        assert len(records) == 10
+        assert {r.record_type for r in records} == {"TR", "PS"}
+        assert len({(r.portfolio_id, r.date, r.time, r.seq_no) for r in records}) == 10
+        
+    def test_batch_statement_count_does_not_grow_with_size(self, db_engine, db_session):
+        """Test a chunk runs a fixed number of statements however many transactions it holds"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        
+        transactions = [make_transaction(i, "BU", investment_id=f"AAPL{i % 3:06d}") for i in range(1, 51)]
+        with query_budget(db_engine, 8):
+            PortfolioService(db_session, cache=None).process_batch(transactions)
+            
+    def test_failing_transaction_is_isolated(self, db_session):
+        """Test one bad transaction does not roll back the rest of its chunk"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        
+        bad = make_transaction(2, "BU")
+        bad.amount = None
+        transactions = [make_transaction(1, "BU"), bad, make_transaction(3, "BU")]
+        
+        result = PortfolioService(db_session).process_batch(transactions)
+        
+        assert result["success"] is False
+        assert result["processed"] == 2
+        assert result["failed"] == 1
+        assert result["errors"][0]["index"] == 1
+        assert bad.status == "F"
+        
+        position = db_session.query(Position).one()
+        assert position.quantity == Decimal("20.0000")
+        assert position.cost_basis == Decimal("2000.00")
+        
+    def test_invalid_transaction_reported(self, db_session):
+        """Test validation errors are returned per row"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        
+        invalid = make_transaction(1, "BU", quantity=Decimal("0"))
+        result = PortfolioService(db_session).process_batch([invalid])
+        
+        assert result["failed"] == 1
+        assert "Positive quantity required for buy/sell transactions" in result["errors"][0]["errors"]
+        
+    def test_invalid_chunk_size(self, db_session):
+        """Test chunk_size must be positive"""
+        with pytest.raises(ValueError):
+            PortfolioService(db_session).process_batch([], chunk_size=0)
+
+
+class TestTotalValue:
+    """Test incrementally maintained portfolio totals"""
+    
+    def test_fee_adjusts_total_without_rescan(self, db_session):
+        """Test a fee moves total_value by the fee amount"""
+        portfolio = make_portfolio()
+        portfolio.total_value = Decimal("10000.00")
+        db_session.add(portfolio)
+        db_session.commit()
+        
+        fee = make_transaction(1, "FE", investment_id=None, quantity=None, price=None, amount=Decimal("40.00"))
+        assert PortfolioService(db_session).process_transaction(fee)["success"] is True
+        
+        assert db_session.query(Portfolio).one().total_value == Decimal("9960.00")
+    
+    def test_missing_total_falls_back_to_full_calculation(self, db_session):
+        """Test a portfolio without a stored total is recomputed"""
+        db_session.add(make_portfolio())
+        db_session.commit()
+        
+        PortfolioService(db_session).process_batch([make_transaction(1, "BU")])
+        
+        assert db_session.query(Portfolio).one().total_value == Decimal("10000.00")
+    
+    def test_reconcile_reports_and_fixes_drift(self, db_session):
+        """Test the full recompute flags totals that drifted"""
+        portfolio = make_portfolio()
+        portfolio.total_value = Decimal("10500.00")
+        db_session.add(portfolio)
+        db_session.add(Position(portfolio_id="PORT0001", date=date(2024, 2, 1), investment_id="AAPL000001",
+                                quantity=Decimal("10"), cost_basis=Decimal("900.00"),
+                                market_value=Decimal("1000.00"), currency="USD", status="A"))
+        db_session.add(Position(portfolio_id="PORT0001", date=date(2024, 2, 1), investment_id="MSFT000001",
+                                quantity=Decimal("5"), cost_basis=Decimal("400.00"),
+                                market_value=Decimal("450.00"), currency="USD", status="C"))
+        db_session.commit()
+        
+        service = PortfolioService(db_session)
+        drifted = service.reconcile_total_values()
+        assert len(drifted) == 1
+        assert drifted[0]["expected"] == Decimal("11000.00")
+        assert drifted[0]["drift"] == Decimal("-500.00")
+        
+        service.reconcile_total_values(fix=True)
+        assert service.reconcile_total_values() == []
+        assert db_session.query(Portfolio).one().total_value == Decimal("11000.00")
+
+
+@pytest.fixture
+def audit_trail(db_session):
+    """Six audit rows for PORT0001, one minute apart, plus one for another portfolio"""
+    db_session.add(make_portfolio("PORT0001", "1234567890"))
+    db_session.add(make_portfolio("PORT0002", "2234567890"))
+    db_session.commit()
+    start = datetime(2024, 2, 1, 9, 0)
+    rows = [History.build_audit_values("PORT0001", record_type, action_code, after_data={"n": index},
+                                       now=start + timedelta(minutes=index))
+            for index, (record_type, action_code) in enumerate([("TR", "A"), ("PS", "C"), ("TR", "A"),
+                                                                 ("PS", "C"), ("PT", "C"), ("PS", "D")])]
+    rows.append(History.build_audit_values("PORT0002", "TR", "A", now=start))
+    db_session.execute(History.bulk_insert(), rows)
+    db_session.commit()
+    return start
+
+
+class TestListHistory:
+    """Test keyset-paginated audit trail queries"""
+    
+    def test_pages_through_in_process_date_order(self, audit_trail, db_session):
+        """Test pages follow each other without gaps or repeats"""
+        service = PortfolioService(db_session, cache=None)
+        first, cursor = service.list_history("PORT0001", limit=4)
+        second, last_cursor = service.list_history("PORT0001", limit=4, cursor=cursor)
+        
+        assert [r["after_data"]["n"] for r in first + second] == list(range(6))
+        assert last_cursor is None
+        
+    def test_filters(self, audit_trail, db_session):
+        """Test time range, record type and action code filters combine"""
+        service = PortfolioService(db_session, cache=None)
+        records, _ = service.list_history("PORT0001", from_time=audit_trail + timedelta(minutes=1),
+                                          to_time=audit_trail + timedelta(minutes=4), record_type="PS")
+        assert [r["after_data"]["n"] for r in records] == [1, 3]
+        
+        records, _ = service.list_history("PORT0001", action_code="D")
+        assert [r["after_data"]["n"] for r in records] == [5]
+        
+    def test_rejects_bad_filters_and_cursors(self, db_session):
+        """Test malformed input raises ValueError"""
+        service = PortfolioService(db_session, cache=None)
+        with pytest.raises(ValueError):
+            service.list_history("PORT0001", record_type="XX")
+        with pytest.raises(ValueError):
+            service.list_history("PORT0001", action_code="X")
+        with pytest.raises(ValueError):
+            service.list_history("PORT0001", cursor="not-a-cursor")
+            
+    def test_range_query_uses_composite_index(self, db_engine):
+        """Test SQLite plans the range scan on the (portfolio_id, process_date) index"""
+        statement = history_statement("PORT0001", from_time=datetime(2024, 1, 1), to_time=datetime(2024, 2, 1))
+        compiled = statement.compile(db_engine, compile_kwargs={"literal_binds": True})
+        with db_engine.connect() as conn:
+            plan = " ".join(str(row) for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+        assert "idx_history_portfolio_process_date" in plan
@@ -0,0 +1,175 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from models import History, Portfolio, PortfolioSnapshot, Position, query_budget
+from services import PortfolioService
+from services.replay import PortfolioState, ReplayEngine
+from tests.factories import make_portfolio, make_transaction
+
+
+@pytest.fixture
+def processed(db_session):
+    """Two portfolios with buys, a sell and a fee already processed"""
+    db_session.add(make_portfolio("PORT0001", "1234567890"))
+    db_session.add(make_portfolio("PORT0002", "2234567890"))
+    db_session.commit()
+    transactions = [
+        make_transaction(1, "BU"),
+        make_transaction(2, "BU", quantity=Decimal("10.0000"), price=Decimal("120.0000")),
+        make_transaction(3, "SL", quantity=Decimal("5.0000"), price=Decimal("130.0000")),
+        make_transaction(4, "FE", investment_id=None, quantity=None, price=None, amount=Decimal("25.00")),
+        make_transaction(1, "BU", portfolio_id="PORT0002", investment_id="MSFT000001"),
+    ]
+    db_session.add_all(transactions)
+    PortfolioService(db_session, cache=None).process_batch(transactions)
+    return transactions
+
+
+def process(db_session, *transactions):
+    db_session.add_all(transactions)
+    PortfolioService(db_session, cache=None).process_batch(list(transactions))
+
+
+class TestPortfolioState:
+    """Test the serialized replay state"""
+    
+    def test_round_trips_through_snapshot_bytes(self):
+        """Test state survives serialization and drops empty positions"""
+        state = PortfolioState(Decimal("100.50"), {
+            ("AAPL000001", date(2024, 2, 1)): [Decimal("15.0000"), Decimal("1650.00"), "USD"],
+            ("MSFT000001", date(2024, 2, 1)): [Decimal("0.0000"), Decimal("0.00"), "USD"]
+        })
+        snapshot = PortfolioSnapshot(portfolio_id="PORT0001", state=state.to_bytes())
+        
+        restored = PortfolioState.from_snapshot(snapshot)
+        
+        assert restored.cash_balance == Decimal("100.50")
+        assert restored.positions == {("AAPL000001", date(2024, 2, 1)): [Decimal("15.0000"), Decimal("1650.00"), "USD"]}
+
+
+class TestReplayEngine:
+    """Test rebuilding positions and cash from the transaction log"""
+    
+    def test_live_state_matches_replay(self, processed, db_session):
+        """Test a consistent database verifies clean"""
+        assert ReplayEngine(db_session, cache=None).verify() == []
+        
+    def test_verify_reports_drift_without_writing(self, processed, db_session):
+        """Test a tampered position is reported and left alone"""
+        position = db_session.query(Position).filter_by(portfolio_id="PORT0001").one()
+        position.quantity = Decimal("99.0000")
+        db_session.commit()
+        
+        drifted = ReplayEngine(db_session, cache=None).verify()
+        
+        assert [(d["port_id"], d["field"], d["live"], d["replayed"]) for d in drifted] == [
+            ("PORT0001", "quantity", Decimal("99.0000"), Decimal("15.0000"))
+        ]
+        assert position.quantity == Decimal("99.0000")
+        
+    def test_rebuild_after_reversing_a_bad_batch(self, processed, db_session):
+        """Test reversed transactions drop out of the rebuilt positions, with an audit trail"""
+        engine = ReplayEngine(db_session, cache=None)
+        engine.snapshot()
+        bad = make_transaction(5, "BU", quantity=Decimal("1000.0000"))
+        process(db_session, bad)
+        bad.status = "R"
+        db_session.commit()
+        
+        drifted = engine.rebuild()
+        
+        assert {(d["port_id"], d["field"]) for d in drifted} == {("PORT0001", "quantity"), ("PORT0001", "cost_basis")}
+        position = db_session.query(Position).filter_by(portfolio_id="PORT0001").one()
+        assert position.quantity == Decimal("15.0000")
+        assert position.cost_basis == Decimal("1650.00")
+        assert db_session.query(History).filter_by(reason_code="RPLY").count() == 2
+        assert engine.verify() == []
+        
+    def test_cash_is_rebuilt_from_a_snapshot(self, db_session):
+        """Test fees after a snapshot replay onto the snapshot's opening cash"""
+        db_session.add(make_portfolio("PORT0001", "1234567890", cash=Decimal("1000.00")))
+        db_session.commit()
+        engine = ReplayEngine(db_session, cache=None)
+        assert engine.snapshot() == 1
+        
+        process(db_session, make_transaction(1, "FE", investment_id=None, quantity=None, price=None,
+                                             amount=Decimal("40.00")))
+        portfolio = db_session.query(Portfolio).one()
+        portfolio.cash_balance = Decimal("5.00")
+        db_session.commit()
+        
+        drifted = engine.rebuild()
+        
+        assert [(d["field"], d["replayed"]) for d in drifted] == [("cash_balance", Decimal("960.00"))]
+        assert portfolio.cash_balance == Decimal("960.00")
+        assert portfolio.total_value == Decimal("960.00")
+        
+    def test_snapshots_replay_only_the_tail(self, processed, db_session):
+        """Test later snapshots fold in new transactions and replays start after the checkpoint"""
+        engine = ReplayEngine(db_session, cache=None)
+        assert engine.snapshot() == 2
+        assert engine.snapshot() == 0
+        
+        process(db_session, make_transaction(6, "BU", quantity=Decimal("5.0000")))
+        states = engine.replay()
+        assert states["PORT0001"].applied == 1
+        assert states["PORT0002"].applied == 0
+        assert states["PORT0001"].positions[("AAPL000001", date(2024, 2, 1))][0] == Decimal("20.0000")
+        
+        assert engine.snapshot() == 1
+        assert engine.replay()["PORT0001"].applied == 0
+        assert engine.verify() == []
+        
+    def test_late_processed_transaction_behind_the_checkpoint_key_is_replayed(self, processed, db_session):
+        """Test a row processed after the snapshot replays even though its key sorts before the checkpoint"""
+        engine = ReplayEngine(db_session, cache=None)
+        engine.snapshot()
+        late = make_transaction(0, "BU", quantity=Decimal("5.0000"))
+        late.date = date(2024, 1, 1)
+        process(db_session, late)
+        
+        states = engine.replay(["PORT0001"])
+        
+        assert states["PORT0001"].applied == 1
+        assert states["PORT0001"].positions[("AAPL000001", date(2024, 1, 1))][0] == Decimal("5.0000")
+        assert engine.verify() == []
+        
+    def test_rebuild_skips_portfolios_without_a_snapshot(self, processed, db_session):
+        """Test rebuild leaves unbaselined holdings alone instead of replaying them from empty"""
+        position = db_session.query(Position).filter_by(portfolio_id="PORT0002").one()
+        position.quantity = Decimal("99.0000")
+        db_session.commit()
+        engine = ReplayEngine(db_session, cache=None)
+        engine.snapshot(["PORT0001"])
+        
+        assert engine.unbaselined() == ["PORT0002"]
+        assert engine.rebuild() == []
+        assert position.quantity == Decimal("99.0000")
+        
+    def test_snapshot_is_not_affected_by_live_drift(self, processed, db_session):
+        """Test a later snapshot is built from the log, not from drifted live rows"""
+        engine = ReplayEngine(db_session, cache=None)
+        engine.snapshot()
+        process(db_session, make_transaction(6, "BU", quantity=Decimal("5.0000")))
+        db_session.query(Position).filter_by(portfolio_id="PORT0001").one().quantity = Decimal("1.0000")
+        db_session.commit()
+        
+        engine.snapshot()
+        
+        assert [d["replayed"] for d in engine.verify()] == [Decimal("20.0000")]
+        
+    def test_replay_query_count_does_not_grow_with_portfolios(self, db_engine, db_session):
+        """Test replay streams every portfolio's tail with a fixed number of statements"""
+        for index in range(20):
+            port_id = f"PORT{index:04d}"
+            db_session.add(make_portfolio(port_id, f"{index:010d}"))
+            transaction = make_transaction(1, "BU", portfolio_id=port_id)
+            transaction.status = "D"
+            db_session.add(transaction)
+        db_session.commit()
+        engine = ReplayEngine(db_session, cache=None)
+        
+        with query_budget(db_engine, 3):
+            states = engine.replay()
+        assert len(states) == 20
+        assert all(state.applied == 1 for state in states.values())
@@ -0,0 +1,274 @@
+import pytest
+from datetime import date, time
+from decimal import Decimal
+from models import Position, RealizedGain, TaxLot
+from services import PortfolioService
+from services.replay import ReplayEngine
+from services.tax_lots import LotQueue, backfill_lots
+from tests.factories import make_portfolio, make_transaction
+
+
+def lot(seq, quantity, cost, day=1):
+    return TaxLot(portfolio_id="PORT0001", investment_id="AAPL000001", date=date(2024, 1, day), time=time(9, 30),
+                  sequence_no=f"{seq:06d}", quantity=Decimal(quantity), remaining_quantity=Decimal(quantity),
+                  cost_basis=Decimal(cost), currency="USD", status="O")
+
+
+def lot_key(seq, day=1):
+    return date(2024, 1, day), time(9, 30), f"{seq:06d}"
+
+
+class CountedLot:
+    """Lot stand-in that counts reads of its remaining quantity"""
+    reads = 0
+    
+    def __init__(self, seq):
+        self.key = lot_key(seq)
+        self.sequence_no = f"{seq:06d}"
+        self.cost_basis = Decimal("10.00")
+        self.status = "O"
+        self._remaining = Decimal("1")
+        
+    @property
+    def remaining_quantity(self):
+        CountedLot.reads += 1
+        return self._remaining
+        
+    @remaining_quantity.setter
+    def remaining_quantity(self, value):
+        self._remaining = value
+
+
+@pytest.fixture
+def portfolio(db_session):
+    db_session.add(make_portfolio("PORT0001", "1234567890"))
+    db_session.commit()
+
+
+def buys():
+    return [make_transaction(1, "BU", quantity=Decimal("10.0000"), price=Decimal("100.0000")),
+            make_transaction(2, "BU", quantity=Decimal("10.0000"), price=Decimal("120.0000"))]
+
+
+def sell(seq, quantity="15.0000", price="130.0000"):
+    return make_transaction(seq, "SL", quantity=Decimal(quantity), price=Decimal(price))
+
+
+def gains_of(db_session):
+    return [(g.lot_sequence_no, g.quantity, g.proceeds, g.cost_basis, g.gain)
+            for g in db_session.query(RealizedGain).order_by(RealizedGain.lot_sequence_no)]
+
+
+class TestLotQueue:
+    """Test relief order and bookkeeping of the in-memory lot store"""
+    
+    def test_fifo_relieves_oldest_first_with_partial_cost(self):
+        """Test FIFO closes the oldest lot and prorates cost on the next one"""
+        queue = LotQueue([lot(2, "10", "1200.00", day=2), lot(1, "10", "1000.00")])
+        
+        reliefs = queue.relieve(Decimal("13"), "FIFO")
+        
+        assert [(r[0].sequence_no, r[1], r[2]) for r in reliefs] == [
+            ("000001", Decimal("10"), Decimal("1000.00")), ("000002", Decimal("3"), Decimal("360.00"))
+        ]
+        assert [(l.sequence_no, l.remaining_quantity, l.cost_basis) for l in queue.open_lots()] == [
+            ("000002", Decimal("7"), Decimal("840.00"))
+        ]
+        assert queue.open_quantity == Decimal("7")
+        
+    def test_lifo_relieves_newest_first(self):
+        """Test LIFO consumes from the most recent acquisition"""
+        queue = LotQueue([lot(1, "10", "1000.00"), lot(2, "10", "1200.00", day=2)])
+        
+        reliefs = queue.relieve(Decimal("12"), "LIFO")
+        
+        assert [(r[0].sequence_no, r[1]) for r in reliefs] == [("000002", Decimal("10")), ("000001", Decimal("2"))]
+        assert reliefs[0][0].status == "C"
+        
+    def test_specific_id_then_fifo_skips_emptied_lots(self):
+        """Test lots closed by specific ID are passed over by later FIFO sells"""
+        queue = LotQueue([lot(seq, "5", "500.00", day=seq) for seq in range(1, 5)])
+        
+        queue.relieve(Decimal("7"), "SPEC", [(lot_key(1, 1), Decimal("5")), (lot_key(3, 3), Decimal("2"))])
+        reliefs = queue.relieve(Decimal("6"), "FIFO")
+        
+        assert [(r[0].sequence_no, r[1]) for r in reliefs] == [("000002", Decimal("5")), ("000003", Decimal("1"))]
+        assert [l.sequence_no for l in queue.open_lots()] == ["000003", "000004"]
+        assert queue.open_lots()[0].remaining_quantity == Decimal("2")
+        
+    def test_back_dated_buy_is_ordered_by_acquisition(self):
+        """Test a lot acquired before the newest one is relieved in date order"""
+        queue = LotQueue([lot(1, "5", "500.00", day=1), lot(3, "5", "500.00", day=3)])
+        queue.add(lot(2, "5", "600.00", day=2))
+        
+        reliefs = queue.relieve(Decimal("10"), "FIFO")
+        
+        assert [r[0].sequence_no for r in reliefs] == ["000001", "000002"]
+        
+    def test_uncovered_relief_changes_nothing(self):
+        """Test oversells and bad selections raise before any lot is touched"""
+        queue = LotQueue([lot(1, "5", "500.00"), lot(2, "5", "500.00", day=2)])
+        
+        with pytest.raises(ValueError):
+            queue.relieve(Decimal("11"), "FIFO")
+        with pytest.raises(ValueError):
+            queue.relieve(Decimal("5"), "SPEC")
+        with pytest.raises(ValueError):
+            queue.relieve(Decimal("6"), "SPEC", [(lot_key(1), Decimal("5")), (lot_key(9), Decimal("1"))])
+        with pytest.raises(ValueError):
+            queue.relieve(Decimal("6"), "SPEC", [(lot_key(1), Decimal("6"))])
+            
+        assert queue.open_quantity == Decimal("10")
+        assert [l.remaining_quantity for l in queue.open_lots()] == [Decimal("5"), Decimal("5")]
+        
+    def test_relief_only_touches_consumed_lots(self):
+        """Test a FIFO sell against many lots reads only the lots it consumes"""
+        queue = LotQueue([CountedLot(seq) for seq in range(1, 5001)])
+        CountedLot.reads = 0
+        
+        reliefs = queue.relieve(Decimal("3"), "FIFO")
+        
+        assert len(reliefs) == 3
+        assert CountedLot.reads <= 5 * len(reliefs)
+        assert queue.open_quantity == Decimal("4997")
+
+
+class TestLotTracking:
+    """Test PortfolioService with lot tracking enabled"""
+    
+    @pytest.mark.parametrize("method, expected", [
+        ("FIFO", [("000001", Decimal("10.0000"), Decimal("866.67"), Decimal("1000.00"), Decimal("-133.33")),
+                  ("000002", Decimal("5.0000"), Decimal("433.33"), Decimal("600.00"), Decimal("-166.67"))]),
+        ("LIFO", [("000001", Decimal("5.0000"), Decimal("433.33"), Decimal("500.00"), Decimal("-66.67")),
+                  ("000002", Decimal("10.0000"), Decimal("866.67"), Decimal("1200.00"), Decimal("-333.33"))]),
+    ])
+    def test_batch_sell_realizes_gains(self, portfolio, db_session, method, expected):
+        """Test a sell across two lots records one realized gain per lot"""
+        transactions = buys() + [sell(3, price="86.6667")]
+        transactions[2].amount = Decimal("1300.00")
+        db_session.add_all(transactions)
+        
+        results = PortfolioService(db_session, cache=None, lot_method=method).process_batch(transactions)
+        
+        assert results["success"]
+        assert gains_of(db_session) == expected
+        assert sum(g[2] for g in expected) == Decimal("1300.00")
+        
+    def test_process_transaction_returns_gains_and_persists_lots(self, portfolio, db_session):
+        """Test lots survive across service instances and gains come back with the result"""
+        service = PortfolioService(db_session, cache=None, lot_method="FIFO")
+        for transaction in buys():
+            db_session.add(transaction)
+            assert service.process_transaction(transaction)["realized_gains"] == []
+            
+        transaction = sell(3, quantity="5.0000")
+        db_session.add(transaction)
+        result = PortfolioService(db_session, cache=None, lot_method="FIFO").process_transaction(transaction)
+        
+        assert result["success"]
+        assert [(g["lot_sequence_no"], g["gain"]) for g in result["realized_gains"]] == [("000001", 150.0)]
+        open_lots = db_session.query(TaxLot).filter_by(status="O").order_by(TaxLot.sequence_no).all()
+        assert [(l.sequence_no, l.remaining_quantity) for l in open_lots] == [
+            ("000001", Decimal("5.0000")), ("000002", Decimal("10.0000"))
+        ]
+        
+    def test_specific_id_sell(self, portfolio, db_session):
+        """Test a selection picks the lots regardless of the default method"""
+        transactions = buys()
+        db_session.add_all(transactions)
+        service = PortfolioService(db_session, cache=None, lot_method="FIFO")
+        service.process_batch(transactions)
+        transaction = sell(3, quantity="4.0000")
+        db_session.add(transaction)
+        
+        service.process_batch([transaction], lot_selections={
+            (transaction.date, transaction.time, "PORT0001", "000003"): [
+                ((date(2024, 2, 1), time(9, 30), "000002"), Decimal("4.0000"))
+            ]
+        })
+        
+        assert [(g[0], g[4]) for g in gains_of(db_session)] == [("000002", Decimal("40.00"))]
+        assert db_session.query(RealizedGain).one().method == "SPEC"
+        
+    def test_uncovered_sell_fails_without_effects(self, portfolio, db_session):
+        """Test a sell beyond the open lots fails and leaves position and lots alone"""
+        transactions = buys()[:1] + [sell(3)]
+        db_session.add_all(transactions)
+        
+        results = PortfolioService(db_session, cache=None, lot_method="FIFO").process_batch(transactions)
+        
+        assert results["processed"] == 1
+        assert "exceeds open lots" in results["errors"][0]["errors"][0]
+        assert transactions[1].status == "F"
+        assert db_session.query(Position).one().quantity == Decimal("10.0000")
+        assert db_session.query(TaxLot).one().remaining_quantity == Decimal("10.0000")
+        assert db_session.query(RealizedGain).count() == 0
+        
+    @pytest.mark.parametrize("batch", [True, False])
+    def test_position_cost_follows_relieved_lots(self, portfolio, db_session, batch):
+        """Test a sell relieves the position by the cost of its lots, and replay agrees"""
+        transactions = [make_transaction(1, "BU", quantity=Decimal("10.0000"), price=Decimal("100.0000")),
+                        make_transaction(2, "BU", quantity=Decimal("10.0000"), price=Decimal("200.0000")),
+                        sell(3, quantity="10.0000", price="250.0000")]
+        db_session.add_all(transactions)
+        service = PortfolioService(db_session, cache=None, lot_method="FIFO")
+        
+        if batch:
+            assert service.process_batch(transactions)["success"]
+        else:
+            assert all(service.process_transaction(transaction)["success"] for transaction in transactions)
+            
+        position = db_session.query(Position).one()
+        open_cost = sum(lot.cost_basis for lot in db_session.query(TaxLot).filter_by(status="O"))
+        assert position.cost_basis == open_cost == Decimal("2000.00")
+        assert ReplayEngine(db_session, cache=None).verify() == []
+        
+    def test_lot_tracking_is_off_by_default(self, portfolio, db_session):
+        """Test services without a lot method keep the average-cost behaviour only"""
+        transactions = buys() + [sell(3)]
+        db_session.add_all(transactions)
+        
+        result = PortfolioService(db_session, cache=None, lot_method=None).process_batch(transactions)
+        
+        assert result["success"]
+        assert db_session.query(TaxLot).count() == 0
+            
+    def test_backfill_covers_positions_held_before_tracking(self, portfolio, db_session):
+        """Test sells against untracked shares work after a backfill, and a rerun opens nothing"""
+        transactions = buys()
+        db_session.add_all(transactions)
+        PortfolioService(db_session, cache=None, lot_method=None).process_batch(transactions)
+        transaction = sell(3, quantity="5.0000")
+        db_session.add(transaction)
+        tracked = PortfolioService(db_session, cache=None, lot_method="FIFO")
+        assert not tracked.process_transaction(transaction)["success"]
+        
+        lots = backfill_lots(db_session)
+        db_session.commit()
+        
+        assert [(l.time, l.sequence_no, l.quantity, l.cost_basis) for l in lots] == [
+            (time(0, 0), "000000", Decimal("20.0000"), Decimal("2200.00"))
+        ]
+        transaction = sell(4, quantity="5.0000")
+        db_session.add(transaction)
+        result = PortfolioService(db_session, cache=None, lot_method="FIFO").process_transaction(transaction)
+        assert result["success"]
+        assert [g["gain"] for g in result["realized_gains"]] == [100.0]
+        assert backfill_lots(db_session) == []
+        
+    def test_backfill_tops_up_partly_covered_shares(self, portfolio, db_session):
+        """Test shares bought before tracking get a lot for the shortfall next to the tracked lots"""
+        first, second = buys()
+        db_session.add(first)
+        PortfolioService(db_session, cache=None, lot_method=None).process_batch([first])
+        db_session.add(second)
+        PortfolioService(db_session, cache=None, lot_method="FIFO").process_batch([second])
+        
+        lots = backfill_lots(db_session)
+        db_session.commit()
+        
+        assert [(l.sequence_no, l.quantity, l.cost_basis) for l in lots] == [
+            ("000000", Decimal("10.0000"), Decimal("1000.00"))
+        ]
+        open_lots = db_session.query(TaxLot).filter_by(status="O").order_by(TaxLot.time).all()
+        assert sum(l.remaining_quantity for l in open_lots) == db_session.query(Position).one().quantity
@@ -0,0 +1,206 @@
+import random
+import threading
+import pytest
+from decimal import Decimal
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+from models import Base, History, Portfolio, create_db_engine, history_sequence
+from services import PortfolioService
+from services.locking import PortfolioLockError, lock_portfolios
+from services.replay import ReplayEngine
+from tests.factories import make_portfolio, make_transaction
+
+
+def transfer(seq, source="PORT0001", target="PORT0002", amount="250.00"):
+    transaction = make_transaction(seq, "TR", portfolio_id=source, investment_id=None, quantity=None, price=None,
+                                   amount=Decimal(amount))
+    transaction.target_portfolio_id = target
+    return transaction
+
+
+@pytest.fixture
+def portfolios(db_session):
+    db_session.add(make_portfolio("PORT0001", "1234567890", cash=Decimal("1000.00")))
+    db_session.add(make_portfolio("PORT0002", "2234567890", cash=Decimal("500.00")))
+    db_session.commit()
+    for portfolio in db_session.query(Portfolio):
+        portfolio.update_total_value()
+    db_session.commit()
+
+
+def balances(db_session):
+    return {p.port_id: (p.cash_balance, p.total_value) for p in db_session.query(Portfolio).order_by(Portfolio.port_id)}
+
+
+class TestTransfers:
+    """Test TR transactions moving cash between portfolios"""
+    
+    def test_moves_cash_and_totals(self, portfolios, db_session):
+        """Test the source is debited, the target credited, and both sides audited"""
+        transaction = transfer(1)
+        db_session.add(transaction)
+        
+        result = PortfolioService(db_session, cache=None).process_transaction(transaction)
+        
+        assert result["success"]
+        assert transaction.status == "D"
+        assert balances(db_session) == {
+            "PORT0001": (Decimal("750.00"), Decimal("750.00")), "PORT0002": (Decimal("750.00"), Decimal("750.00"))
+        }
+        audits = db_session.query(History).filter_by(reason_code="XFER").order_by(History.portfolio_id).all()
+        assert [(h.portfolio_id, h.to_dict()["after_data"]["cash_balance"]) for h in audits] == [
+            ("PORT0001", 750.0), ("PORT0002", 750.0)
+        ]
+        
+    def test_batch_applies_transfers_in_order(self, portfolios, db_session):
+        """Test chained transfers in one chunk see each other's balances"""
+        transactions = [transfer(1, amount="1000.00"), transfer(2, "PORT0002", "PORT0001", amount="1500.00"),
+                        transfer(3, amount="1500.01")]
+        db_session.add_all(transactions)
+        
+        results = PortfolioService(db_session, cache=None).process_batch(transactions)
+        
+        assert results["processed"] == 2
+        assert results["errors"][0]["errors"] == ["Insufficient cash for transfer"]
+        assert balances(db_session)["PORT0001"] == (Decimal("1500.00"), Decimal("1500.00"))
+        assert balances(db_session)["PORT0002"] == (Decimal("0.00"), Decimal("0.00"))
+        
+    def test_rejects_bad_transfers_without_effects(self, portfolios, db_session):
+        """Test overdrafts, unknown targets and self-transfers fail and move nothing"""
+        service = PortfolioService(db_session, cache=None)
+        for seq, transaction, error in [(1, transfer(1, amount="1000.01"), "Insufficient cash for transfer"),
+                                        (2, transfer(2, target="PORT0009"), "Portfolio not found"),
+                                        (3, transfer(3, target="PORT0001"), "Transfer target must differ")]:
+            db_session.add(transaction)
+            result = service.process_transaction(transaction)
+            assert not result["success"]
+            assert error in result["errors"][0]
+            
+        assert balances(db_session)["PORT0001"] == (Decimal("1000.00"), Decimal("1000.00"))
+        assert db_session.query(History).filter_by(reason_code="XFER").count() == 0
+        
+    def test_audit_key_collision_is_retried(self, portfolios, db_session, monkeypatch):
+        """Test a transfer whose audit key another process already wrote is retried with a fresh key"""
+        taken = History.build_audit_values("PORT0002", "PT", "C", reason_code="TEST")
+        db_session.execute(History.bulk_insert(), [taken])
+        db_session.commit()
+        allocate = history_sequence.allocate
+        collided = []
+        
+        def colliding(portfolio_id, now=None):
+            if portfolio_id == "PORT0002" and not collided:
+                collided.append(True)
+                return taken["date"], taken["time"], taken["seq_no"]
+            return allocate(portfolio_id, now)
+            
+        monkeypatch.setattr(history_sequence, "allocate", colliding)
+        transaction = transfer(1)
+        db_session.add(transaction)
+        
+        results = PortfolioService(db_session, cache=None).process_batch([transaction])
+        
+        assert collided
+        assert results == {"success": True, "processed": 1, "failed": 0, "errors": []}
+        assert balances(db_session)["PORT0002"] == (Decimal("750.00"), Decimal("750.00"))
+        assert db_session.query(History).filter_by(reason_code="XFER").count() == 2
+        
+    def test_replay_follows_transfers(self, portfolios, db_session):
+        """Test replayed cash includes both legs of a transfer"""
+        engine = ReplayEngine(db_session, cache=None)
+        engine.snapshot()
+        transactions = [transfer(1), transfer(2, "PORT0002", "PORT0001", amount="100.00")]
+        db_session.add_all(transactions)
+        PortfolioService(db_session, cache=None).process_batch(transactions)
+        
+        states = engine.replay()
+        
+        assert states["PORT0001"].cash_balance == Decimal("850.00")
+        assert states["PORT0002"].cash_balance == Decimal("650.00")
+        assert engine.verify() == []
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    """Engine built like the application's: WAL journal, busy timeout and a connection pool"""
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'transfers.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+class TestPortfolioLocking:
+    """Test lock ordering, retry and behaviour under concurrent transfers"""
+    
+    def test_gives_up_after_bounded_retries(self, file_engine, monkeypatch):
+        """Test a writer that never lets go exhausts the retries with PortfolioLockError"""
+        monkeypatch.setattr("services.locking.LOCK_BACKOFF_SECONDS", 0.001)
+        Session = sessionmaker(bind=file_engine)
+        with file_engine.connect() as blocker:
+            blocker.exec_driver_sql("PRAGMA busy_timeout=0")
+            blocker.exec_driver_sql("BEGIN IMMEDIATE")
+            session = Session()
+            session.connection().exec_driver_sql("PRAGMA busy_timeout=0")
+            with pytest.raises(PortfolioLockError):
+                lock_portfolios(session, ["PORT0001"], retries=2)
+            session.close()
+            blocker.exec_driver_sql("ROLLBACK")
+            
+    def test_retry_succeeds_once_the_lock_is_released(self, file_engine, monkeypatch):
+        """Test a conflict that clears within the retry budget is absorbed"""
+        monkeypatch.setattr("services.locking.LOCK_BACKOFF_SECONDS", 0.02)
+        session = sessionmaker(bind=file_engine)()
+        session.add(make_portfolio("PORT0001", "1234567890"))
+        session.commit()
+        with file_engine.connect() as blocker:
+            blocker.exec_driver_sql("BEGIN IMMEDIATE")
+            release = threading.Timer(0.05, blocker.exec_driver_sql, ["ROLLBACK"])
+            release.start()
+            session.connection().exec_driver_sql("PRAGMA busy_timeout=0")
+            
+            locked = lock_portfolios(session, ["PORT0001"], retries=8)
+            
+            release.join()
+        assert list(locked) == ["PORT0001"]
+        session.rollback()
+        session.close()
+        
+    def test_concurrent_random_transfers(self, file_engine):
+        """Test thousands of random transfers on parallel workers conserve cash without lock failures.
+        
+        Throughput is measured by the service.transfer.concurrent benchmarks, not asserted here.
+        """
+        Session = sessionmaker(bind=file_engine)
+        port_ids = [f"PORT{index:04d}" for index in range(10)]
+        with Session() as session:
+            session.add_all(make_portfolio(port_id, f"{index:010d}", cash=Decimal("1000.00"))
+                            for index, port_id in enumerate(port_ids))
+            session.commit()
+            
+        def run(worker: int, count: int, outcomes: list):
+            rng = random.Random(worker)
+            with Session() as session:
+                service = PortfolioService(session, cache=None)
+                for seq in range(count):
+                    source, target = rng.sample(port_ids, 2)
+                    transaction = transfer(worker * 10000 + seq, source, target, amount=f"{rng.randint(1, 300)}.00")
+                    session.add(transaction)
+                    outcomes.append(service.process_transaction(transaction))
+                    
+        outcomes = []
+        threads = [threading.Thread(target=run, args=(worker, 250, outcomes), daemon=True) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(120)
+            
+        assert not any(thread.is_alive() for thread in threads)
+        errors = {error for outcome in outcomes for error in outcome["errors"]}
+        assert len(outcomes) == 2000
+        # A PortfolioLockError would surface here as "Could not lock portfolios ..."
+        assert errors <= {"Insufficient cash for transfer"}
+        
+        with Session() as session:
+            total, lowest = session.query(func.sum(Portfolio.cash_balance), func.min(Portfolio.cash_balance)).one()
+            assert total == Decimal("10000.00")
+            assert lowest >= 0
+            assert all(p.total_value == p.cash_balance for p in session.query(Portfolio))
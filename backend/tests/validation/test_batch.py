@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+from datetime import date
+from decimal import Decimal
+from models import Portfolio, Position, Transaction
+from validation.batch import records_to_columns, validate_columns, validate_records
+
+
+def _messages(result, row):
+    codes = dict(result["errors"]).get(row, [])
+    return [result["codes"][code]["message"] for code in codes]
+
+
+TRANSACTIONS = [
+    {"portfolio_id": "PORT0001", "sequence_no": "000001", "type": "BU", "status": "P",
+     "investment_id": "AAPL000001", "quantity": "10.5", "price": 100},
+    {"portfolio_id": "PORT1", "sequence_no": "1", "type": "XX", "status": "Q"},
+    {"portfolio_id": "PORT0001", "sequence_no": "000003", "type": "SL", "status": "P",
+     "investment_id": None, "quantity": 0, "price": -1},
+    {"portfolio_id": "PORT0001", "sequence_no": "000004", "type": "FE", "status": "P"},
+    {"portfolio_id": None, "sequence_no": "000005", "type": "BU", "status": "D",
+     "investment_id": "", "quantity": None, "price": "abc"},
+    {"portfolio_id": "PORT0001", "sequence_no": "000006", "type": "TR", "status": "P",
+     "target_portfolio_id": "PORT0001"},
+    {"portfolio_id": "PORT0001", "sequence_no": "000007", "type": "TR", "status": "P", "target_portfolio_id": "P2"},
+]
+
+POSITIONS = [
+    {"portfolio_id": "PORT0001", "investment_id": "AAPL000001", "status": "A", "quantity": 5},
+    {"portfolio_id": "PORT01", "investment_id": "AAPL", "status": "X", "quantity": "-1"},
+    {"portfolio_id": "PORT0001", "investment_id": "AAPL000001", "status": "C", "quantity": None},
+]
+
+PORTFOLIOS = [
+    {"port_id": "PORT0001", "account_no": "1234567890", "client_type": "I", "status": "A"},
+    {"port_id": "P1", "account_no": "12", "client_type": "Z", "status": None},
+]
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value)) if value is not None else None
+    except Exception:
+        return None
+
+
+class TestModelParity:
+    """Test batch results match the per-object model validators"""
+    
+    def test_transactions(self):
+        """Test every transaction gets exactly validate_transaction's errors"""
+        result = validate_records("transaction", TRANSACTIONS)
+        
+        for row, record in enumerate(TRANSACTIONS):
+            values = dict(record, quantity=_decimal(record.get("quantity")), price=_decimal(record.get("price")))
+            assert _messages(result, row) == Transaction(**values).validate_transaction()["errors"]
+        assert result["validCount"] == 2
+        
+    def test_positions(self):
+        """Test every position gets exactly validate_position's errors"""
+        result = validate_records("position", POSITIONS)
+        
+        for row, record in enumerate(POSITIONS):
+            values = dict(record, quantity=_decimal(record["quantity"]), date=date(2024, 1, 1))
+            assert _messages(result, row) == Position(**values).validate_position()["errors"]
+            
+    def test_portfolios(self):
+        """Test every portfolio gets exactly validate_portfolio's errors"""
+        result = validate_records("portfolio", PORTFOLIOS)
+        
+        for row, record in enumerate(PORTFOLIOS):
+            assert _messages(result, row) == Portfolio(**record).validate_portfolio()["errors"]
+
+
+class TestValidateColumns:
+    """Test the column-wise validator"""
+    
+    def test_fast_and_fallback_paths_agree(self):
+        """Test all-string columns and mixed columns give the same result"""
+        columns = records_to_columns(TRANSACTIONS * 3)
+        mixed = dict(columns, sequence_no=columns["sequence_no"] + [None], type=columns["type"] + [1],
+                     **{field: values + [None] for field, values in columns.items()
+                        if field not in ("sequence_no", "type")})
+        
+        fast = validate_columns("transaction", columns)
+        slow = validate_columns("transaction", mixed)
+        
+        assert slow["errors"][:-1] == fast["errors"]
+        assert _messages(slow, len(columns["type"])) == [
+            "Portfolio ID must be 8 characters", "Sequence number must be 6 characters",
+            "Invalid transaction type", "Invalid status"
+        ]
+        
+    def test_mixed_decimal_and_string_columns(self):
+        """Test Decimal values in a mixed column are read as numbers, as validate_transaction does"""
+        records = [
+            {"portfolio_id": "PORT0001", "sequence_no": "000001", "type": "BU", "status": "P",
+             "investment_id": "AAPL000001", "quantity": Decimal("10"), "price": "100.5", "amount": Decimal("1005")},
+            {"portfolio_id": "PORT0001", "sequence_no": "000002", "type": "SL", "status": "P",
+             "investment_id": "AAPL000001", "quantity": "abc", "price": Decimal("-1"), "amount": None},
+            {"portfolio_id": "PORT0001", "sequence_no": "000003", "type": "TR", "status": "P",
+             "target_portfolio_id": "PORT0002", "quantity": None, "price": None, "amount": Decimal("250.00")},
+        ]
+        
+        result = validate_records("transaction", records)
+        
+        for row, record in enumerate(records):
+            values = dict(record, quantity=_decimal(record.get("quantity")), price=_decimal(record.get("price")))
+            assert _messages(result, row) == Transaction(**values).validate_transaction()["errors"]
+        assert [row for row, _ in result["errors"]] == [1]
+        
+    def test_array_columns(self):
+        """Test NumPy arrays are accepted as columns"""
+        columns = {"portfolio_id": np.array(["PORT0001", "PORT0001"]), "sequence_no": np.array(["000001", "000002"]),
+                   "type": np.array(["FE", "FE"]), "status": np.array(["P", "P"]), "amount": np.array([5.0, -1e14])}
+        
+        result = validate_columns("transaction", columns)
+        
+        assert [row for row, _ in result["errors"]] == [1]
+        
+    def test_amount_checks(self):
+        """Test amounts follow validate_amount's number and range rules"""
+        columns = {"portfolio_id": ["PORT0001"] * 4, "sequence_no": ["000001"] * 4, "type": ["FE"] * 4,
+                   "status": ["P"] * 4, "amount": [None, "12.50", "ten", 1e14]}
+        
+        result = validate_columns("transaction", columns)
+        
+        assert [row for row, _ in result["errors"]] == [2, 3]
+        assert _messages(result, 2) == ["Amount must be a valid number"]
+        assert _messages(result, 3) == ["Amount must be between -9999999999999.99 and 9999999999999.99"]
+        
+    def test_max_errors_truncates_listing_not_counts(self):
+        """Test max_errors limits listed rows but keeps the full count"""
+        result = validate_records("portfolio", PORTFOLIOS[1:] * 5, max_errors=2)
+        
+        assert result["invalidCount"] == 5
+        assert [row for row, _ in result["errors"]] == [0, 1]
+        assert result["truncated"] is True
+        
+    def test_empty_batch(self):
+        """Test an empty batch is valid"""
+        result = validate_columns("position", {"portfolio_id": []})
+        
+        assert result["total"] == 0
+        assert result["errors"] == []
+        
+    def test_bad_input(self):
+        """Test unknown record types and ragged columns are rejected"""
+        with pytest.raises(ValueError, match="record type"):
+            validate_columns("trade", {})
+        with pytest.raises(ValueError, match="same length"):
+            validate_columns("portfolio", {"port_id": ["PORT0001"], "status": []})
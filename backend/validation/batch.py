@@ -0,0 +1,252 @@
+import numbers
+import re
+import numpy as np
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+MIN_AMOUNT = float(Decimal('-9999999999999.99'))
+MAX_AMOUNT = float(Decimal('9999999999999.99'))
+
+_NUMBER = re.compile(r"\s*[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?\s*")
+
+
+class Rule:
+    """One check applied to whole columns; ``check`` returns a mask of failing rows"""
+    
+    def __init__(self, code: str, field: str, message: str, check):
+        self.code = code
+        self.field = field
+        self.message = message
+        self.check = check
+
+
+class Columns:
+    """Column values plus derived arrays, each computed once per validation call.
+    
+    Homogeneous columns take NumPy fast paths: all-string columns become
+    fixed-width unicode arrays and numeric columns convert to float64 in C.
+    Mixed columns fall back to one Python pass per derived array.
+    """
+    
+    def __init__(self, columns: Dict[str, Sequence], total: int):
+        self.columns = columns
+        self.total = total
+        self._cache: Dict = {}
+        
+    def _cached(self, key, compute) -> np.ndarray:
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+        
+    def values(self, field: str) -> Sequence:
+        column = self.columns.get(field)
+        return [None] * self.total if column is None else column
+        
+    def _strings(self, field: str) -> Optional[np.ndarray]:
+        """The column as a unicode array, or None if it holds anything but strings"""
+        def compute():
+            column = self.values(field)
+            array = np.asarray(column) if self.total else np.array([], dtype=str)
+            return array if array.dtype.kind == "U" else None
+        return self._cached(("strings", field), compute)
+        
+    def lengths(self, field: str) -> np.ndarray:
+        """Length of each value, or -1 where it is not a string"""
+        def compute():
+            strings = self._strings(field)
+            if strings is not None:
+                return np.strings.str_len(strings) if hasattr(np, "strings") else np.char.str_len(strings)
+            return np.fromiter((len(value) if isinstance(value, str) else -1 for value in self.values(field)),
+                               dtype=np.int64, count=self.total)
+        return self._cached(("lengths", field), compute)
+        
+    def member(self, field: str, allowed: frozenset) -> np.ndarray:
+        def compute():
+            strings = self._strings(field)
+            if strings is not None:
+                return np.isin(strings, list(allowed))
+            return np.fromiter((isinstance(value, str) and value in allowed for value in self.values(field)),
+                               dtype=bool, count=self.total)
+        return self._cached(("member", field, allowed), compute)
+        
+    def numbers(self, field: str) -> np.ndarray:
+        """Values as float64; NaN where missing or not a number"""
+        def compute():
+            column = self.values(field)
+            try:
+                return np.asarray(column, dtype=np.float64).reshape(self.total)
+            except (TypeError, ValueError):
+                return np.fromiter((_to_float(value) for value in column), dtype=np.float64, count=self.total)
+        return self._cached(("numbers", field), compute)
+        
+    def present(self, field: str) -> np.ndarray:
+        return self._cached(("present", field), lambda: np.fromiter(
+            (value is not None for value in self.values(field)), dtype=bool, count=self.total))
+            
+    def truthy(self, field: str) -> np.ndarray:
+        def compute():
+            strings = self._strings(field)
+            if strings is not None:
+                return self.lengths(field) > 0
+            return np.fromiter((bool(value) for value in self.values(field)), dtype=bool, count=self.total)
+        return self._cached(("truthy", field), compute)
+
+
+def _to_float(value) -> float:
+    if isinstance(value, numbers.Number) and not isinstance(value, bool):
+        try:
+            return float(value)
+        except TypeError:
+            # complex
+            return np.nan
+    if isinstance(value, str) and _NUMBER.fullmatch(value):
+        return float(value)
+    return np.nan
+
+
+def _length_is_not(field: str, length: int):
+    return lambda columns: columns.lengths(field) != length
+
+
+def _not_in(field: str, allowed):
+    allowed = frozenset(allowed)
+    return lambda columns: ~columns.member(field, allowed)
+
+
+BUY_SELL = frozenset(("BU", "SL"))
+TRANSFER = frozenset(("TR",))
+
+
+def _negative(field: str):
+    # Position.validate_position only rejects a present, negative quantity
+    return lambda columns: columns.numbers(field) < 0
+
+
+def _buy_sell_not_positive(field: str):
+    return lambda columns: columns.member("type", BUY_SELL) & ~(columns.numbers(field) > 0)
+
+
+def _buy_sell_missing(field: str):
+    return lambda columns: columns.member("type", BUY_SELL) & ~columns.truthy(field)
+
+
+def _transfer_target_invalid(columns: Columns) -> np.ndarray:
+    return columns.member("type", TRANSFER) & (columns.lengths("target_portfolio_id") != 8)
+
+
+def _transfer_to_self(columns: Columns) -> np.ndarray:
+    same = np.fromiter((target == source for source, target in zip(columns.values("portfolio_id"),
+                                                                   columns.values("target_portfolio_id"))),
+                       dtype=bool, count=columns.total)
+    return columns.member("type", TRANSFER) & (columns.lengths("target_portfolio_id") == 8) & same
+
+
+def _transfer_amount_not_positive(columns: Columns) -> np.ndarray:
+    return columns.member("type", TRANSFER) & ~(columns.numbers("amount") > 0)
+
+
+def _amount_not_number(columns: Columns) -> np.ndarray:
+    return columns.present("amount") & np.isnan(columns.numbers("amount"))
+
+
+def _amount_out_of_range(columns: Columns) -> np.ndarray:
+    amounts = columns.numbers("amount")
+    return (amounts < MIN_AMOUNT) | (amounts > MAX_AMOUNT)
+
+
+RULES: Dict[str, List[Rule]] = {
+    "portfolio": [
+        Rule("PORT_ID_LENGTH", "port_id", "Portfolio ID must be 8 characters", _length_is_not("port_id", 8)),
+        Rule("ACCOUNT_NO_LENGTH", "account_no", "Account number must be 10 characters",
+             _length_is_not("account_no", 10)),
+        Rule("CLIENT_TYPE", "client_type", "Invalid client type", _not_in("client_type", ("I", "C", "T"))),
+        Rule("STATUS", "status", "Invalid status", _not_in("status", ("A", "C", "S")))
+    ],
+    "position": [
+        Rule("PORTFOLIO_ID_LENGTH", "portfolio_id", "Portfolio ID must be 8 characters",
+             _length_is_not("portfolio_id", 8)),
+        Rule("INVESTMENT_ID_LENGTH", "investment_id", "Investment ID must be 10 characters",
+             _length_is_not("investment_id", 10)),
+        Rule("STATUS", "status", "Invalid status", _not_in("status", ("A", "C", "P"))),
+        Rule("QUANTITY_NEGATIVE", "quantity", "Quantity cannot be negative", _negative("quantity"))
+    ],
+    "transaction": [
+        Rule("PORTFOLIO_ID_LENGTH", "portfolio_id", "Portfolio ID must be 8 characters",
+             _length_is_not("portfolio_id", 8)),
+        Rule("SEQUENCE_NO_LENGTH", "sequence_no", "Sequence number must be 6 characters",
+             _length_is_not("sequence_no", 6)),
+        Rule("TYPE", "type", "Invalid transaction type", _not_in("type", ("BU", "SL", "TR", "FE"))),
+        Rule("STATUS", "status", "Invalid status", _not_in("status", ("P", "D", "F", "R"))),
+        Rule("INVESTMENT_ID_REQUIRED", "investment_id", "Investment ID required for buy/sell transactions",
+             _buy_sell_missing("investment_id")),
+        Rule("QUANTITY_NOT_POSITIVE", "quantity", "Positive quantity required for buy/sell transactions",
+             _buy_sell_not_positive("quantity")),
+        Rule("PRICE_NOT_POSITIVE", "price", "Positive price required for buy/sell transactions",
+             _buy_sell_not_positive("price")),
+        Rule("TARGET_PORTFOLIO_ID_LENGTH", "target_portfolio_id",
+             "Target portfolio ID must be 8 characters for transfers", _transfer_target_invalid),
+        Rule("TARGET_PORTFOLIO_ID_SAME", "target_portfolio_id", "Transfer target must differ from the source portfolio",
+             _transfer_to_self),
+        Rule("TRANSFER_AMOUNT_NOT_POSITIVE", "amount", "Positive amount required for transfers",
+             _transfer_amount_not_positive),
+        Rule("AMOUNT_NOT_NUMBER", "amount", "Amount must be a valid number", _amount_not_number),
+        Rule("AMOUNT_RANGE", "amount", f"Amount must be between {Decimal('-9999999999999.99')} and "
+             f"{Decimal('9999999999999.99')}", _amount_out_of_range)
+    ]
+}
+
+
+def records_to_columns(records: Sequence[Dict]) -> Dict[str, List]:
+    """Turn row dictionaries into the column form ``validate_columns`` expects"""
+    fields = {field for record in records for field in record}
+    return {field: [record.get(field) for record in records] for field in fields}
+
+
+def validate_columns(record_type: str, columns: Dict[str, Sequence], max_errors: Optional[int] = None) -> Dict:
+    """Validate whole columns of records against the model rules for ``record_type``.
+    
+    ``columns`` maps field names to equally long sequences; missing fields
+    are treated as all-null. The checks and messages match
+    ``Portfolio.validate_portfolio``, ``Position.validate_position`` and
+    ``Transaction.validate_transaction``. Transactions with an ``amount``
+    are also checked against the amount range of ``validate_amount``.
+    
+    The result lists ``codes`` once and then one ``[row, [code index, ...]]``
+    pair per failing row, in row order. With ``max_errors``, only that many
+    failing rows are listed and ``truncated`` is set; the counts are always complete.
+    """
+    rules = RULES.get(record_type)
+    if rules is None:
+        raise ValueError(f"record type must be one of: {', '.join(sorted(RULES))}")
+    lengths = {len(column) for column in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError("all columns must have the same length")
+    total = lengths.pop() if lengths else 0
+    
+    view = Columns(columns, total)
+    failures = np.zeros((len(rules), total), dtype=bool)
+    for index, rule in enumerate(rules):
+        failures[index] = rule.check(view)
+        
+    invalid_rows = np.flatnonzero(failures.any(axis=0))
+    listed = invalid_rows if max_errors is None else invalid_rows[:max_errors]
+    # Row-major nonzero keeps each row's codes together and in rule order
+    rows, codes = np.nonzero(failures[:, listed].T)
+    bounds = np.searchsorted(rows, np.arange(len(listed) + 1)).tolist()
+    codes = codes.tolist()
+    errors = [[row, codes[bounds[index]:bounds[index + 1]]] for index, row in enumerate(listed.tolist())]
+    
+    return {
+        "recordType": record_type,
+        "total": total,
+        "validCount": total - len(invalid_rows),
+        "invalidCount": len(invalid_rows),
+        "codes": [{"code": rule.code, "field": rule.field, "message": rule.message} for rule in rules],
+        "errors": errors,
+        "truncated": len(listed) < len(invalid_rows)
+    }
+
+
+def validate_records(record_type: str, records: Sequence[Dict], max_errors: Optional[int] = None) -> Dict:
+    """``validate_columns`` for a list of row dictionaries"""
+    return validate_columns(record_type, records_to_columns(records), max_errors)